@@ -32,11 +32,41 @@ def get_benchmark(config):
         else:
             raise KeyError('Distribution type ' + config['distribution'] + ' is not currently implemented.')
 
+    def _prepare_statements(client):
+        """
+        Prepare every statement of the benchmark once per client, the operations only bind the keys
+        :return: a dictionary of the form {operation name: Statement}
+        """
+        table1 = schema.table1
+        id_is_key = BinaryOperation(table1['id'], Parameter('id'), '==')
+        ge = BinaryOperation(table1['id'], Parameter('lower'), '>=')
+        le = BinaryOperation(table1['id'], Parameter('upper'), '<=')
+        in_range = BinaryOperation(ge, le, 'and')
+
+        return {
+            'point': client.prepare_select([table1], table1.columns, id_is_key),
+            'range': client.prepare_select([table1], [table1['c']], in_range),
+            'range_sum': client.prepare_select([table1], [UnaryOperation(table1['k'], 'sum')], in_range),
+            'range_order': client.prepare_select([table1], [table1['c']], in_range, order_by=[table1['c']]),
+            'range_distinct': client.prepare_select([table1], [table1['c']], in_range, order_by=[table1['c']],
+                                                    distinct=True),
+            'update_index': client.prepare_update(
+                table1, [BinaryOperation(table1['k'], BinaryOperation(table1['k'], 1, '+'), '=')], id_is_key),
+            'update_non_index': client.prepare_update(table1, [BinaryOperation(table1['c'], '~' * 120, '=')],
+                                                      id_is_key),
+            'delete': client.prepare_delete_rows(table1, id_is_key),
+            'insert': client.prepare_insert(table1, (Parameter('id'),
+                                                     0,
+                                                     ' ',
+                                                     'aaaaaaaaaaffffffffffrrrrrrrrrreeeeeeeeeeyyyyyyyyyy'))
+        }
+
     class sysbench(Task):
         report_stats = False
 
         def on_start(self):
             self.set_client(load_interface(config['interface']['id'], config['interface']['data']))
+            self.statements = _prepare_statements(self.client)
 
         def on_end(self):
             self.client.close()
@@ -45,6 +75,8 @@ def get_benchmark(config):
             weight = 1
 
             def on_start(self):
+                self.statements = self.parent.statements
+
                 try:
                     self.client.start_transaction()
                 except SQLException as e:
@@ -75,10 +107,8 @@ def get_benchmark(config):
             class point(Tasklet):
                 weight = 1
                 def operation(self):
-                    where = BinaryOperation(schema.table1['id'], _get_random_key(), '==')
-
                     try:
-                        self.client.select([schema.table1], schema.table1.columns, where)
+                        self.client.execute(self.parent.statements['point'], {'id': _get_random_key()})
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -93,13 +123,10 @@ def get_benchmark(config):
                 weight = 0
                 def operation(self):
                     lower_bound = _get_random_key()
-                    upper_bound = lower_bound + config['range_size']
-                    ge = BinaryOperation(schema.table1['id'], lower_bound, '>=')
-                    le = BinaryOperation(schema.table1['id'], upper_bound, '<=')
-                    where = BinaryOperation(ge, le, 'and')
+                    bounds = {'lower': lower_bound, 'upper': lower_bound + config['range_size']}
 
                     try:
-                        self.client.select([schema.table1], [schema.table1['c']], where)
+                        self.client.execute(self.parent.statements['range'], bounds)
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -114,14 +141,10 @@ def get_benchmark(config):
                 weight = 0
                 def operation(self):
                     lower_bound = _get_random_key()
-                    upper_bound = lower_bound + config['range_size']
-                    ge = BinaryOperation(schema.table1['id'], lower_bound, '>=')
-                    le = BinaryOperation(schema.table1['id'], upper_bound, '<=')
-                    where = BinaryOperation(ge, le, 'and')
-                    sum_col = UnaryOperation(schema.table1['k'], 'sum')
+                    bounds = {'lower': lower_bound, 'upper': lower_bound + config['range_size']}
 
                     try:
-                        self.client.select([schema.table1], [sum_col], where)
+                        self.client.execute(self.parent.statements['range_sum'], bounds)
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -136,13 +159,10 @@ def get_benchmark(config):
                 weight = 0
                 def operation(self):
                     lower_bound = _get_random_key()
-                    upper_bound = lower_bound + config['range_size']
-                    ge = BinaryOperation(schema.table1['id'], lower_bound, '>=')
-                    le = BinaryOperation(schema.table1['id'], upper_bound, '<=')
-                    where = BinaryOperation(ge, le, 'and')
+                    bounds = {'lower': lower_bound, 'upper': lower_bound + config['range_size']}
 
                     try:
-                        self.client.select([schema.table1], [schema.table1['c']], where, order_by=[schema.table1['c']])
+                        self.client.execute(self.parent.statements['range_order'], bounds)
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -157,17 +177,10 @@ def get_benchmark(config):
                 weight = 0
                 def operation(self):
                     lower_bound = _get_random_key()
-                    upper_bound = lower_bound + config['range_size']
-                    ge = BinaryOperation(schema.table1['id'], lower_bound, '>=')
-                    le = BinaryOperation(schema.table1['id'], upper_bound, '<=')
-                    where = BinaryOperation(ge, le, 'and')
+                    bounds = {'lower': lower_bound, 'upper': lower_bound + config['range_size']}
 
                     try:
-                        self.client.select([schema.table1],
-                                           [schema.table1['c']],
-                                           where,
-                                           order_by=[schema.table1['c']],
-                                           distinct=True)
+                        self.client.execute(self.parent.statements['range_distinct'], bounds)
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -181,12 +194,8 @@ def get_benchmark(config):
             class update_index(Tasklet):
                 weight = 0
                 def operation(self):
-                    k_plus_1 = BinaryOperation(schema.table1['k'], 1, '+')
-                    set_statement = BinaryOperation(schema.table1['k'], k_plus_1, '=')
-                    where = BinaryOperation(schema.table1['id'], _get_random_key(), '==')
-
                     try:
-                        self.client.update(schema.table1, [set_statement], where)
+                        self.client.execute(self.parent.statements['update_index'], {'id': _get_random_key()})
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -199,13 +208,9 @@ def get_benchmark(config):
 
             class update_non_index(Tasklet):
                 weight = 0
-                filler = '~' * 120
                 def operation(self):
-                    set_statement = BinaryOperation(schema.table1['c'], self.filler, '=')
-                    where = BinaryOperation(schema.table1['id'], _get_random_key(), '==')
-
                     try:
-                        self.client.update(schema.table1, [set_statement], where)
+                        self.client.execute(self.parent.statements['update_non_index'], {'id': _get_random_key()})
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -220,10 +225,9 @@ def get_benchmark(config):
                 weight = 0
                 def operation(self):
                     self.parent.reinsertion_index = _get_random_key()
-                    where = BinaryOperation(schema.table1['id'], self.parent.reinsertion_index, '==')
 
                     try:
-                        self.client.delete_rows(schema.table1, where)
+                        self.client.execute(self.parent.statements['delete'], {'id': self.parent.reinsertion_index})
                     except SQLException as e:
                         self.fail(1)
                         return
@@ -236,13 +240,8 @@ def get_benchmark(config):
             class insert(Tasklet):
                 weight = 0
                 def operation(self):
-                    values = (self.parent.reinsertion_index,
-                              0,
-                              ' ',
-                              'aaaaaaaaaaffffffffffrrrrrrrrrreeeeeeeeeeyyyyyyyyyy')
-
                     try:
-                        self.client.insert(schema.table1, values)
+                        self.client.execute(self.parent.statements['insert'], {'id': self.parent.reinsertion_index})
                     except SQLException as e:
                         self.fail(1)
                         return
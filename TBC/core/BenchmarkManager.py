@@ -1,31 +1,123 @@
 import signal
 import os
 import multiprocessing
-import time
 import Queue
 import sys
 import logging
+import threading
 
 from TBC.core.TaskManager import TaskManager
 from TBC.core.IProcMessage import IProcMessage
+from TBC.core.RingBuffer import RingBuffer
+from TBC.core.StatsAggregator import StatsAggregator
+from TBC.core.Phases import scale_rates
+from TBC.core.Profiler import merge_samples
 from TBC.core.Log import *
+from TBC.utility import Clock
+from TBC.utility.Clock import now
 
 class BenchmarkManager(object):
     """
     This class is responsible for spinning up, spinning down, and coordinating TaskManagers on a single node
     """
 
-    def __init__(self, log_framerate, log_latency_bin_size):
+    def __init__(self, log_framerate, log_latency_significant_digits, log_report_rate=4, transport='queue',
+                 transport_buffer_size=65536, compile_tasks=True, clients_per_process=1,
+                 client_mode='thread', target_rate=None, arrival='constant', stream_callback=None,
+                 stream_period=1.0, start_time=None, clock_offset=0.0, phases=None, pool=None,
+                 profile_interval=None, time_client_calls=True, count_results=True):
+        """
+        :param log_framerate: the number of log frames per second
+        :param log_latency_significant_digits: the number of significant digits kept by the latency histograms
+        :param log_report_rate: the number of times per second that each TaskManager sends statistics
+        :param transport: how statistics are sent from TaskManagers.  'queue' sends pre-aggregated batches over a
+                            multiprocessing.Queue, 'shm' writes every operation into a shared memory RingBuffer.
+        :param transport_buffer_size: the number of records in each RingBuffer (only used by the 'shm' transport)
+        :param compile_tasks: if True then TaskManagers compile their task trees before running them
+        :param clients_per_process: the number of clients that each TaskManager runs
+        :param client_mode: how a TaskManager runs multiple clients (see TaskManager)
+        :param target_rate: if not None, the number of operations per second that this node should start.  The
+                                rate is split evenly between all clients of all TaskManagers.
+        :param arrival: the distribution of operation start times when target_rate is set ('constant' or 'poisson')
+        :param stream_callback: if not None, a function that is periodically called with a LogChunk containing the
+                                    frames of the log that are sealed while the benchmark is running
+        :param stream_period: the number of seconds between calls to stream_callback
+        :param start_time: if not None, the time at which all TaskManagers start running and the first log frame
+                                starts (in the master's clock).  This should be a multiple of the frame period.
+        :param clock_offset: the difference between this node's clock and the master's clock, in seconds
+        :param phases: if not None, a list of phases (see Phases) with the target rates of this node
+        :param pool: if not None, a WorkerPool whose workers run the TaskManagers instead of new processes
+        :param profile_interval: if not None, the TaskManagers profile their clients with a sampling profiler that
+                                    takes a sample this often (in seconds)
+        :param time_client_calls: if True then the TaskManagers measure the time that their clients spend inside of
+                                    interface calls
+        :param count_results: if True then the TaskManagers count the rows and bytes of the results that their
+                                clients read
+        """
 
         self.alive = True
+        # the RingBuffers can not signal new records, so they are polled this often while waiting for messages
         self.rate_limit = 0.01
+        # the longest time that is spent waiting for the processes to stop before they are terminated
         self.soft_stop_timeout = 2
+        # the longest time that the main loop blocks while waiting for a message
+        self.max_wait = 1.0
         self.log_framerate = log_framerate
-        self.log_latency_bin_size = log_latency_bin_size
+        self.log_latency_significant_digits = log_latency_significant_digits
+        self.log_report_rate = log_report_rate
+
+        if transport not in ('queue', 'shm'):
+            raise Exception('Unknown transport ' + str(transport))
+        self.transport = transport
+        self.transport_buffer_size = transport_buffer_size
+        self.compile_tasks = compile_tasks
+        self.clients_per_process = clients_per_process
+        self.client_mode = client_mode
+        self.target_rate = target_rate
+        self.arrival = arrival
+
+        self.start_time = start_time
+        self.clock_offset = clock_offset
+        self.phases = phases
+        self.profile_interval = profile_interval
+        self.time_client_calls = time_client_calls
+        self.count_results = count_results
+
+        # the merged samples of the profilers of all TaskManagers, {collapsed stack: number of samples}
+        self.profile = {}
+
+        self.stream_callback = stream_callback
+        self.stream_period = stream_period
+        self.last_stream_time = None
+
+        # a frame is sealed once batches for it are no longer expected to arrive
+        self.seal_delay = 2.0 / log_report_rate
+
+        # protects the log from being streamed while it is being finished
+        self.log_lock = threading.Lock()
+
+        self.pool = pool
 
         # (Process, in_queue, out_queue)
-        # the process pulls things from the in_queue and puts things into the out_queue
+        # the process pulls things from the in_queue and puts things into the out_queue.  All processes share one
+        # out_queue so that the main loop can block on it.
         self.processes = []
+        self.out_queue = pool.out_queue if pool is not None else multiprocessing.Queue()
+
+        # (BenchmarkReference, the keyword arguments of the TaskManagers) if the processes are pooled workers
+        self.pool_run = None
+
+        # the number of processes that acknowledged that they stopped
+        self.stopped_processes = 0
+
+        # held while messages are taken from the out_queue, close() takes it over from the main loop
+        self.queue_lock = threading.RLock()
+
+        # (RingBuffer, list of event names indexed by event id), only used by the 'shm' transport
+        self.rings = []
+        self.ring_stats = None
+        if self.transport == 'shm':
+            self.ring_stats = StatsAggregator(log_framerate, log_latency_significant_digits, log_report_rate)
 
         self.benchmark_log = None
         self.logger = logging.getLogger()
@@ -33,36 +125,93 @@ class BenchmarkManager(object):
     def prepare(self, task, number):
         """
         Setup a process but don't start it yet
-        :param task: the task that the process will run
+        :param task: the task that the process will run, or a BenchmarkReference if the processes are pooled
         :param number: how many processes to spawn
         """
+        client_rate = None
+        if self.target_rate is not None:
+            client_rate = float(self.target_rate) / (number * self.clients_per_process)
+        process_phases = None
+        if self.phases is not None:
+            process_phases = scale_rates(self.phases, 1.0 / number)
+
+        task_manager_args = {'log_framerate': self.log_framerate,
+                             'log_latency_significant_digits': self.log_latency_significant_digits,
+                             'report_rate': self.log_report_rate,
+                             'compile_tasks': self.compile_tasks,
+                             'clients': self.clients_per_process,
+                             'client_mode': self.client_mode,
+                             'target_rate': client_rate,
+                             'arrival': self.arrival,
+                             'start_time': self.start_time,
+                             'phases': process_phases,
+                             'profile_interval': self.profile_interval,
+                             'time_client_calls': self.time_client_calls,
+                             'count_results': self.count_results}
+
+        if self.pool is not None:
+            ring_capacity = self.transport_buffer_size if self.transport == 'shm' else None
+            workers = self.pool.reserve(number, ring_capacity)
+            # reserving may replace the workers along with their queue
+            self.out_queue = self.pool.out_queue
+            events = None
+            if ring_capacity is not None:
+                events = TaskManager.gather_events(task.get_task()(None, []))
+            for proc, in_queue, ring in workers:
+                self.processes.append((proc, in_queue, self.out_queue))
+                if ring_capacity is not None:
+                    self.rings.append((ring, events))
+            self.pool_run = (task, task_manager_args)
+            return
+
         for pnum in range(number):
             in_queue = multiprocessing.Queue()
-            out_queue = multiprocessing.Queue()
-            tm = TaskManager(in_queue, out_queue, task)
+            out_queue = self.out_queue
+            ring = None
+            if self.transport == 'shm':
+                ring = RingBuffer(self.transport_buffer_size)
+            tm = TaskManager(in_queue, out_queue, task, ring=ring, **task_manager_args)
             proc = multiprocessing.Process(target=tm.start)
             self.processes.append((proc, in_queue, out_queue))
+            if ring is not None:
+                self.rings.append((ring, tm.events))
 
     def start(self):
         """
         Start all processes.  Warning: this should not be called if some processes have already
         been started.
         """
-        self.benchmark_log = Logger(self.log_framerate, self.log_latency_bin_size)
+        # anchor before forking so that every process places events into the same frames.  Shifting the clock by
+        # the offset to the master's clock aligns the frames of every node.
+        Clock.anchor(self.clock_offset)
+        if self.start_time is not None and self.start_time < now():
+            self.logger.warning('Start time is %f seconds in the past', now() - self.start_time)
+        self.benchmark_log = Logger(self.log_framerate, self.log_latency_significant_digits, self.start_time)
+        overhead, resolution = Clock.calibrate()
+        self.benchmark_log.set_timer_info(Clock.clock_name, overhead, resolution)
 
-        for proc, in_queue, out_queue in self.processes:
-            proc.start()
+        if self.pool is not None:
+            task, task_manager_args = self.pool_run
+            self.pool.run(len(self.processes), task, self.clock_offset, len(self.rings) > 0, task_manager_args)
+        else:
+            for proc, in_queue, out_queue in self.processes:
+                proc.start()
         self.main_loop()
 
     def close(self, soft=True):
         self.alive = False
+        # wake up the main loop so that it lets go of the out_queue
+        self.out_queue.put(IProcMessage('wake', None))
+        with self.queue_lock:
+            if soft:
+                self.soft_stop()
+                self.wait_for_processes(now() + self.soft_stop_timeout)
+            self.hard_stop()
         if soft:
-            self.soft_stop()
-            time.sleep(self.soft_stop_timeout)
-            self.check_for_messages()
-        self.hard_stop()
-        if soft:
-            self.benchmark_log.finish()
+            with self.log_lock:
+                self.benchmark_log.finish()
+        # stop following the master's clock until the next run is anchored
+        Clock.anchor()
 
     def soft_stop(self):
         """
@@ -71,11 +220,33 @@ class BenchmarkManager(object):
         m = IProcMessage('stop', None)
         for proc, in_queue, out_queue in self.processes:
             in_queue.put(m)
+        for ring, events in self.rings:
+            ring.request_stop()
+
+    def wait_for_processes(self, deadline):
+        """
+        Handle messages until every process has acknowledged that it stopped
+        :param deadline: the time at which to give up waiting
+        """
+        while self.stopped_processes < len(self.processes):
+            remaining = deadline - now()
+            if remaining <= 0:
+                self.logger.warning('%d processes did not stop within %s seconds',
+                                    len(self.processes) - self.stopped_processes, self.soft_stop_timeout)
+                break
+            self.check_for_messages(remaining)
+        # records that were written to the RingBuffers before the processes stopped
+        self.drain_rings()
 
     def hard_stop(self):
         """
         Force all processes to immediately stop
         """
+        if self.pool is not None:
+            # pooled workers that acknowledged the stop are kept for the next run
+            if self.stopped_processes < len(self.processes):
+                self.pool.terminate()
+            return
         for proc, in_queue, out_queue in self.processes:
             try:
                 proc.terminate()
@@ -83,9 +254,18 @@ class BenchmarkManager(object):
                 pass
 
     def handle_message(self, message):
-        if message.type == 'report':
-            event, delta_t, failed = message.payload
-            self.benchmark_log.log(event, delta_t, failed)
+        if message.type == 'stats':
+            timestamp, events, counters = message.payload
+            self.benchmark_log.log_batch(timestamp, events, counters)
+
+        elif message.type == 'stopped':
+            self.stopped_processes += 1
+
+        elif message.type == 'profile':
+            merge_samples(self.profile, message.payload)
+
+        elif message.type == 'wake':
+            pass
 
         elif message.type == 'err':
             self.close()
@@ -96,24 +276,88 @@ class BenchmarkManager(object):
             self.close()
             exit(-1)
 
-    def check_for_messages(self):
+    def drain_rings(self):
         """
-        Check all of the queues for messages
-        :return: True if at least one message received, otherwise False
+        Move all records in the RingBuffers into the log
+        :return: True if at least one record was received, otherwise False
         """
         work_done = False
-        for proc, in_queue, out_queue in self.processes:
+        stats = self.ring_stats
+        log_batch = self.benchmark_log.log_batch
+        for ring, event_names in self.rings:
+            values = ring.drain()
+            if len(values) == 0:
+                continue
+            work_done = True
+
+            # file every record by the time at which its operation ended, a batch must not span a frame boundary
+            for index in xrange(0, len(values), 4):
+                end_time = values[index + 2]
+                if end_time >= stats.deadline:
+                    log_batch(*stats.flush())
+                stats.record(event_names[values[index]], values[index + 1], values[index + 3], end_time)
+
+            log_batch(*stats.flush())
+        return work_done
+
+    def check_for_messages(self, timeout=0.0):
+        """
+        Check the out_queue (and RingBuffers) for messages
+        :param timeout: the longest time to block while waiting for the first message
+        :return: True if at least one message received, otherwise False
+        """
+        work_done = self.drain_rings()
+        if work_done:
+            timeout = 0.0
+        elif len(self.rings) > 0:
+            timeout = min(timeout, self.rate_limit)
+
+        try:
+            message = self.out_queue.get(timeout > 0, timeout)
             while True:
-                try:
-                    message = out_queue.get(block=False)
-                    work_done = True
-                    self.handle_message(message)
-                except Queue.Empty:
-                    break
+                work_done = True
+                self.handle_message(message)
+                message = self.out_queue.get(block=False)
+        except Queue.Empty:
+            pass
         return work_done
 
+    def stream_frames(self):
+        """
+        Send the sealed frames of the log to the stream callback
+        """
+        with self.log_lock:
+            if not self.alive:
+                return
+            chunk = self.benchmark_log.take_chunk(now() - self.seal_delay)
+        self.stream_callback(chunk)
+
+    def take_final_chunk(self):
+        """
+        Remove everything that was not streamed yet from the log.  Should only be called after close().
+        :return: a LogChunk that contains information about the clock and the CPUs that were used and the
+                    profiler's samples
+        """
+        with self.log_lock:
+            chunk = self.benchmark_log.take_chunk()
+        chunk.timer = self.benchmark_log.timer
+        chunk.timer_overhead = self.benchmark_log.timer_overhead
+        chunk.timer_resolution = self.benchmark_log.timer_resolution
+        chunk.cpu_count = multiprocessing.cpu_count()
+        chunk.profile = self.profile
+        return chunk
+
     def main_loop(self):
+        self.last_stream_time = now()
         while self.alive:
-            work_done = self.check_for_messages()
-            if not work_done:
-                time.sleep(self.rate_limit)
+            # block until a message arrives or the next chunk of frames is due
+            timeout = self.max_wait
+            if self.stream_callback is not None:
+                timeout = min(timeout, max(0.0, self.last_stream_time + self.stream_period - now()))
+            with self.queue_lock:
+                if not self.alive:
+                    break
+                self.check_for_messages(timeout)
+            if self.stream_callback is not None and now() - self.last_stream_time >= self.stream_period:
+                self.last_stream_time = now()
+                self.stream_frames()
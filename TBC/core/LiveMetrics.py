@@ -0,0 +1,171 @@
+import collections
+import threading
+
+from TBC.utility.Histogram import shared_histogram
+
+# the latency percentiles that are reported, (label, percentile)
+LIVE_PERCENTILES = [('0.5', 0.5), ('0.9', 0.9), ('0.99', 0.99), ('0.999', 0.999)]
+
+
+class LiveMetrics(object):
+    """
+    Keeps the most recent frames that were streamed by each node so that the state of a running benchmark can be
+    exported in the Prometheus / OpenMetrics text format.  Counters cover the entire run, all other metrics are
+    computed over a sliding window of frames.
+    """
+
+    def __init__(self, framerate, latency_significant_digits, window=10.0):
+        """
+        :param framerate: the number of frames per second of the nodes' logs
+        :param latency_significant_digits: the significant digits of the latency histograms
+        :param window: the number of seconds of frames that are used for throughput, latency and failure rate
+        """
+        self.frame_period = 1.0 / framerate
+        self.histogram = shared_histogram(latency_significant_digits)
+        self.window = window
+
+        # (node, event) -> deque of (frame start time, num, failed, total_time, {histogram index: count})
+        self.recent = {}
+
+        # (node, event) -> [num, failed] over the entire run
+        self.totals = {}
+
+        # the start time of the most recent frame received from any node
+        self.latest_time = None
+
+        self.lock = threading.Lock()
+
+    def add_frames(self, node, frames):
+        """
+        :param node: the name of the node that sent the frames
+        :param frames: a list of processed LogFrames
+        """
+        with self.lock:
+            for frame in frames:
+                if self.latest_time is None or frame.start_time > self.latest_time:
+                    self.latest_time = frame.start_time
+                for event in frame.events:
+                    e_info = frame.events[event]
+                    key = (node, event)
+                    if key not in self.recent:
+                        self.recent[key] = collections.deque()
+                        self.totals[key] = [0, 0]
+                    self.recent[key].append((frame.start_time, e_info.num, e_info.failed, e_info.total_time,
+                                             e_info.latency_bins))
+                    self.totals[key][0] += e_info.num
+                    self.totals[key][1] += e_info.failed
+            self._trim()
+
+    def _trim(self):
+        """
+        Forget frames that are older than the window
+        """
+        if self.latest_time is None:
+            return
+        oldest = self.latest_time - self.window
+        for frames in self.recent.itervalues():
+            while len(frames) > 0 and frames[0][0] <= oldest:
+                frames.popleft()
+
+    def render(self, openmetrics=True):
+        """
+        :param openmetrics: if True then use the OpenMetrics format, otherwise the Prometheus text format
+        :return: a string with the current metrics
+        """
+        with self.lock:
+            return self._render(openmetrics)
+
+    def _render(self, openmetrics):
+        # event -> [num, failed, total_time] over the window
+        events = {}
+        # event -> {histogram index: count} over the window
+        latency_bins = {}
+        # (node, event) -> num over the window
+        node_nums = {}
+        for (node, event), frames in self.recent.iteritems():
+            if event not in events:
+                events[event] = [0, 0, 0.0]
+                latency_bins[event] = {}
+            summary = events[event]
+            merged = latency_bins[event]
+            node_nums[(node, event)] = 0
+            for start_time, num, failed, total_time, bins in frames:
+                summary[0] += num
+                summary[1] += failed
+                summary[2] += total_time
+                for latency_bin in bins:
+                    merged[latency_bin] = merged.get(latency_bin, 0) + bins[latency_bin]
+                node_nums[(node, event)] += num
+
+        # the window may not be full yet at the beginning of the run
+        window = self.window
+        if self.latest_time is not None:
+            oldest = min([frames[0][0] for frames in self.recent.itervalues() if len(frames) > 0] or
+                         [self.latest_time])
+            window = min(window, self.latest_time - oldest + self.frame_period)
+
+        lines = []
+
+        def counter(name, help_text, samples):
+            sample_name = name + '_total'
+            if openmetrics:
+                lines.append('# TYPE %s counter' % name)
+                lines.append('# HELP %s %s' % (name, help_text))
+            else:
+                lines.append('# TYPE %s counter' % sample_name)
+                lines.append('# HELP %s %s' % (sample_name, help_text))
+            for labels, value in samples:
+                lines.append('%s{%s} %s' % (sample_name, labels, _format(value)))
+
+        def gauge(name, help_text, samples):
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('# HELP %s %s' % (name, help_text))
+            for labels, value in samples:
+                lines.append('%s{%s} %s' % (name, labels, _format(value)))
+
+        node_labels = sorted(self.totals)
+        counter('tbc_operations', 'Operations completed by each node.',
+                [(_labels(event=event, node=node), self.totals[(node, event)][0]) for node, event in node_labels])
+        counter('tbc_failed_operations', 'Operations that failed on each node.',
+                [(_labels(event=event, node=node), self.totals[(node, event)][1]) for node, event in node_labels])
+
+        gauge('tbc_throughput', 'Operations per second over the window.',
+              [(_labels(event=event), events[event][0] / window) for event in sorted(events)])
+        gauge('tbc_node_throughput', 'Operations per second of each node over the window.',
+              [(_labels(event=event, node=node), node_nums[(node, event)] / window) for node, event in node_labels])
+        gauge('tbc_mean_latency_seconds', 'Mean latency over the window.',
+              [(_labels(event=event), events[event][2] / events[event][0])
+               for event in sorted(events) if events[event][0] > 0])
+        gauge('tbc_failure_ratio', 'Fraction of operations that failed over the window.',
+              [(_labels(event=event), float(events[event][1]) / events[event][0])
+               for event in sorted(events) if events[event][0] > 0])
+
+        samples = []
+        for event in sorted(events):
+            if events[event][0] == 0:
+                continue
+            values = self.histogram.percentiles_of_bins(latency_bins[event], [p for label, p in LIVE_PERCENTILES])
+            for (label, percentile), value in zip(LIVE_PERCENTILES, values):
+                samples.append((_labels(event=event, quantile=label), value))
+        gauge('tbc_latency_seconds', 'Latency percentiles over the window.', samples)
+
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    """
+    :return: the labels formatted for the text format, e.g. event="RandomRW/read",node="10.0.0.1:9999"
+    """
+    result = []
+    for name in sorted(labels):
+        value = str(labels[name]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        result.append('%s="%s"' % (name, value))
+    return ','.join(result)
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -7,21 +7,31 @@ class LoadingManager(object):
     a single node.
     """
 
-    def __init__(self, loader, num_processes, node_number, total_nodes):
-        self.loader = []
+    def __init__(self, loader, num_processes, node_number, total_nodes, pool=None):
+        """
+        :param loader: the load function of the benchmark, or a BenchmarkReference if pool is not None
+        :param pool: if not None, a WorkerPool whose workers run the loaders instead of new processes
+        """
+        self.loader = loader
         self.processes = []
+        self.pool = pool
+        self.num_processes = num_processes
 
-        begin_loader_id = num_processes * node_number
-        total_loaders = num_processes * total_nodes
+        self.begin_loader_id = num_processes * node_number
+        self.total_loaders = num_processes * total_nodes
 
-        for pnum in xrange(num_processes):
-            proc = multiprocessing.Process(target=loader, args=(begin_loader_id+pnum, total_loaders))
-            self.processes.append(proc)
+        if pool is None:
+            for pnum in xrange(num_processes):
+                proc = multiprocessing.Process(target=loader, args=(self.begin_loader_id+pnum, self.total_loaders))
+                self.processes.append(proc)
 
         self.node_number = node_number
 
 
     def run(self):
+        if self.pool is not None:
+            self.pool.load(self.loader, self.num_processes, self.begin_loader_id, self.total_loaders)
+            return
         for index, proc in enumerate(self.processes):
             proc.start()
         for proc in self.processes:
@@ -1,9 +1,15 @@
-import time
 import sys
 from network_cjl.Serializer import *
 from TBC.utility.Numbers import *
+from TBC.utility.Clock import now
+from TBC.utility.Histogram import Histogram, histogram_from_bins, shared_histogram
 
-@serializable({'num':int, 'failed':int, 'total_time': float, 'latency': float, 'tput': float})
+# the latency percentiles that are computed for every frame, (attribute name, percentile)
+FRAME_PERCENTILES = [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999)]
+
+
+@serializable({'num':int, 'failed':int, 'total_time': float, 'latency': float, 'tput': float,
+               'latency_bins': {int: int}, 'p50': float, 'p90': float, 'p99': float, 'p999': float})
 class EventInfo(object):
     def __init__(self):
         self.num = 0
@@ -12,8 +18,15 @@ class EventInfo(object):
         self.latency = None
         self.tput = None
 
+        # a sparse latency histogram of the events in the frame, {histogram index: count}
+        self.latency_bins = {}
+        self.p50 = None
+        self.p90 = None
+        self.p99 = None
+        self.p999 = None
+
 
-@serializable({'events': {str: EventInfo}, 'start_time': float, 'end_time': float})
+@serializable({'events': {str: EventInfo}, 'counters': {str: float}, 'start_time': float, 'end_time': float})
 class LogFrame(object):
     """
     Represents a large number of events within a time span
@@ -21,111 +34,267 @@ class LogFrame(object):
 
     def __init__(self, start_time):
         self.events = {}
+        # counters of the processes that produced the events (see TaskManager), {name: value}
+        self.counters = {}
         self.start_time = start_time
         self.end_time = None
 
-    def log(self, event, delta_t, failed):
+    def log_aggregate(self, event, num, failed, total_time, bins):
         """
-        Adds the event to the frame but does not to any processing
-        :param event: a list representing an event (the 'path' returned by a task report)
-        :param delta_t: the amount of time it took for this event to complete
-        :param failed: True if this event failed
+        Adds a group of events to the frame
+        :param event: the name of the event
+        :param num: the number of events
+        :param failed: the number of events that failed
+        :param total_time: the sum of the amount of time it took for each event to complete
+        :param bins: a sparse latency histogram of the events, {histogram index: count}
         """
 
         if event not in self.events:
             self.events[event] = EventInfo()
 
         e_info = self.events[event]
-        e_info.num += 1
-        e_info.total_time += delta_t
-        if failed:
-            e_info.failed += 1
+        e_info.num += num
+        e_info.failed += failed
+        e_info.total_time += total_time
+        latency_bins = e_info.latency_bins
+        for latency_bin in bins:
+            latency_bins[latency_bin] = latency_bins.get(latency_bin, 0) + bins[latency_bin]
+
+    def log_counters(self, counters):
+        """
+        Add to the counters of the frame
+        :param counters: a dictionary of the form {name: value}
+        """
+        for name in counters:
+            self.counters[name] = self.counters.get(name, 0.0) + counters[name]
 
-    def process(self, end_time):
+    def process(self, end_time, significant_digits):
         """
         Finish up computation on this frame
-        :param delta_time: the amount of time that this frame represents
+        :param end_time: the time at which this frame ends
+        :param significant_digits: the significant digits of the latency histograms
         """
         self.end_time = end_time
         delta_time = self.end_time - self.start_time
+        histogram = shared_histogram(significant_digits)
         for event in self.events:
             e_info = self.events[event]
             e_info.latency = significant_figures(e_info.total_time / float(e_info.num), 4)
             e_info.tput = significant_figures(float(e_info.num) / delta_time, 4)
+            values = histogram.percentiles_of_bins(e_info.latency_bins, [p for name, p in FRAME_PERCENTILES])
+            for (name, percentile), value in zip(FRAME_PERCENTILES, values):
+                setattr(e_info, name, value)
+
+
+@serializable({'frames': [LogFrame],
+               'latency_bins': {str: {int: int}},
+               'corrected_latency_bins': {str: {int: int}},
+               'sequence': int,
+               'timer': str,
+               'timer_overhead': float,
+               'timer_resolution': float,
+               'cpu_count': int,
+               'profile': {str: int}})
+class LogChunk(object):
+    """
+    A part of a Logger that is sent to the master while a benchmark is running.  A chunk contains the frames that
+    were sealed since the previous chunk and the latency bins that were logged since the previous chunk.  A frame
+    may be sent more than once if events arrived after it was sealed, in which case the frames should be summed.
+    """
+
+    def __init__(self, frames, latency_bins, corrected_latency_bins, sequence):
+        """
+        :param frames: a list of processed LogFrames
+        :param latency_bins: a dictionary of the form {event: {histogram index: count}}
+        :param corrected_latency_bins: a dictionary of the form {event: {histogram index: count}}
+        :param sequence: the number of chunks that were taken from the Logger before this one
+        """
+        self.frames = frames
+        self.latency_bins = latency_bins
+        self.corrected_latency_bins = corrected_latency_bins
+        self.sequence = sequence
+
+        # only set in the last chunk of a Logger
+        self.timer = ''
+        self.timer_overhead = 0.0
+        self.timer_resolution = 0.0
+        # the number of CPUs of the node
+        self.cpu_count = 0
+        # {collapsed stack: number of samples} of the node's profiler
+        self.profile = {}
 
 
 @serializable({'frames': [LogFrame],
-               'latency_bin_size': float,
+               'latency_significant_digits': int,
                'latency_bins': {str: {int: int}},
-               'framerate': float})
+               'corrected_latency_bins': {str: {int: int}},
+               'framerate': float,
+               'timer': str,
+               'timer_overhead': float,
+               'timer_resolution': float})
 class Logger(object):
     """
     Keeps a sequence of log frames
     """
 
-    def __init__(self, framerate, latency_bin_size):
+    def __init__(self, framerate, latency_significant_digits, start_time=None):
         """
         Construct a new logger
         :param framerate: the number of frames per second to store
+        :param latency_significant_digits: the number of significant digits kept by the latency histograms
+        :param start_time: the time at which the first frame starts.  If None then the current time is used.
         """
         self.frames = []
         self.frame_number = -1
 
-        self.latency_bin_size = latency_bin_size
+        # the frame number of self.frames[0], frames are removed from the front by take_chunk()
+        self.first_frame_number = 0
+
+        # frame number -> LogFrame for events that arrived after their frame was removed by take_chunk()
+        self.late_frames = {}
+        self.chunks_taken = 0
+
+        # latencies are accumulated in Histograms and stored as sparse {histogram index: count} bins by finish()
+        self.latency_significant_digits = latency_significant_digits
+        self.latency_histograms = {}
         self.latency_bins = {}
 
+        # latencies measured from the scheduled start time of each operation (only when the load is rate controlled)
+        self.corrected_latency_histograms = {}
+        self.corrected_latency_bins = {}
+
+        # the latency bins that were logged since the last call to take_chunk()
+        self.pending_latency_bins = {}
+        self.pending_corrected_latency_bins = {}
+
         self.framerate = framerate
         self.frame_period = 1.0 / self.framerate
 
+        # information about the clock used to measure latency
+        self.timer = ''
+        self.timer_overhead = 0.0
+        self.timer_resolution = 0.0
+
         # massage the start time so that it starts on an "even" interval
-        self.start_time = time.time()
-        self.start_time = self.start_time - (self.start_time % self.frame_period)
+        self.start_time = start_time
+        if self.start_time is None:
+            self.start_time = now()
+            self.start_time = self.start_time - (self.start_time % self.frame_period)
 
-    def update_frame(self):
+    def set_timer_info(self, timer, overhead, resolution):
         """
-        Ensure that the last frame in self.frames represents the frame for now
+        Record information about the clock that was used to measure latencies
+        :param timer: the name of the clock
+        :param overhead: the average amount of time it takes to read the clock
+        :param resolution: the smallest non-zero difference observed between two readings of the clock
         """
-        now = time.time()
-        delta_time = now - self.start_time
+        self.timer = timer
+        self.timer_overhead = overhead
+        self.timer_resolution = resolution
 
-        target_frame = int(delta_time / self.frame_period)
-
-        # add frames until we reach the target frame
+    def extend_frames(self, target_frame):
+        """
+        Add frames until the frame with index target_frame exists
+        """
         while self.frame_number < target_frame:
             boundary_time = self.start_time + self.frame_number * self.frame_period
             if self.frame_number >= 0:
-                self.frames[-1].process(boundary_time)
+                self.frames[-1].process(boundary_time, self.latency_significant_digits)
             self.frames.append(LogFrame(boundary_time))
             self.frame_number += 1
 
-    def log_latency_percentile(self, event, latency):
-        lbin = None
+    def get_histogram(self, event, corrected=False):
+        """
+        :param event: the name of an event
+        :param corrected: if True then return the histogram of latencies measured from scheduled start times
+        :return: the latency Histogram of the event, created if it does not exist yet
+        """
+        histograms = self.corrected_latency_histograms if corrected else self.latency_histograms
+        if event not in histograms:
+            histograms[event] = Histogram(self.latency_significant_digits)
+        return histograms[event]
 
-        if event in self.latency_bins:
-            lbin = self.latency_bins[event]
+    def log_batch(self, timestamp, events, counters=None):
+        """
+        Log a batch of events that was pre-aggregated by a StatsAggregator
+        :param timestamp: the time at which the batch was started.  The entire batch is placed into the frame
+                            that contains this time.
+        :param events: a dictionary of the form
+                        {event: [num, failed, total_time, {histogram index: count},
+                                 {corrected histogram index: count}]}
+        :param counters: if not None, a dictionary of the form {name: value} that is added to the frame's counters
+        """
+        target_frame = max(0, int((timestamp - self.start_time) / self.frame_period))
+        self.extend_frames(target_frame)
+        if target_frame >= self.first_frame_number:
+            frame = self.frames[target_frame - self.first_frame_number]
         else:
-            lbin = {}
-            self.latency_bins[event] = lbin
-
-        latency_bin = int(latency / self.latency_bin_size)
-        if latency_bin in lbin:
-            lbin[latency_bin] += 1
+            frame = self.late_frames.get(target_frame)
+            if frame is None:
+                frame = LogFrame(self.start_time + (target_frame - 1) * self.frame_period)
+                self.late_frames[target_frame] = frame
+
+        if counters:
+            frame.log_counters(counters)
+        for event in events:
+            num, failed, total_time, bins, corrected_bins = events[event]
+            frame.log_aggregate(event, num, failed, total_time, bins)
+            self.get_histogram(event).add_bins(bins)
+            merge_latency_bins(self.pending_latency_bins, event, bins)
+            if len(corrected_bins) > 0:
+                self.get_histogram(event, corrected=True).add_bins(corrected_bins)
+                merge_latency_bins(self.pending_corrected_latency_bins, event, corrected_bins)
+
+    def take_chunk(self, sealed_time=None):
+        """
+        Remove the sealed frames from the log
+        :param sealed_time: frames that ended at or before this time are sealed.  If None then every frame is sealed,
+                                which should only be done after finish().
+        :return: a LogChunk
+        """
+        sealed = 0
+        if sealed_time is None:
+            sealed = len(self.frames)
         else:
-            lbin[latency_bin] = 1
-
-    def log(self, event, delta_t, failed):
-        event = '/'.join(event)
-        self.update_frame()
-        self.frames[-1].log(event, delta_t, failed)
-        self.log_latency_percentile(event, delta_t)
+            # the last frame is still being filled
+            while sealed < len(self.frames) - 1 and self.frames[sealed].end_time <= sealed_time:
+                sealed += 1
+        frames = self.frames[:sealed]
+        self.frames = self.frames[sealed:]
+        self.first_frame_number += sealed
+
+        for frame_number in sorted(self.late_frames):
+            frame = self.late_frames[frame_number]
+            frame.process(frame.start_time + self.frame_period, self.latency_significant_digits)
+            frames.append(frame)
+        self.late_frames = {}
+
+        chunk = LogChunk(frames, self.pending_latency_bins, self.pending_corrected_latency_bins, self.chunks_taken)
+        self.pending_latency_bins = {}
+        self.pending_corrected_latency_bins = {}
+        self.chunks_taken += 1
+        return chunk
+
+    def store_histograms(self):
+        """
+        Copy the latency Histograms into the (serializable) latency bins
+        """
+        for event in self.latency_histograms:
+            self.latency_bins[event] = self.latency_histograms[event].to_bins()
+        for event in self.corrected_latency_histograms:
+            self.corrected_latency_bins[event] = self.corrected_latency_histograms[event].to_bins()
 
     def finish(self):
         """
         Call this at the very end after all input is recieved
         """
+        # batches may arrive after their frame has already been processed, so process every frame again
+        for frame in self.frames[:-1]:
+            frame.process(frame.end_time, self.latency_significant_digits)
         boundary_time = self.start_time + self.frame_number * self.frame_period
         if self.frame_number >= 0:
-            self.frames[-1].process(boundary_time)
+            self.frames[-1].process(boundary_time, self.latency_significant_digits)
+        self.store_histograms()
 
     def __str__(self):
         result = []
@@ -137,93 +306,26 @@ class Logger(object):
                 result.append('\t' + str(event) + ' total: ' + str(e_info.num) + ', failed: ' + str(e_info.failed) +
                               ', latency: ' + str(e_info.latency) + ', throughput: ' + str(e_info.tput))
         for event in self.latency_bins:
-            lbin = self.latency_bins[event]
+            histogram = histogram_from_bins(self.latency_bins[event], self.latency_significant_digits)
             result.append('-' * 100)
             result.append('Latency histogram for ' + str(event))
-            for bin in sorted(lbin.keys()):
-                result.append(str(bin * self.latency_bin_size) + ': ' + str(lbin[bin]))
+            for index, count in histogram.items():
+                result.append(str(histogram.lowest_equivalent_value(index)) + ': ' + str(count))
         return '\n'.join(result)
 
 
-def clip_logs(logs, frame_size, dead_frames):
-    """
-    Given a list of logs, clip parts of logs that do not overlap
-    :param logs: a list of Loggers
-    :param frame_size: the frame size of the Loggers
-    :param dead_frames: the number of additional frames to clip from the front and the back
-    :return:  a list of Loggers
-    """
-    max_begin = logs[0].frames[0].start_time
-    min_end = logs[0].frames[-1].start_time
-
-    for log in logs:
-        begin_frame = log.frames[0]
-        end_frame = log.frames[-1]
-        max_begin = max(max_begin, begin_frame.start_time + dead_frames * frame_size)
-        min_end = min(min_end, end_frame.start_time - dead_frames * frame_size)
-
-    if max_begin >= min_end:
-        sys.stderr.write("Invalid benchmark data: runtimes to not overlap\n")
-        return None
-
-    max_begin = ApproximateFloat(max_begin, threshold=0.1*frame_size)
-    min_end = ApproximateFloat(min_end, threshold=0.1*frame_size)
-
-    for log in logs:
-        new_frames = []
-        for frame in log.frames:
-            if frame.start_time >= max_begin and frame.start_time <= min_end:
-                new_frames.append(frame)
-
-        log.frames = new_frames
-    return logs
-
-
-def average_logs(logs):
+def merge_latency_bins(latency_bins, event, bins):
     """
-    Given a list of logs (with frames that fully overlap), return a single log that is an aggregation of all logs
-    :param logs: a list of Loggers
-    :return: a Logger
+    Add a set of latency bins to the bins of an event
+    :param latency_bins: a dictionary of the form {event: {histogram index: count}}, modified in place
+    :param event: the event that the bins belong to
+    :param bins: a dictionary of the form {histogram index: count}
     """
-    average_log = Logger(logs[0].framerate, logs[0].latency_bin_size)
-
-    number_of_frames = len(logs[0].frames)
-
-    # assert that each log has the same number of frames
-    for log in logs:
-        assert len(log.frames) == number_of_frames, 'Frame numbers do not match!  ' \
-                                                    'Expected %d frames, got %d instead.' \
-                                                    % (number_of_frames, len(log.frames))
-
-    # average the LogFrames
-    # for each frame
-    for frame_number in xrange(number_of_frames):
-        next_frame = LogFrame(logs[0].frames[frame_number].start_time)
-
-        # for each log
-        for log in logs:
-            # for each type of event in this frame
-            for event in log.frames[frame_number].events:
-                if event not in next_frame.events:
-                    next_frame.events[event] = EventInfo()
-                next_frame.events[event].num += log.frames[frame_number].events[event].num
-                next_frame.events[event].failed += log.frames[frame_number].events[event].failed
-                next_frame.events[event].total_time += log.frames[frame_number].events[event].total_time
-
-        next_frame.process(logs[0].frames[frame_number].end_time)
-        average_log.frames.append(next_frame)
-
-    # sum the latency bins
-    for log in logs:
-        for event_type in log.latency_bins:
-            if event_type not in average_log.latency_bins:
-                average_log.latency_bins[event_type] = {}
-            for bin in log.latency_bins[event_type]:
-                if bin not in average_log.latency_bins[event_type]:
-                    average_log.latency_bins[event_type][bin] = 0
-                average_log.latency_bins[event_type][bin] += log.latency_bins[event_type][bin]
-
-    return average_log
+    if event not in latency_bins:
+        latency_bins[event] = {}
+    lbin = latency_bins[event]
+    for latency_bin in bins:
+        lbin[latency_bin] = lbin.get(latency_bin, 0) + bins[latency_bin]
 
 
 def print_log(log):
@@ -238,8 +340,8 @@ def print_log(log):
             print '\t' + str(event) + ' total: ' + str(e_info.num) + ', failed: ' + str(e_info.failed) + \
                   ', latency: ' + str(e_info.latency) + ', throughput: ' + str(e_info.tput)
     for event in log.latency_bins:
-        lbin = log.latency_bins[event]
+        histogram = histogram_from_bins(log.latency_bins[event], log.latency_significant_digits)
         print '-' * 100
         print 'Latency histogram for ' + str(event)
-        for bin in sorted(lbin.keys()):
-            print str(bin * log.latency_bin_size) + ': ' + str(lbin[bin])
\ No newline at end of file
+        for index, count in histogram.items():
+            print str(histogram.lowest_equivalent_value(index)) + ': ' + str(count)
\ No newline at end of file
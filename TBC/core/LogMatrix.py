@@ -0,0 +1,367 @@
+import sys
+import numpy
+
+from TBC.core.Log import merge_latency_bins
+from TBC.utility.Histogram import Histogram, shared_histogram
+
+# the statistics that are kept for every frame and event
+NUM = 0
+FAILED = 1
+TOTAL_TIME = 2
+
+
+def significant_figures_array(x, n):
+    """
+    :return: a copy of the array x with every element rounded to n significant figures
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        magnitude = numpy.floor(numpy.log10(numpy.abs(x)))
+        magnitude[~numpy.isfinite(magnitude)] = 0
+        factor = 10.0 ** (n - 1 - magnitude)
+        return numpy.round(x * factor) / factor
+
+
+class LogMatrix(object):
+    """
+    Combines the frames of the Loggers of every node into dense NumPy arrays of the form (frames x events) so that the
+    results of a benchmark can be analyzed with array operations instead of loops over frames, events and nodes.
+
+    Frames are identified by their index since the epoch (every Logger starts its frames on a multiple of the frame
+    period), and the frames of different nodes that have the same index are summed.  Frames are added as they arrive
+    and are only converted into dense arrays by clip().
+    """
+
+    def __init__(self, framerate, latency_significant_digits):
+        """
+        :param framerate: the number of frames per second of the Loggers
+        :param latency_significant_digits: the significant digits of the latency histograms of the Loggers
+        """
+        self.framerate = framerate
+        self.frame_period = 1.0 / framerate
+        self.latency_significant_digits = latency_significant_digits
+        self.histogram = shared_histogram(latency_significant_digits)
+
+        self.events = []
+        self.event_ids = {}
+
+        # source -> [index of the first frame, index of the last frame]
+        self.sources = {}
+
+        # per frame statistics that have not been consolidated yet, as lists of
+        # (frame offset, event id, num, failed, total_time) and (frame offset, event id, histogram index, count)
+        self.pending_stats = []
+        self.pending_bins = []
+        self.consolidate_threshold = 1000000
+
+        # consolidated per frame statistics, sorted by key and without duplicate keys.  The key of a statistic is
+        # frame offset * number of events + event id, the key of a histogram bucket is that value * histogram length
+        # + histogram index.  The frame offset is relative to the first frame that was added (it is negative for
+        # earlier frames), since epoch frame indexes would overflow the keys.
+        self.base_frame = None
+        self.stat_keys = numpy.zeros(0, dtype=numpy.int64)
+        self.stat_values = numpy.zeros((0, 3), dtype=numpy.float64)
+        self.bin_keys = numpy.zeros(0, dtype=numpy.int64)
+        self.bin_counts = numpy.zeros(0, dtype=numpy.int64)
+        # the number of events that the statistics and the histogram buckets are keyed with
+        self.stat_events = 0
+        self.bin_events = 0
+
+        # the counters of every frame of every source, {source: {frame index: {name: value}}}.  There are only a few
+        # counters per frame so they are kept apart from the per event statistics.
+        self.counters = {}
+
+        # {event: {histogram index: count}} over the entire run
+        self.latency_bins = {}
+        self.corrected_latency_bins = {}
+
+        self.timer = ''
+        self.timer_overhead = 0.0
+        self.timer_resolution = 0.0
+
+        # set by clip()
+        self.first_frame = None
+        self.last_frame = None
+        self.num = None
+        self.failed = None
+        self.total_time = None
+
+    def add_frames(self, source, frames):
+        """
+        Add a sequence of processed LogFrames
+        :param source: an identifier of the node that produced the frames
+        :param frames: a list of LogFrames
+        """
+        stats = self.pending_stats
+        bins = self.pending_bins
+        for frame in frames:
+            frame_index = int(round(frame.start_time * self.framerate))
+            if self.base_frame is None:
+                self.base_frame = frame_index
+            if source not in self.sources:
+                self.sources[source] = [frame_index, frame_index]
+            span = self.sources[source]
+            span[0] = min(span[0], frame_index)
+            span[1] = max(span[1], frame_index)
+
+            if len(frame.counters) > 0:
+                frame_counters = self.counters.setdefault(source, {}).setdefault(frame_index, {})
+                for name in frame.counters:
+                    frame_counters[name] = frame_counters.get(name, 0.0) + frame.counters[name]
+
+            frame_offset = frame_index - self.base_frame
+            for event in frame.events:
+                e_info = frame.events[event]
+                event_id = self._event_id(event)
+                stats.append((frame_offset, event_id, e_info.num, e_info.failed, e_info.total_time))
+                for latency_bin in e_info.latency_bins:
+                    bins.append((frame_offset, event_id, latency_bin, e_info.latency_bins[latency_bin]))
+
+        # the pending lists take far more memory than the consolidated arrays
+        if len(stats) > self.consolidate_threshold:
+            self.consolidate_stats()
+        if len(bins) > self.consolidate_threshold:
+            self.consolidate_bins()
+
+    def add_latency_bins(self, latency_bins, corrected_latency_bins):
+        """
+        Add latency histograms that span the entire run
+        :param latency_bins: a dictionary of the form {event: {histogram index: count}}
+        :param corrected_latency_bins: a dictionary of the form {event: {histogram index: count}}
+        """
+        for target, source in ((self.latency_bins, latency_bins),
+                               (self.corrected_latency_bins, corrected_latency_bins)):
+            for event in source:
+                merge_latency_bins(target, event, source[event])
+
+    def set_timer_info(self, timer, overhead, resolution):
+        """
+        Record the worst clock that was used by any node
+        """
+        self.timer = timer
+        self.timer_overhead = max(self.timer_overhead, overhead)
+        self.timer_resolution = max(self.timer_resolution, resolution)
+
+    def _event_id(self, event):
+        event_id = self.event_ids.get(event)
+        if event_id is None:
+            event_id = len(self.events)
+            self.event_ids[event] = event_id
+            self.events.append(event)
+        return event_id
+
+    def consolidate(self):
+        """
+        Move the pending statistics and histogram buckets into the consolidated arrays
+        """
+        self.consolidate_stats()
+        self.consolidate_bins()
+
+    def consolidate_stats(self):
+        """
+        Move the pending statistics into the consolidated arrays, but leave the histogram buckets pending.  There are
+        far more buckets than statistics, and only the analysis of the finished run needs them.
+        """
+        number_of_events = max(1, len(self.events))
+
+        # the number of events may have grown, in which case the existing keys are recomputed.  This does not change
+        # their order.
+        if self.stat_events != number_of_events and len(self.stat_keys) > 0:
+            frames, event_ids = divmod(self.stat_keys, self.stat_events)
+            self.stat_keys = frames * number_of_events + event_ids
+        self.stat_events = number_of_events
+
+        if len(self.pending_stats) > 0:
+            pending = numpy.array(self.pending_stats, dtype=numpy.float64)
+            keys = pending[:, 0].astype(numpy.int64) * number_of_events + pending[:, 1].astype(numpy.int64)
+            self.stat_keys, self.stat_values = _merge(self.stat_keys, self.stat_values, keys, pending[:, 2:])
+            self.pending_stats = []
+
+    def consolidate_bins(self):
+        """
+        Move the pending histogram buckets into the consolidated arrays
+        """
+        number_of_events = max(1, len(self.events))
+        length = self.histogram.length
+
+        if self.bin_events != number_of_events and len(self.bin_keys) > 0:
+            groups, indexes = divmod(self.bin_keys, length)
+            frames, event_ids = divmod(groups, self.bin_events)
+            self.bin_keys = (frames * number_of_events + event_ids) * length + indexes
+        self.bin_events = number_of_events
+
+        if len(self.pending_bins) > 0:
+            pending = numpy.array(self.pending_bins, dtype=numpy.int64)
+            keys = (pending[:, 0] * number_of_events + pending[:, 1]) * length + numpy.minimum(pending[:, 2],
+                                                                                               length - 1)
+            self.bin_keys, self.bin_counts = _merge(self.bin_keys, self.bin_counts, keys, pending[:, 3])
+            self.pending_bins = []
+
+    def overlap(self):
+        """
+        :return: a tuple (index of the first frame, index of the last frame) of the frames during which every source
+                    was running, or None if no frames were added
+        """
+        if len(self.sources) == 0:
+            return None
+        return max(span[0] for span in self.sources.values()), min(span[1] for span in self.sources.values())
+
+    def clip(self, dead_frames, tail_frames=None):
+        """
+        Select the frames during which every source was running (minus dead_frames at the front and tail_frames at
+        the back) and build the dense arrays num, failed and total_time of the form (frames x events)
+        :param dead_frames: the number of additional frames to clip from the front
+        :param tail_frames: the number of additional frames to clip from the back.  If None then dead_frames is used.
+        :return: True if the selected range is not empty, otherwise False
+        """
+        if tail_frames is None:
+            tail_frames = dead_frames
+        overlap = self.overlap()
+        if overlap is None:
+            sys.stderr.write("Invalid benchmark data: no frames were received\n")
+            return False
+        self.first_frame = overlap[0] + dead_frames
+        self.last_frame = overlap[1] - tail_frames
+        if self.first_frame >= self.last_frame:
+            sys.stderr.write("Invalid benchmark data: runtimes to not overlap\n")
+            return False
+
+        self.consolidate_stats()
+        number_of_events = self.stat_events
+        frames, event_ids = divmod(self.stat_keys, number_of_events)
+        frames += self.base_frame
+        selected = (frames >= self.first_frame) & (frames <= self.last_frame)
+        values = numpy.zeros((self.number_of_frames(), number_of_events, 3), dtype=numpy.float64)
+        values[frames[selected] - self.first_frame, event_ids[selected]] = self.stat_values[selected]
+
+        self.num = values[:, :len(self.events), NUM]
+        self.failed = values[:, :len(self.events), FAILED]
+        self.total_time = values[:, :len(self.events), TOTAL_TIME]
+        return True
+
+    def number_of_frames(self):
+        return self.last_frame - self.first_frame + 1
+
+    def aggregate_series(self):
+        """
+        :return: a tuple (throughput, latency) of arrays with the throughput (operations per second) and the mean
+                    latency of all events in each selected frame.  The latency of frames without events is the mean
+                    latency of the other frames.
+        """
+        num = self.num.sum(axis=1)
+        throughput = num / self.frame_period
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            latency = self.total_time.sum(axis=1) / num
+        empty = num == 0
+        latency[empty] = latency[~empty].mean() if not numpy.all(empty) else 0.0
+        return throughput, latency
+
+    def counter_series(self, name):
+        """
+        :param name: the name of a counter
+        :return: a dictionary of the form {source: array} with the value of the counter in every selected frame of
+                    each source that reported counters
+        """
+        result = {}
+        for source, counters in self.counters.iteritems():
+            values = numpy.zeros(self.number_of_frames())
+            for frame_index, frame_counters in counters.iteritems():
+                if self.first_frame <= frame_index <= self.last_frame:
+                    values[frame_index - self.first_frame] += frame_counters.get(name, 0.0)
+            result[source] = values
+        return result
+
+    def frame_bins(self):
+        """
+        :return: the per frame latency histograms of the selected frames as a tuple of arrays
+                    (frame number, event id, histogram index, count), sorted by frame number, event id and index
+        """
+        self.consolidate_bins()
+        groups, indexes = divmod(self.bin_keys, self.histogram.length)
+        frames, event_ids = divmod(groups, self.bin_events)
+        frames += self.base_frame
+        selected = (frames >= self.first_frame) & (frames <= self.last_frame)
+        return frames[selected] - self.first_frame, event_ids[selected], indexes[selected], self.bin_counts[selected]
+
+    def frame_percentiles(self, percentiles):
+        """
+        :param percentiles: a list of numbers between 0 and 1
+        :return: an array of the form (percentiles x frames x events) with the largest value (in seconds) that is
+                    equivalent to each percentile, or NaN where a frame does not contain an event
+        """
+        frames, event_ids, indexes, counts = self.frame_bins()
+        result = numpy.empty((len(percentiles), self.number_of_frames(), len(self.events)))
+        result.fill(numpy.nan)
+        if len(counts) == 0:
+            return result
+
+        # the buckets of each (frame, event) group are contiguous, find where each group starts
+        groups = frames * len(self.events) + event_ids
+        starts = numpy.flatnonzero(numpy.concatenate(([True], groups[1:] != groups[:-1])))
+        cumulative = numpy.cumsum(counts)
+        totals = numpy.add.reduceat(counts, starts)
+        before = cumulative[starts] - counts[starts]
+
+        # the highest equivalent value of every bucket
+        half = self.histogram.sub_bucket_half_count
+        shift = numpy.maximum(0, indexes // half - 1)
+        highest = ((indexes - shift * half + 1) << shift) * self.histogram.unit
+
+        for number, percentile in enumerate(percentiles):
+            targets = before + numpy.maximum(1, numpy.ceil(percentile * totals)).astype(numpy.int64)
+            positions = numpy.searchsorted(cumulative, targets, side='left')
+            result[number, frames[starts], event_ids[starts]] = highest[positions]
+        return result
+
+    def latency_heatmap(self, event):
+        """
+        :param event: the name of an event
+        :return: a tuple (coarse, first_row, matrix) where matrix is an array of the form (rows x frames) with the
+                    number of events of each frame that fall into each power of two latency bucket of the Histogram
+                    coarse, starting at the bucket first_row.  None if the event did not occur.
+        """
+        coarse = Histogram(0)
+        frames, event_ids, indexes, counts = self.frame_bins()
+        selected = event_ids == self.event_ids[event]
+        if not numpy.any(selected):
+            return None
+
+        # every bucket of the coarse histogram contains whole buckets of the original histogram
+        unique_indexes, positions = numpy.unique(indexes[selected], return_inverse=True)
+        mapping = numpy.array([coarse.index_of(self.histogram.median_equivalent_value(index))
+                               for index in unique_indexes])
+        rows = mapping[positions]
+        first_row = rows.min()
+        matrix = numpy.zeros((rows.max() - first_row + 1, self.number_of_frames()), dtype=numpy.int64)
+        numpy.add.at(matrix, (rows - first_row, frames[selected]), counts[selected])
+        return coarse, first_row, matrix
+
+
+def _reduce(keys, values):
+    """
+    Sort keys and sum the values of duplicate keys
+    :return: a tuple (unique keys, summed values)
+    """
+    order = numpy.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    values = values[order]
+    if len(keys) == 0:
+        return keys, values
+    starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], numpy.add.reduceat(values, starts, axis=0)
+
+
+def _merge(keys, values, new_keys, new_values):
+    """
+    Add new statistics to statistics that are sorted by key and have no duplicate keys.  Only the new statistics are
+    sorted, so the cost of a merge does not grow with the number of statistics that were merged before.
+    :return: a tuple (unique keys, summed values)
+    """
+    new_keys, new_values = _reduce(new_keys, new_values)
+    positions = numpy.searchsorted(keys, new_keys)
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == new_keys[found]
+    values[positions[found]] += new_values[found]
+    missing = ~found
+    return (numpy.insert(keys, positions[missing], new_keys[missing]),
+            numpy.insert(values, positions[missing], new_values[missing], axis=0))
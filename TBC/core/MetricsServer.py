@@ -0,0 +1,58 @@
+import logging
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class MetricsServer(object):
+    """
+    Serves the current LiveMetrics over HTTP so that a running benchmark can be watched (or scraped by Prometheus)
+    """
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        """
+        :param metrics: a LiveMetrics object
+        :param port: the port to listen on
+        :param host: the address to listen on
+        """
+        self.metrics = metrics
+        self.logger = logging.getLogger()
+
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                body = metrics_server.metrics.render(openmetrics)
+                self.send_response(200)
+                if openmetrics:
+                    self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+                else:
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                metrics_server.logger.debug('Metrics request from %s: %s', self.client_address[0], format % args)
+
+        self.server = HTTPServer((host, port), Handler)
+        self.thread = None
+
+    def start(self):
+        """
+        Start serving requests on a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info('Serving live metrics at http://%s:%d/metrics', *self.server.server_address)
+
+    def close(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
@@ -0,0 +1,45 @@
+import random
+import time
+
+from TBC.utility.Clock import now
+
+
+class Pacer(object):
+    """
+    Schedules the start times of operations for open-loop load generation.  Operations are scheduled at a fixed
+    rate regardless of how long previous operations took, so a stalled server causes a backlog instead of
+    silently reducing the offered load.
+    """
+
+    def __init__(self, rate, arrival='constant'):
+        """
+        :param rate: the number of operations per second
+        :param arrival: 'constant' for evenly spaced operations, 'poisson' for exponentially distributed gaps
+        """
+        if rate <= 0:
+            raise Exception('The rate of a Pacer must be positive, got ' + str(rate))
+        if arrival not in ('constant', 'poisson'):
+            raise Exception('Unknown arrival distribution ' + str(arrival))
+        self.rate = rate
+        self.arrival = arrival
+        self.next_time = None
+
+    def _interval(self):
+        if self.arrival == 'poisson':
+            return random.expovariate(self.rate)
+        return 1.0 / self.rate
+
+    def wait(self):
+        """
+        Block until the next operation is scheduled to start
+        :return: the time at which the operation was supposed to start
+        """
+        current_time = now()
+        if self.next_time is None:
+            # spread the first operation of each client over one interval so that clients do not fire in lockstep
+            self.next_time = current_time + random.uniform(0, 1.0 / self.rate)
+        intended_time = self.next_time
+        if intended_time > current_time:
+            time.sleep(intended_time - current_time)
+        self.next_time += self._interval()
+        return intended_time
@@ -0,0 +1,224 @@
+"""
+Workload phases.  Instead of one flat duration, a run can be split into phases that each set their own duration,
+number of active clients, target rate (optionally ramping linearly to a final rate) and tasklet weights.  Every node
+switches phases at the same offsets from the synchronized start time.
+
+Example config:
+
+phases:
+    - name: warmup
+      duration: 30
+      clients_per_process: 2
+    - name: ramp
+      duration: 60
+      target_rate: 1000
+      final_target_rate: 5000
+    - name: writes
+      duration: 60
+      weights:
+          RandomRW/write: 10
+"""
+
+import time
+import copy
+
+from TBC.core.Task import Task
+from TBC.utility.Clock import now
+
+
+def validate_target_rate(target_rate):
+    """
+    Raise an exception if the target rate of the config can not be run
+    :param target_rate: the target rate of the config, or None for a closed loop
+    """
+    if target_rate is not None and target_rate <= 0:
+        raise Exception('target_rate must be positive, use clients_per_process: 0 to pause the load')
+
+
+def validate_phases(phases, target_rate=None):
+    """
+    Raise an exception if the phases can not be run
+    :param phases: the list of phases from the config
+    :param target_rate: the target rate of the config, used by phases that do not set their own
+    """
+    if len(phases) == 0:
+        raise Exception('phases must contain at least one phase')
+    rates = [phase.get('target_rate', target_rate) for phase in phases]
+    if None in rates and any(rate is not None for rate in rates):
+        raise Exception('Either every phase or no phase must have a target_rate')
+    for phase in phases:
+        if phase.get('duration', 0) <= 0:
+            raise Exception('Every phase needs a positive duration')
+        for key in ('target_rate', 'final_target_rate'):
+            if phase.get(key) is not None and phase[key] <= 0:
+                raise Exception('Phase rates must be positive, use clients_per_process: 0 to pause the load')
+
+
+def total_duration(phases):
+    """
+    :return: the duration of a run with the given phases, in seconds
+    """
+    return sum(phase['duration'] for phase in phases)
+
+
+def scale_rates(phases, factor):
+    """
+    :return: a copy of the phases with every target rate multiplied by factor (e.g. to split a cluster wide rate
+                between nodes)
+    """
+    phases = copy.deepcopy(phases)
+    for phase in phases:
+        for key in ('target_rate', 'final_target_rate'):
+            if phase.get(key) is not None:
+                phase[key] *= factor
+    return phases
+
+
+def phase_names(phases):
+    """
+    :return: the name of every phase, phases without a name are numbered
+    """
+    return [str(phase.get('name', number)) for number, phase in enumerate(phases)]
+
+
+class PhaseSchedule(object):
+    """
+    The phases of a run as seen by one TaskManager.  The schedule is shared by all clients of the TaskManager, each
+    client follows it through its own PhaseClient.
+    """
+
+    def __init__(self, phases, clients, target_rate=None):
+        """
+        :param phases: the list of phases from the config, with the rates of this TaskManager
+        :param clients: the number of clients of the TaskManager, phases may use fewer
+        :param target_rate: the target rate of the TaskManager, used by phases that do not set their own
+        """
+        validate_phases(phases, target_rate)
+        self.phases = []
+        offset = 0.0
+        for phase in phases:
+            rate = phase.get('target_rate', target_rate)
+            self.phases.append({'start': offset,
+                                'end': offset + phase['duration'],
+                                'duration': phase['duration'],
+                                'clients': min(clients, phase.get('clients_per_process', clients)),
+                                'target_rate': rate,
+                                'final_target_rate': phase.get('final_target_rate', rate),
+                                'weights': phase.get('weights', {})})
+            offset += phase['duration']
+        # the last phase lasts until the run is stopped
+        self.phases[-1]['end'] = float('inf')
+
+        self.start_time = None
+
+    def is_rate_controlled(self):
+        return self.phases[0]['target_rate'] is not None
+
+    def start(self, start_time):
+        """
+        :param start_time: the time at which the first phase starts
+        """
+        self.start_time = start_time
+
+    def phase_at(self, current_time):
+        """
+        :return: the index of the phase that is running at current_time
+        """
+        elapsed = current_time - self.start_time
+        for index, phase in enumerate(self.phases):
+            if elapsed < phase['end']:
+                return index
+        return len(self.phases) - 1
+
+    def client(self, number, task, pacer=None, is_alive=None):
+        """
+        :param number: the number of the client within the TaskManager, starting at 0
+        :param task: the root Task of the client
+        :param pacer: the Pacer of the client if the load is rate controlled
+        :param is_alive: a function that returns False once the TaskManager is stopping
+        :return: a PhaseClient
+        """
+        return PhaseClient(self, number, task, pacer, is_alive)
+
+
+class PhaseClient(object):
+    """
+    Applies the phases of a PhaseSchedule to one client.  It is called before every operation of the client, and
+    blocks while the current phase does not use the client.
+    """
+
+    def __init__(self, schedule, number, task, pacer=None, is_alive=None):
+        self.schedule = schedule
+        self.number = number
+        self.pacer = pacer
+        self.is_alive = is_alive
+
+        # how often a client that is not used by the current phase checks whether the run was stopped
+        self.pause_check_period = 0.05
+
+        # event -> tasklet, for applying weight overrides, and the weights that the tasklets were defined with
+        self.tasklets = {}
+        self._gather_tasklets(task)
+        self.default_weights = dict((event, tasklet.weight) for event, tasklet in self.tasklets.iteritems())
+        for phase in schedule.phases:
+            for event in phase['weights']:
+                if event not in self.tasklets:
+                    raise IndexError('Phase weights refer to unknown tasklet %s' % event)
+
+        self.phase = None
+        self.phase_end = float('-inf')
+        self.active = True
+
+    def _gather_tasklets(self, tasklet):
+        self.tasklets[tasklet._event] = tasklet
+        if isinstance(tasklet, Task):
+            for child in tasklet._tasklets:
+                self._gather_tasklets(child)
+
+    def __call__(self):
+        current_time = now()
+        if current_time >= self.phase_end:
+            self._enter(current_time)
+        while not self.active:
+            if self.is_alive is not None and not self.is_alive():
+                return
+            time.sleep(max(0.0, min(self.phase_end - current_time, self.pause_check_period)))
+            current_time = now()
+            if current_time >= self.phase_end:
+                self._enter(current_time)
+
+        phase = self.phase
+        if self.pacer is not None and phase['final_target_rate'] != phase['target_rate']:
+            # ramp the rate linearly over the phase
+            progress = min(1.0, (current_time - self.schedule.start_time - phase['start']) / phase['duration'])
+            rate = phase['target_rate'] + (phase['final_target_rate'] - phase['target_rate']) * progress
+            self.pacer.rate = rate / phase['clients']
+
+    def _enter(self, current_time):
+        """
+        Switch to the phase that is running at current_time
+        """
+        index = self.schedule.phase_at(current_time)
+        phase = self.schedule.phases[index]
+        self.phase_end = self.schedule.start_time + phase['end']
+        if phase is self.phase:
+            return
+        previous = self.phase
+        self.phase = phase
+
+        was_active = self.active
+        self.active = self.number < phase['clients']
+        if self.pacer is not None and self.active:
+            self.pacer.rate = phase['target_rate'] / float(phase['clients'])
+            if not was_active:
+                # do not make up for the operations that were not scheduled while this client was paused
+                self.pacer.next_time = None
+
+        if previous is None or previous['weights'] != phase['weights']:
+            changed = set(phase['weights'])
+            if previous is not None:
+                changed.update(previous['weights'])
+            for event in changed:
+                tasklet = self.tasklets[event]
+                if isinstance(tasklet.parent, Task):
+                    tasklet.parent.set_weight(tasklet.name, phase['weights'].get(event, self.default_weights[event]))
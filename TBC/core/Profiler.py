@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+
+from TBC.core.Tasklet import Tasklet
+from TBC.interfaces.Interface import Interface
+
+# keep the real sleep, greenlet clients monkey patch the time module
+_sleep = time.sleep
+
+
+class SamplingProfiler(object):
+    """
+    A low overhead profiler for the clients of a TaskManager.  A background thread periodically takes the stacks of
+    every other thread of the process and counts them in the collapsed stack format (frames from the root to the
+    leaf, separated by semicolons).  Frames of tasklets are named after the tasklet's event (e.g. RandomRW/read)
+    and frames of interfaces after the interface class (e.g. RedisInterface.get), so that the samples show how much
+    of the time is spent in the benchmark's own code and how much is spent waiting on the database.  Only stacks that
+    are inside a tasklet are counted, which leaves out threads that are idle or only coordinate the clients.
+
+    Signal based profilers are not used because in Python 2 signal handlers only run on the main thread, and not
+    while it waits for the client threads.
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        :param interval: the number of seconds between samples
+        """
+        self.interval = interval
+        # collapsed stack -> number of samples
+        self.samples = {}
+
+        # code object -> (label, names of the locals that may hold a tasklet or an interface)
+        self.code_info = {}
+
+        self.alive = False
+        self.thread = None
+
+    def start(self):
+        self.alive = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop sampling
+        :return: a dictionary of the form {collapsed stack: number of samples}
+        """
+        self.alive = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return self.samples
+
+    def _run(self):
+        own = threading.current_thread().ident
+        while self.alive:
+            _sleep(self.interval)
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(frame)
+
+    def _sample(self, frame):
+        labels = []
+        in_tasklet = False
+        while frame is not None:
+            label, is_tasklet = self._label(frame)
+            labels.append(label)
+            in_tasklet = in_tasklet or is_tasklet
+            frame = frame.f_back
+        if not in_tasklet:
+            return
+        labels.reverse()
+        stack = ';'.join(labels)
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def _label(self, frame):
+        """
+        :return: a tuple (the name of the frame, True if the frame belongs to a tasklet)
+        """
+        code = frame.f_code
+        info = self.code_info.get(code)
+        if info is None:
+            # methods of tasklets and interfaces have a self argument, the compiled runners of TaskManager refer to
+            # their tasklet as a free variable
+            names = tuple(name for name in ('self', 'tasklet')
+                          if name in code.co_varnames[:code.co_argcount] or name in code.co_freevars)
+            info = ('%s:%s' % (os.path.basename(code.co_filename), code.co_name), names)
+            self.code_info[code] = info
+        label, names = info
+
+        if len(names) > 0:
+            local_vars = frame.f_locals
+            for name in names:
+                owner = local_vars.get(name)
+                if isinstance(owner, Tasklet):
+                    if code.co_name in ('run', '_run'):
+                        return owner._event, True
+                    return owner._event + '.' + code.co_name, True
+                if isinstance(owner, Interface):
+                    return type(owner).__name__ + '.' + code.co_name, False
+        return label, False
+
+
+def merge_samples(samples, other):
+    """
+    Add the samples of other to samples
+    :param samples: a dictionary of the form {collapsed stack: number of samples}, modified in place
+    :param other: a dictionary of the same form
+    """
+    for stack, count in other.iteritems():
+        samples[stack] = samples.get(stack, 0) + count
@@ -0,0 +1,86 @@
+import mmap
+import struct
+import time
+
+# write index, read index, stop flag
+_header = struct.Struct('<QQB')
+
+# event id, latency, end time, failed
+_record_format = 'Hdd?'
+_record = struct.Struct('<' + _record_format)
+
+
+class RingBuffer(object):
+    """
+    A fixed size, single producer, single consumer ring buffer of operation records in shared memory.  The
+    buffer must be created before the producing process is forked so that both processes share the segment.
+    The segment also contains a flag that the consumer can set in order to ask the producer to stop.
+    """
+
+    def __init__(self, capacity=65536):
+        """
+        :param capacity: the maximum number of records that can be stored in the buffer
+        """
+        self.capacity = capacity
+        self.memory = mmap.mmap(-1, _header.size + capacity * _record.size)
+        self.data_offset = _header.size
+        self.stop_offset = _header.size - 1
+        self.spin_limiter = 0.0005
+
+        # the producer and consumer each keep a private copy of the index that only they write
+        self.write_index = 0
+        self.read_index = 0
+
+        _header.pack_into(self.memory, 0, 0, 0, False)
+
+    def put(self, event_id, latency, end_time, failed):
+        """
+        Add a record to the buffer.  If the buffer is full then block until there is room.
+        Should only be called by the producer.
+        """
+        while self.write_index - struct.unpack_from('<Q', self.memory, 8)[0] >= self.capacity:
+            time.sleep(self.spin_limiter)
+        position = self.data_offset + (self.write_index % self.capacity) * _record.size
+        _record.pack_into(self.memory, position, event_id, latency, end_time, failed)
+        self.write_index += 1
+        struct.pack_into('<Q', self.memory, 0, self.write_index)
+
+    def drain(self):
+        """
+        Remove all available records from the buffer.  Should only be called by the consumer.
+        :return: a flat list of the form [event_id, latency, end_time, failed, event_id, latency, end_time, failed, ...]
+        """
+        write_index = struct.unpack_from('<Q', self.memory, 0)[0]
+        available = write_index - self.read_index
+        if available == 0:
+            return []
+
+        # the records may wrap around the end of the buffer, in which case there are two contiguous chunks
+        start = self.read_index % self.capacity
+        first_chunk = min(available, self.capacity - start)
+        values = list(struct.unpack_from('<' + _record_format * first_chunk,
+                                         self.memory,
+                                         self.data_offset + start * _record.size))
+        if first_chunk < available:
+            values += struct.unpack_from('<' + _record_format * (available - first_chunk),
+                                         self.memory,
+                                         self.data_offset)
+
+        self.read_index = write_index
+        struct.pack_into('<Q', self.memory, 8, self.read_index)
+        return values
+
+    def request_stop(self):
+        """
+        Ask the producer to stop
+        """
+        struct.pack_into('<?', self.memory, self.stop_offset, True)
+
+    def clear_stop(self):
+        """
+        Withdraw a stop request so that the producer can run again (e.g. a worker process that is reused)
+        """
+        struct.pack_into('<?', self.memory, self.stop_offset, False)
+
+    def stop_requested(self):
+        return self.memory[self.stop_offset] != '\x00'
@@ -0,0 +1,90 @@
+from TBC.utility.Histogram import shared_histogram
+
+
+class StatsAggregator(object):
+    """
+    Accumulates operation statistics inside of a TaskManager's process.  Instead of sending a message to the
+    BenchmarkManager for every operation, statistics are collected into a batch which is sent a few times per second.
+    A batch never spans a log frame boundary, so the BenchmarkManager can file each batch into a single frame.
+    """
+
+    def __init__(self, framerate, latency_significant_digits, report_rate):
+        """
+        :param framerate: the number of log frames per second
+        :param latency_significant_digits: the number of significant digits kept by the latency histograms
+        :param report_rate: the maximum number of batches per second that will be produced
+        """
+        self.frame_period = 1.0 / framerate
+        self.report_period = 1.0 / report_rate
+        self.latency_significant_digits = latency_significant_digits
+        self.index_of = shared_histogram(latency_significant_digits).index_of
+
+        # event -> [number of events, number of failed events, total time, {histogram index: count},
+        #           {corrected histogram index: count}]
+        self.events = {}
+
+        # counters of the process that are sent along with the batch, e.g. the CPU time that was used.  {name: value}
+        self.counters = {}
+
+        # the time at which the first event of the current batch was recorded
+        self.timestamp = None
+
+        # the time at which the current batch should be sent
+        self.deadline = float('inf')
+
+    def record(self, event, delta_t, failed, now, corrected_t=None):
+        """
+        Add an operation to the current batch
+        :param event: the name of the event (i.e. the '/' separated path of the tasklet)
+        :param delta_t: the amount of time that the operation took
+        :param failed: True if the operation failed
+        :param now: the current time
+        :param corrected_t: the amount of time between when the operation was scheduled to start and when it ended.
+                                None unless the load is rate controlled.
+        """
+        if self.timestamp is None:
+            self.timestamp = now
+            frame_end = (int(now / self.frame_period) + 1) * self.frame_period
+            self.deadline = min(frame_end, now + self.report_period)
+
+        e_info = self.events.get(event)
+        if e_info is None:
+            e_info = [0, 0, 0.0, {}, {}]
+            self.events[event] = e_info
+
+        e_info[0] += 1
+        if failed:
+            e_info[1] += 1
+        e_info[2] += delta_t
+
+        latency_bins = e_info[3]
+        latency_bin = self.index_of(delta_t)
+        latency_bins[latency_bin] = latency_bins.get(latency_bin, 0) + 1
+
+        if corrected_t is not None:
+            corrected_bins = e_info[4]
+            latency_bin = self.index_of(corrected_t)
+            corrected_bins[latency_bin] = corrected_bins.get(latency_bin, 0) + 1
+
+    def add_counter(self, name, value):
+        """
+        Add value to a counter of the current batch
+        """
+        self.counters[name] = self.counters.get(name, 0.0) + value
+
+    def is_empty(self):
+        return self.timestamp is None
+
+    def flush(self):
+        """
+        Remove the current batch from the aggregator
+        :return: a tuple (timestamp, events, counters) where events is of the form
+                    {event: [num, failed, total_time, {histogram index: count}, {corrected histogram index: count}]}
+                    and counters is of the form {name: value}
+        """
+        batch = (self.timestamp, self.events, self.counters)
+        self.events = {}
+        self.counters = {}
+        self.timestamp = None
+        self.deadline = float('inf')
+        return batch
@@ -0,0 +1,122 @@
+from TBC.utility.Numbers import significant_figures
+
+
+class Sweep(object):
+    """
+    Chooses the values of a concurrency parameter (e.g. processes_per_node or clients_per_process) that a benchmark
+    is run with, and finds the knee of the resulting throughput / latency curve.
+
+    Without a latency SLO every value is run in order.  With an SLO the values are run in order until the p99 latency
+    exceeds the SLO, then the integers between the last value that met the SLO and the first value that did not are
+    bisected to find the highest concurrency (and therefore the maximum throughput) that meets the SLO.
+    """
+
+    def __init__(self, parameter, values, p99_slo=None):
+        """
+        :param parameter: the name of the configuration value that is swept
+        :param values: the values of the parameter, in ascending order
+        :param p99_slo: if not None, the highest acceptable p99 latency (in seconds)
+        """
+        if len(values) == 0:
+            raise Exception('A sweep needs at least one value')
+        self.parameter = parameter
+        self.values = list(values)
+        self.p99_slo = p99_slo
+
+        # value -> {'throughput': ..., 'latency': ..., 'p99': ..., 'fail_percentage': ...}
+        self.results = {}
+
+    def add_result(self, value, result):
+        """
+        :param value: the value of the parameter that the benchmark was run with
+        :param result: a dictionary with the throughput (operations per second), the mean latency, the p99 latency
+                        and the fail percentage of the run, or None if the run produced no data
+        """
+        self.results[value] = result
+
+    def meets_slo(self, value):
+        result = self.results[value]
+        if result is None:
+            return False
+        return self.p99_slo is None or result['p99'] <= self.p99_slo
+
+    def next_value(self):
+        """
+        :return: the value of the parameter for the next run, or None if the sweep is finished
+        """
+        for value in self.values:
+            if value not in self.results:
+                return value
+            if self.p99_slo is not None and not self.meets_slo(value):
+                break
+        else:
+            return None
+        if self.p99_slo is None:
+            return None
+
+        # bisect between the highest value that met the SLO and the lowest value that did not
+        failed = min(value for value in self.results if not self.meets_slo(value))
+        met = [value for value in self.results if self.meets_slo(value) and value < failed]
+        if len(met) == 0 or not isinstance(failed, (int, long)):
+            return None
+        low = max(met)
+        if failed - low <= 1:
+            return None
+        return (low + failed) // 2
+
+    def steps(self):
+        """
+        :return: a list of (value, result) tuples for every run that produced data, ordered by value
+        """
+        return [(value, self.results[value]) for value in sorted(self.results) if self.results[value] is not None]
+
+    def knee(self):
+        """
+        The knee is the highest value before the mean latency grows faster than the throughput, i.e. where adding
+        concurrency starts to mostly add queueing
+        :return: a tuple (value, result), or None if no run produced data
+        """
+        steps = self.steps()
+        if len(steps) == 0:
+            return None
+        for (value, result), (next_value, next_result) in zip(steps, steps[1:]):
+            if result['throughput'] <= 0 or result['latency'] <= 0:
+                continue
+            throughput_growth = next_result['throughput'] / result['throughput']
+            latency_growth = next_result['latency'] / result['latency']
+            if latency_growth > throughput_growth:
+                return value, result
+        return steps[-1]
+
+    def max_sustainable(self):
+        """
+        :return: a tuple (value, result) of the run with the highest throughput that met the SLO, or None
+        """
+        steps = [(value, result) for value, result in self.steps() if self.meets_slo(value)]
+        if len(steps) == 0:
+            return None
+        return max(steps, key=lambda step: step[1]['throughput'])
+
+    def report(self):
+        """
+        :return: a human readable summary of the sweep
+        """
+        lines = ['Sweep of ' + self.parameter]
+        for value, result in self.steps():
+            lines.append('\t%s: throughput %s, latency %s, p99 latency %s, fail percentage %s'
+                         % (value, significant_figures(result['throughput'], 4),
+                            significant_figures(result['latency'], 4), significant_figures(result['p99'], 4),
+                            significant_figures(result['fail_percentage'], 4)))
+        knee = self.knee()
+        if knee is not None:
+            lines.append('Knee at %s = %s (throughput %s, p99 latency %s)'
+                         % (self.parameter, knee[0], significant_figures(knee[1]['throughput'], 4),
+                            significant_figures(knee[1]['p99'], 4)))
+        if self.p99_slo is not None:
+            best = self.max_sustainable()
+            if best is None:
+                lines.append('No run met the p99 latency SLO of %s' % self.p99_slo)
+            else:
+                lines.append('Maximum sustainable throughput under the p99 latency SLO of %s is %s at %s = %s'
+                             % (self.p99_slo, significant_figures(best[1]['throughput'], 4), self.parameter, best[0]))
+        return '\n'.join(lines)
@@ -5,14 +5,28 @@ import datetime
 import csv
 import yaml
 import logging
+import collections
+import threading
+import multiprocessing
+import numpy
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 
 from network_cjl.Network import *
 from TBC.core.Log import *
+from TBC.core.LogMatrix import LogMatrix, significant_figures_array
+from TBC.core.LiveMetrics import LiveMetrics
+from TBC.core.MetricsServer import MetricsServer
+from TBC.core.Sweep import Sweep
+from TBC.core.Phases import validate_target_rate, validate_phases, total_duration, phase_names
+from TBC.core.Profiler import merge_samples
 from TBC.core.Historian import Historian
 from TBC.benchmarks.benchmark_locator import *
 from TBC.interfaces.interface_locator import *
 from TBC.utility.Numbers import significant_figures
+from TBC.utility.Histogram import Histogram, histogram_from_bins
+from TBC.utility import Clock
+from TBC.utility.SteadyState import mser_truncation, batch_means_interval, relative_precision
 
 
 class TBCMaster(object):
@@ -55,6 +69,9 @@ class TBCMaster(object):
         if self.graph:
             os.mkdir(self.datadir + '/graph')
 
+        # csv files and graphs are written here, each step of a sweep has its own directory
+        self.output_dir = self.datadir
+
         if self.log_config:
             fObj = open(self.datadir + '/config.yaml', 'w')
             yaml.dump(config, fObj)
@@ -62,17 +79,59 @@ class TBCMaster(object):
 
         self.nm = Network(port)
         self.nm.register_listener('results', self.results_callback)
+        self.nm.register_listener('frames', self.frames_callback)
         self.nm.register_listener('finished_loading', self.finished_loading_callback)
+        self.nm.register_listener('pong', self.pong_callback)
         self.endpoints = []
 
         self.loaded_nodes = 0
         self.loaded_senders = [] # don't double count if a message is sent more than once
-        self.results = []
         self.results_senders = [] # keep track of the endpoint ID of nodes that have already sent results
 
-        self.load_is_finished = False
-        self.run_is_finished = False
-        self.wait_rate_limiter = 0.01
+        # results are streamed from the nodes while the benchmark runs and merged into a LogMatrix
+        self.matrix = None
+        self.chunks_received = {} # endpoint -> set of the sequence numbers of the LogChunks received
+        self.chunks_expected = {} # endpoint -> the number of LogChunks that the node sent
+        self.results_lock = threading.Lock()
+        self.analysis_started = False
+
+        # the throughput and latency of all events over the analyzed frames of the last run, see measure()
+        self.run_result = None
+
+        # the time at which the nodes started the last run, in the clock of this master
+        self.start_time = None
+
+        # endpoint -> the number of CPUs of the node
+        self.cpu_counts = {}
+
+        # the merged profiles of all nodes for the last run (if profile is configured), {collapsed stack: samples}
+        self.profile = {}
+
+        # if metrics_port is configured then the streamed frames are also served over HTTP during the run
+        self.live_metrics = None
+        self.metrics_server = None
+
+        # every node starts at the same time, which is scheduled a little in the future.  The clock offset of each
+        # node is estimated with a few ping round trips before the start.
+        self.clock_samples = {} # endpoint -> list of (master send time, node time, master receive time)
+        self.clock_offsets = {} # endpoint -> the amount by which the node's clock is ahead of the master's
+        self.clock_samples_lock = threading.Lock()
+        self.clock_samples_complete = multiprocessing.Event()
+
+        # the waits of the threading module poll in Python 2, multiprocessing events block until they are set
+        self.load_is_finished = multiprocessing.Event()
+        self.run_is_finished = multiprocessing.Event()
+
+        # endpoints that have not acknowledged the shutdown message yet
+        self.shutdown_pending = set()
+        self.shutdown_is_acknowledged = multiprocessing.Event()
+        self.shutdown_timeout = 4
+
+        # the latency percentiles that are reported for every frame, {name: percentile}
+        self.frame_percentiles = collections.OrderedDict([('p50', 0.5),
+                                                          ('p90', 0.9),
+                                                          ('p99', 0.99),
+                                                          ('p99.9', 0.999)])
 
         self.logger = logging.getLogger()
 
@@ -95,13 +154,16 @@ class TBCMaster(object):
     def stop_failure_callback(self, message, (host, port), result):
         if not result:
             self.logger.error('Unable to contact node %s:%d when stopping benchmark', host, port)
-            self.load_is_finished = True
-            self.run_is_finished = True
+            self.load_is_finished.set()
+            self.run_is_finished.set()
             self.close()
 
-    def shutdown_failure_callback(self, message, (host, port), result):
+    def shutdown_callback(self, message, (host, port), result):
         if not result:
             self.logger.error('Unable to contact node %s:%d when shutting down cluster', host, port)
+        self.shutdown_pending.discard((host, port))
+        if len(self.shutdown_pending) == 0:
+            self.shutdown_is_acknowledged.set()
 
     def load_failure_callback(self, message, (host, port), result):
         if not result:
@@ -137,18 +199,106 @@ class TBCMaster(object):
         if self.loaded_nodes == self.config['load_nodes']:
             postload = get_benchmark_postload(self.config['benchmark'], self.config)
             postload()
-            self.load_is_finished = True
+            self.load_is_finished.set()
+
+    def pong_callback(self, message, (host, port)):
+        """
+        Expects message.payload to have the form (master send time, node time)
+        """
+        received = Clock.now()
+        sent, node_time = message.payload
+        with self.clock_samples_lock:
+            samples = self.clock_samples.setdefault((host, port), [])
+            if (sent, node_time, received) in samples:
+                return
+            samples.append((sent, node_time, received))
+            if all(len(self.clock_samples.get(endpoint, [])) >= self.config.get('clock_sync_pings', 5)
+                   for endpoint in self.endpoints):
+                self.clock_samples_complete.set()
+
+    def synchronize_clocks(self):
+        """
+        Estimate the offset between the clock of every node and the clock of this master.  Each node answers a few
+        pings with its current time, and the offset is taken from the round trip with the smallest delay, assuming
+        that the node's reply was sent halfway through the round trip.
+        """
+        pings = self.config.get('clock_sync_pings', 5)
+        for ping in xrange(pings):
+            for endpoint in self.endpoints:
+                self.nm.send(Message('ping', Clock.now()),
+                             endpoint,
+                             timeout=0.1,
+                             request_ack=True,
+                             max_sequential_failures=10)
+            time.sleep(0.01)
+        self.clock_samples_complete.wait(self.config.get('clock_sync_timeout', 5.0))
+
+        with self.clock_samples_lock:
+            for endpoint in self.endpoints:
+                samples = self.clock_samples.get(endpoint)
+                if not samples:
+                    self.logger.warning('Node %s:%d did not answer any pings, assuming that its clock is '
+                                        'synchronized', endpoint[0], endpoint[1])
+                    self.clock_offsets[endpoint] = 0.0
+                    continue
+                sent, node_time, received = min(samples, key=lambda sample: sample[2] - sample[0])
+                self.clock_offsets[endpoint] = node_time - (sent + received) / 2.0
+                self.logger.info('Clock offset of node %s:%d is %.6f s (round trip %.6f s)',
+                                 endpoint[0], endpoint[1], self.clock_offsets[endpoint], received - sent)
 
     def wait_for_load(self):
         """
         This funciton will not return until loading is finished
         """
-        while not self.load_is_finished:
-            time.sleep(self.wait_rate_limiter)
+        self.load_is_finished.wait()
+
+    def reset_run(self):
+        """
+        Forget the results of the previous run so that the benchmark can be run again in the same session
+        """
+        self.results_senders = []
+        self.chunks_received = {}
+        self.chunks_expected = {}
+        self.analysis_started = False
+        self.run_result = None
+        self.profile = {}
+        self.cpu_counts = {}
+        self.run_is_finished.clear()
+        self.clock_samples = {}
+        self.clock_offsets = {}
+        self.clock_samples_complete.clear()
 
     def run(self):
-        start_message = Message('start', self.config)
+        self.reset_run()
+        self.matrix = LogMatrix(int(self.config['log_framerate']),
+                                self.config.get('log_latency_significant_digits', 3))
+        if self.config.get('metrics_port') is not None:
+            self.live_metrics = LiveMetrics(int(self.config['log_framerate']),
+                                            self.config.get('log_latency_significant_digits', 3),
+                                            self.config.get('metrics_window', 10))
+            if self.metrics_server is None:
+                self.metrics_server = MetricsServer(self.live_metrics,
+                                                    int(self.config['metrics_port']),
+                                                    self.config.get('metrics_host', '127.0.0.1'))
+                self.metrics_server.start()
+            self.metrics_server.metrics = self.live_metrics
+
+        # with phases, the duration of the run is the sum of the durations of the phases
+        duration = self.config['duration']
+        validate_target_rate(self.config.get('target_rate'))
+        if self.config.get('phases') is not None:
+            validate_phases(self.config['phases'], self.config.get('target_rate'))
+            duration = total_duration(self.config['phases'])
+
+        Clock.anchor()
+        self.synchronize_clocks()
+
+        # start every node on the same frame boundary, far enough in the future for the start message to arrive
+        frame_period = 1.0 / self.config['log_framerate']
+        start_time = Clock.now() + self.config.get('start_delay', 2.0)
+        start_time = (int(start_time / frame_period) + 1) * frame_period
         for endpoint in self.endpoints:
+            start_message = Message('start', (self.config, start_time, self.clock_offsets[endpoint]))
             self.nm.send(start_message,
                          endpoint,
                          timeout=1,
@@ -156,7 +306,8 @@ class TBCMaster(object):
                          max_sequential_failures=3,
                          request_ack=True)
 
-        time.sleep(self.config['duration'])
+        self.start_time = start_time
+        self.wait_for_end(start_time + duration)
 
         stop_message = Message('stop', None)
         for endpoint in self.endpoints:
@@ -167,102 +318,410 @@ class TBCMaster(object):
                          max_sequential_failures=3,
                          request_ack=True)
 
+    def wait_for_end(self, end_time):
+        """
+        Sleep until end_time.  If steady_state_precision is configured then return as soon as the results that have
+        been streamed so far are precise enough.
+        """
+        precision = self.config.get('steady_state_precision')
+        check_period = self.config.get('log_stream_period', 1.0)
+        while Clock.now() < end_time:
+            time.sleep(max(0.0, min(check_period, end_time - Clock.now())))
+            if precision is not None and self.is_precise(precision):
+                self.logger.info('Steady state results are within %s%% at 95%% confidence, ending the run %.1f s early',
+                                 precision * 100, max(0.0, end_time - Clock.now()))
+                return
+
+    def is_precise(self, precision):
+        """
+        :param precision: the largest acceptable half width of the 95% confidence intervals, relative to the mean
+        :return: True if the mean throughput and latency of the steady state that has been streamed so far are known
+                    to within precision
+        """
+        with self.results_lock:
+            if len(self.matrix.sources) < len(self.endpoints):
+                return False
+            first_frame, last_frame = self.matrix.overlap()
+            # clip only consolidates the per frame statistics, the latency histograms are left for analyze_data
+            if first_frame >= last_frame or not self.matrix.clip(0):
+                return False
+            throughput, latency = self.matrix.aggregate_series()
+
+        warmup = self.find_warmup(throughput, latency)
+        steady_frames = len(throughput) - warmup
+        if steady_frames * self.matrix.frame_period < self.config.get('steady_state_min_duration', 10):
+            return False
+        return (relative_precision(throughput[warmup:]) <= precision and
+                relative_precision(latency[warmup:]) <= precision)
+
+    def find_warmup(self, throughput, latency):
+        """
+        :param throughput: an array with the total throughput of each frame
+        :param latency: an array with the mean latency of each frame
+        :return: the number of frames at the front of the series that belong to the warm-up
+        """
+        return max(mser_truncation(throughput), mser_truncation(latency))
+
     def wait_for_run(self):
         """
         This funciton will not return until running is finished
         """
-        while not self.run_is_finished:
-            time.sleep(self.wait_rate_limiter)
+        self.run_is_finished.wait()
+
+    def sweep(self):
+        """
+        Run the benchmark once for every value of the concurrency parameter in the 'sweep' section of the config
+        and report the knee of the throughput / latency curve.  The data is only loaded once, before the sweep.
+        This function will not return until the sweep is finished.
+        :return: a Sweep
+        """
+        sweep = Sweep(self.config['sweep']['parameter'],
+                      self.config['sweep']['values'],
+                      self.config['sweep'].get('p99_slo'))
+        original_value = self.config.get(sweep.parameter)
+
+        value = sweep.next_value()
+        while value is not None:
+            self.logger.info('Running benchmark with %s = %s', sweep.parameter, value)
+            self.config[sweep.parameter] = value
+            self.output_dir = self.datadir + '/' + sweep.parameter + '_' + str(value)
+            if self.csv:
+                os.makedirs(self.output_dir + '/csv')
+            if self.graph:
+                os.makedirs(self.output_dir + '/graph')
+            self.run()
+            self.wait_for_run()
+            sweep.add_result(value, self.run_result)
+            value = sweep.next_value()
+
+        self.config[sweep.parameter] = original_value
+        self.output_dir = self.datadir
+
+        self.logger.info(sweep.report())
+        if self.csv:
+            self.write_sweep_csv(sweep)
+        if self.graph:
+            self.generate_sweep_graph(sweep)
+        return sweep
 
     def close(self, shutdown=True):
-        if shutdown:
+        if shutdown and len(self.endpoints) > 0:
+            # wait until every node acknowledged the shutdown (or could not be reached) before closing the network
+            self.shutdown_pending = set(self.endpoints)
             shutdown_message = Message('shutdown', None)
             for endpoint in self.endpoints:
                 self.nm.send(shutdown_message,
                             endpoint,
                             timeout=1,
-                            callback=self.shutdown_failure_callback,
+                            callback=self.shutdown_callback,
                             request_ack=True,
                             max_sequential_failures=3)
-            time.sleep(4)
+            if not self.shutdown_is_acknowledged.wait(self.shutdown_timeout):
+                self.logger.warning('%d nodes did not acknowledge the shutdown', len(self.shutdown_pending))
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
         self.nm.close()
 
+    def frames_callback(self, message, (host, port)):
+        """
+        Merge a LogChunk that a node streamed while the benchmark is running
+        """
+        with self.results_lock:
+            self.add_chunk(inflate(message.payload, LogChunk), (host, port))
+        self.check_results()
+
     def results_callback(self, message, (host, port)):
-        if (host, port) in self.results_senders:
-            return
-        self.results_senders.append((host, port))
-        self.results.append(inflate(message.payload, Logger))
+        """
+        Merge the last LogChunk of a node
+        """
+        with self.results_lock:
+            if (host, port) in self.results_senders:
+                return
+            self.results_senders.append((host, port))
+            chunk = inflate(message.payload, LogChunk)
+            self.chunks_expected[(host, port)] = chunk.sequence + 1
+            self.add_chunk(chunk, (host, port))
+            self.matrix.set_timer_info(chunk.timer, chunk.timer_overhead, chunk.timer_resolution)
+            merge_samples(self.profile, chunk.profile)
+            self.cpu_counts[(host, port)] = chunk.cpu_count
         self.logger.info('Recieved logs from %s:%d.  Waiting for %d more nodes to return results.',
-                         host, port, len(self.endpoints) - len(self.results))
-        if len(self.results) == len(self.endpoints):
-            self.analyze_data()
+                         host, port, len(self.endpoints) - len(self.results_senders))
+        self.logger.info('Node %s:%d measured latency with %s (overhead %s us, resolution %s us)',
+                         host, port, chunk.timer,
+                         significant_figures(chunk.timer_overhead * 1000000, 3),
+                         significant_figures(chunk.timer_resolution * 1000000, 3))
+        self.check_results()
+
+    def add_chunk(self, chunk, endpoint):
+        """
+        Merge a LogChunk into the LogMatrix, ignoring chunks that were already received
+        """
+        received = self.chunks_received.setdefault(endpoint, set())
+        if chunk.sequence in received:
+            return
+        received.add(chunk.sequence)
+        self.matrix.add_frames(endpoint, chunk.frames)
+        self.matrix.add_latency_bins(chunk.latency_bins, chunk.corrected_latency_bins)
+        if self.live_metrics is not None:
+            self.live_metrics.add_frames('%s:%d' % endpoint, chunk.frames)
+
+    def check_results(self):
+        """
+        Analyze the results once every node has sent all of its LogChunks
+        """
+        with self.results_lock:
+            if self.analysis_started or len(self.results_senders) < len(self.endpoints):
+                return
+            for endpoint in self.endpoints:
+                if len(self.chunks_received.get(endpoint, ())) < self.chunks_expected.get(endpoint, 1):
+                    return
+            # only analyze once, even if the last chunks arrive on different threads
+            self.analysis_started = True
+        self.analyze_data()
 
     def analyze_data(self):
         framesize = 1.0 / int(self.config['log_framerate'])
 
-        self.results = clip_logs(self.results, framesize, self.config['log_dead_frames'])
-        average_log = average_logs(self.results)
+        if len(self.profile) > 0:
+            self.summarize_profile()
+            self.write_profile()
+
+        matrix = self.matrix
+        dead_frames = self.config['log_dead_frames']
+        if dead_frames == 'auto':
+            # trim the detected warm-up, and the last frame which may have been cut short by the stop
+            if not matrix.clip(0, 1):
+                self.run_is_finished.set()
+                return
+            dead_frames = self.find_warmup(*matrix.aggregate_series())
+            matrix.clip(dead_frames, 1)
+        elif not matrix.clip(dead_frames):
+            self.run_is_finished.set()
+            return
+        self.report_window(matrix, dead_frames)
+        self.run_result = self.measure(matrix)
+
+        self.logger.debug('Analyzing %d frames of %d events', matrix.number_of_frames(), len(matrix.events))
+
+        self.summarize(matrix)
 
-        self.logger.debug(str(average_log))
+        frame_phases = None
+        if self.config.get('phases') is not None:
+            frame_phases = self.summarize_phases(matrix)
 
-        self.summarize(average_log)
+        load_generator = self.summarize_load_generators(matrix)
 
-        event_info = self.extract_frame_event_info(average_log)
+        event_info = self.extract_frame_event_info(matrix)
         if self.csv:
-            self.write_frame_csv(event_info, framesize)
-            self.write_latency_csvs(average_log.latency_bins, average_log.latency_bin_size)
+            self.write_frame_csv(event_info, framesize, frame_phases, load_generator)
+            self.write_latency_csvs(matrix.latency_bins, matrix.latency_significant_digits)
+            self.write_latency_csvs(matrix.corrected_latency_bins, matrix.latency_significant_digits,
+                                    suffix='_corrected')
         if self.graph:
             self.generate_frame_graphs(event_info, framesize)
-            self.generate_latency_graphs(average_log.latency_bins, average_log.latency_bin_size)
+            self.generate_frame_percentile_graphs(event_info, framesize)
+            self.generate_latency_heatmaps(matrix, framesize)
+            self.generate_latency_graphs(matrix.latency_bins, matrix.latency_significant_digits)
 
-        self.run_is_finished = True
+        self.run_is_finished.set()
 
-    def summarize(self, log):
+    def measure(self, matrix, selected_frames=None, event_id=None):
+        """
+        :param matrix: a clipped LogMatrix
+        :param selected_frames: if not None, a boolean array that selects the clipped frames to measure
+        :param event_id: if not None, only measure this event, otherwise measure all events together
+        :return: a dictionary with the throughput (operations per second), the mean latency, the p99 latency and the
+                    fail percentage over the frames
+        """
+        if selected_frames is None:
+            selected_frames = numpy.ones(matrix.number_of_frames(), dtype=bool)
+        events = slice(None) if event_id is None else slice(event_id, event_id + 1)
+        num = matrix.num[selected_frames, events].sum()
+
+        frames, event_ids, indexes, counts = matrix.frame_bins()
+        selected = selected_frames[frames]
+        if event_id is not None:
+            selected &= event_ids == event_id
+        bins = numpy.bincount(indexes[selected], weights=counts[selected])
+        histogram = histogram_from_bins(dict((int(index), int(bins[index])) for index in numpy.flatnonzero(bins)),
+                                        matrix.latency_significant_digits)
+        return {'throughput': num / (selected_frames.sum() * matrix.frame_period),
+                'latency': matrix.total_time[selected_frames, events].sum() / num if num > 0 else 0.0,
+                'p99': histogram.value_at_percentile(0.99) or 0.0,
+                'fail_percentage': matrix.failed[selected_frames, events].sum() / num * 100 if num > 0 else 0.0}
+
+    def summarize_phases(self, matrix):
+        """
+        Log the throughput and latency of every event in every phase, and write them to a csv
+        :param matrix: a clipped LogMatrix
+        :return: a list with the name of the phase of every clipped frame
+        """
+        phases = self.config['phases']
+        names = phase_names(phases)
+
+        # the phase of every clipped frame, by the time at which the frame starts.  A Logger labels each frame with
+        # the start of the frame before it (its first frame starts one period before the run), hence the + 1
+        frame_times = (matrix.first_frame + 1 + numpy.arange(matrix.number_of_frames())) * matrix.frame_period
+        ends = numpy.cumsum([phase['duration'] for phase in phases])
+        frame_phase = numpy.minimum(numpy.searchsorted(ends, frame_times - self.start_time + matrix.frame_period / 2,
+                                                       side='right'),
+                                    len(phases) - 1)
+
+        summary = ['Phase Summary']
+        rows = [('Phase', 'Start', 'End', 'Event', 'Throughput', 'Latency', 'p99 latency', 'Fail percentage')]
+        for index, name in enumerate(names):
+            selected_frames = frame_phase == index
+            if not numpy.any(selected_frames):
+                continue
+            start = ends[index] - phases[index]['duration']
+            summary.append('%s (%s s to %s s)' % (name, start, ends[index]))
+            for event_id, event in enumerate(matrix.events):
+                result = self.measure(matrix, selected_frames, event_id)
+                if result['throughput'] == 0:
+                    continue
+                summary.append('\t%s: throughput %s, latency %s, p99 latency %s, fail percentage %s'
+                               % (event, significant_figures(result['throughput'], 4),
+                                  significant_figures(result['latency'], 4), significant_figures(result['p99'], 4),
+                                  significant_figures(result['fail_percentage'], 4)))
+                rows.append((name, start, ends[index], event,
+                             significant_figures(result['throughput'], 4),
+                             significant_figures(result['latency'], 4),
+                             significant_figures(result['p99'], 4),
+                             significant_figures(result['fail_percentage'], 4)))
+        self.logger.info('\n'.join(summary))
 
-        # get a set of all event types that were observed
-        events = {}
-        for frame in log.frames:
-            for event in frame.events:
-                if event not in events:
-                    events[event] = {}
+        if self.csv:
+            fObj = open(self.output_dir + '/csv/phase_data.csv', 'w')
+            csvw = csv.writer(fObj)
+            csvw.writerows(rows)
+            fObj.close()
 
-        # extract data from the frames
-        for event in events:
+        return [names[index] for index in frame_phase]
 
-            frames_with_event = 0
-            total = 0
-            total_fails = 0
-            total_throughput = 0
-            total_latency = 0
+    def summarize_load_generators(self, matrix):
+        """
+        Log how busy the worker processes of every node were and how much of the clients' time was spent inside of
+        interface calls, and warn if a node's workers were saturated (in which case the results may describe the
+        load generator rather than the database)
+        :param matrix: a clipped LogMatrix
+        :return: a dictionary of the form {name: [frame1, frame2, ...]} with the worker CPU utilization, the fraction
+                    of the clients' time spent in interface calls, the CPU time per operation and the rows and bytes
+                    per second that the clients read in every frame, or None if the nodes did not report their CPU
+                    time
+        """
+        cpu = matrix.counter_series('cpu')
+        if len(cpu) == 0:
+            return None
+        client = matrix.counter_series('client')
+
+        # the client time that the workers of one node had available in every frame.  The CPU time that was
+        # available is limited by the number of CPUs of the node as well as the number of processes (each process
+        # can use at most one CPU because of the GIL).
+        processes = self.config['processes_per_node']
+        client_available = processes * self.config.get('clients_per_process', 1) * matrix.frame_period
+        frames = matrix.number_of_frames()
+        threshold = self.config.get('load_generator_cpu_warning', 0.8)
+
+        cpu_available = {}
+        for source in cpu:
+            cpu_available[source] = min(processes, self.cpu_counts.get(source) or processes) * matrix.frame_period
+
+        summary = ['Load Generator Summary']
+        for source in sorted(cpu):
+            utilization = cpu[source].sum() / (frames * cpu_available[source])
+            summary.append('\t%s:%d: worker CPU %s%%, time in client calls %s%%'
+                           % (source[0], source[1], significant_figures(utilization * 100, 3),
+                              significant_figures(client[source].sum() / (frames * client_available) * 100, 3)))
+            if utilization > threshold:
+                self.logger.warning('The workers of node %s:%d used %s%% of the CPU time available to them, the load '
+                                    'generator may be the bottleneck instead of the database', source[0], source[1],
+                                    significant_figures(utilization * 100, 3))
+
+        num = matrix.num.sum(axis=1)
+        total_cpu = sum(cpu.values())
+        total_client = sum(client.values())
+        if num.sum() > 0:
+            # the wall clock time that clients spend outside of interface calls is not a measure of the harness's
+            # overhead, with a target_rate or paused phases most of it is idle.  Only CPU time is.
+            summary.append('\tworker CPU time per operation %s s' % significant_figures(total_cpu.sum() / num.sum(), 3))
+
+        # interfaces that do not read results (or nodes that do not count them) report no rows
+        total_rows = sum(matrix.counter_series('rows').values())
+        read_results = numpy.any(total_rows > 0)
+        if read_results:
+            total_bytes = sum(matrix.counter_series('bytes').values())
+            duration = frames * matrix.frame_period
+            summary.append('\tresults read: %s rows/s, %s bytes/s'
+                           % (significant_figures(total_rows.sum() / duration, 4),
+                              significant_figures(total_bytes.sum() / duration, 4)))
+        self.logger.info('\n'.join(summary))
 
-            for frame in log.frames:
-                if event in frame.events:
-                    frames_with_event += 1
-                    total += frame.events[event].num
-                    total_fails += frame.events[event].failed
-                    total_throughput += frame.events[event].tput
-                    total_latency += frame.events[event].latency
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cpu_per_operation = numpy.where(num > 0, total_cpu / num, -1)
+        load_generator = {
+            'worker cpu': significant_figures_array(total_cpu / sum(cpu_available.values()), 4).tolist(),
+            'client time': significant_figures_array(total_client / (len(cpu) * client_available), 4).tolist(),
+            'cpu per operation': significant_figures_array(cpu_per_operation, 4).tolist()}
+        if read_results:
+            load_generator['rows read per second'] = \
+                significant_figures_array(total_rows / matrix.frame_period, 4).tolist()
+            load_generator['bytes read per second'] = \
+                significant_figures_array(total_bytes / matrix.frame_period, 4).tolist()
+        return load_generator
+
+    def report_window(self, matrix, dead_frames):
+        """
+        Log the frames that are analyzed and the precision of the mean throughput and latency over them
+        :param matrix: a clipped LogMatrix
+        :param dead_frames: the number of frames that were trimmed at the front
+        """
+        throughput, latency = matrix.aggregate_series()
+        throughput_mean, throughput_error = batch_means_interval(throughput)
+        latency_mean, latency_error = batch_means_interval(latency)
+        frames = matrix.number_of_frames()
+        self.logger.info('Analyzing %d frames (%s s) after trimming %d warm-up frames (%s s).  '
+                         'Throughput %s +/- %s, latency %s +/- %s (95%% confidence)',
+                         frames, significant_figures(frames * matrix.frame_period, 4),
+                         dead_frames, significant_figures(dead_frames * matrix.frame_period, 4),
+                         significant_figures(throughput_mean, 4), significant_figures(throughput_error, 2),
+                         significant_figures(latency_mean, 4), significant_figures(latency_error, 2))
+
+    def summarize(self, matrix):
+        """
+        Log a summary of the benchmark and record it with the Historian
+        :param matrix: a clipped LogMatrix
+        """
+
+        # extract data from the frames, only the frames that contain an event are averaged
+        present = matrix.num > 0
+        frames_with_event = present.sum(axis=0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            throughput = significant_figures_array(matrix.num / matrix.frame_period, 4)
+            latency = significant_figures_array(numpy.where(present, matrix.total_time / matrix.num, 0), 4)
+            average_throughput = throughput.sum(axis=0) / frames_with_event
+            average_latency = latency.sum(axis=0) / frames_with_event
+            fail_percentage = matrix.failed.sum(axis=0) / matrix.num.sum(axis=0) * 100
 
-            events[event]['average_throughput'] = significant_figures(total_throughput / float(frames_with_event), 4)
-            events[event]['average_latency'] = significant_figures(total_latency / float(frames_with_event), 4)
-            events[event]['fail_percentage'] = significant_figures(total_fails / float(total) * 100, 4)
+        # get a set of all event types that were observed
+        events = {}
+        for event_id, event in enumerate(matrix.events):
+            if frames_with_event[event_id] == 0:
+                continue
+            events[event] = {}
+            events[event]['average_throughput'] = significant_figures(average_throughput[event_id], 4)
+            events[event]['average_latency'] = significant_figures(average_latency[event_id], 4)
+            events[event]['fail_percentage'] = significant_figures(fail_percentage[event_id], 4)
 
         # extract data from the latency bins
         percentiles = [0.5, 0.9, 0.95, 0.99, 0.999]
         for event in events:
-            total = 0
-            for bin in log.latency_bins[event]:
-                total += log.latency_bins[event][bin]
-            for percentile in percentiles:
-                observed = 0
-                result = None
-                for bin in log.latency_bins[event]:
-                    observed += log.latency_bins[event][bin]
-                    if float(observed) / total >= percentile:
-                        result = bin
-                        break
-                data_name = str(percentile*100) + 'th_percentile_latency'
-                events[event][data_name] = significant_figures(result * log.latency_bin_size, 4)
+            self.summarize_latency_bins(events[event], '', matrix.latency_bins[event],
+                                        matrix.latency_significant_digits, percentiles)
+            # when the load is rate controlled, also report latency measured from the scheduled start times
+            if event in matrix.corrected_latency_bins:
+                self.summarize_latency_bins(events[event], 'corrected_', matrix.corrected_latency_bins[event],
+                                            matrix.latency_significant_digits, percentiles)
 
         summary = ['Benchmark Summary']
         for event in sorted(events.keys()):
@@ -278,10 +737,24 @@ class TBCMaster(object):
             # self.historian.clean(self.config['history']['benchmark_id'], 100)
             # print self.historian.get_statistics_list(self.config['history']['benchmark_id'], 'average_latency', 'RandomRW/read')
 
-    def extract_frame_event_info(self, log):
+    def summarize_latency_bins(self, summary, prefix, bins, significant_digits, percentiles):
+        """
+        Add latency percentiles to a summary
+        :param summary: a dictionary that the percentiles are added to
+        :param prefix: a string that is prepended to the name of each statistic
+        :param bins: a dictionary of the form {histogram index: count}
+        :param significant_digits: the significant digits of the histogram that the bins were taken from
+        :param percentiles: a list of percentiles, each between 0 and 1
+        """
+        histogram = histogram_from_bins(bins, significant_digits)
+        for percentile in percentiles:
+            data_name = prefix + str(percentile*100) + 'th_percentile_latency'
+            summary[data_name] = significant_figures(histogram.value_at_percentile(percentile), 4)
+
+    def extract_frame_event_info(self, matrix):
         """
-        Given a list a Logger object, extract information for each event type from the frames
-        :param log: a Logger object
+        Given a clipped LogMatrix, extract information for each event type from the frames
+        :param matrix: a clipped LogMatrix
         :return: a dictionary of the following form:
 
         {'event_type': {
@@ -289,48 +762,49 @@ class TBCMaster(object):
                             'failed': [frame1, frame2, frame3, ...]
                             'latency': [frame1, frame2, frame3, ...]
                             'throughput': [frame1, frame2, frame3, ...]
+                            'p50': [frame1, frame2, frame3, ...]
+                            'p90': [frame1, frame2, frame3, ...]
+                            'p99': [frame1, frame2, frame3, ...]
+                            'p99.9': [frame1, frame2, frame3, ...]
                         }
         'event_type': { ... }
         }
         """
+        # frames that don't contain a particular event have a latency of -1
+        present = matrix.num > 0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            latency = significant_figures_array(numpy.where(present, matrix.total_time / matrix.num, -1), 4)
+        throughput = significant_figures_array(matrix.num / matrix.frame_period, 4)
+        percentiles = significant_figures_array(matrix.frame_percentiles(self.frame_percentiles.values()), 4)
+        percentiles[numpy.isnan(percentiles)] = -1
+
         result = {}
-        # get a set of all event types that were observed
-        events = set()
-        for frame in log.frames:
-            for event in frame.events:
-                events.add(event)
-        # ensure that each event type has an entry in the result
-        for event in events:
-            result[event] = {'total': [],
-                             'failed': [],
-                             'latency': [],
-                             'throughput': []
+        for event_id, event in enumerate(matrix.events):
+            if not numpy.any(present[:, event_id]):
+                continue
+            result[event] = {'total': matrix.num[:, event_id].astype(int).tolist(),
+                             'failed': matrix.failed[:, event_id].astype(int).tolist(),
+                             'latency': latency[:, event_id].tolist(),
+                             'throughput': throughput[:, event_id].tolist()
                              }
-        for frame_number, frame in enumerate(log.frames):
-            # set some default values (in case this frame doesn't have a particular event)
-            for event in result:
-                result[event]['total'].append(0)
-                result[event]['failed'].append(0)
-                result[event]['latency'].append(-1)
-                result[event]['throughput'].append(0)
-            for event in frame.events:
-                result[event]['total'][frame_number] = frame.events[event].num
-                result[event]['failed'][frame_number] = frame.events[event].failed
-                result[event]['latency'][frame_number] = frame.events[event].latency
-                result[event]['throughput'][frame_number] = frame.events[event].tput
+            for number, stat in enumerate(self.frame_percentiles):
+                result[event][stat] = percentiles[number, :, event_id].tolist()
         return result
 
-    def write_frame_csv(self, data, framesize):
+    def write_frame_csv(self, data, framesize, frame_phases=None, load_generator=None):
         """
         Generate a csv file of the data from the log frames
         :param filename: the file name of the csv file to create
         :param data: an object with the same format as returned by self.extract_frame_event_info()
         :param framesize: the size, in seconds, of each frame
+        :param frame_phases: if not None, a list with the name of the phase of each frame
+        :param load_generator: if not None, the per frame load generator statistics returned by
+                                summarize_load_generators()
         """
 
         columns = []
 
-        filename = self.datadir + '/csv/frame_data.csv'
+        filename = self.output_dir + '/csv/frame_data.csv'
 
         for event_type in data:
             for stat in data[event_type]:
@@ -347,6 +821,14 @@ class TBCMaster(object):
             column.append(significant_figures(frame_number * framesize, 4))
         columns = [column] + columns
 
+        # the phase of each frame, if the run has phases
+        if frame_phases is not None:
+            columns.insert(1, ['phase'] + frame_phases)
+
+        if load_generator is not None:
+            for stat in sorted(load_generator):
+                columns.append(['load generator: ' + stat] + load_generator[stat])
+
         rows = []
         row_number = 0
         while row_number < len(columns[0]):
@@ -360,35 +842,106 @@ class TBCMaster(object):
         csvw.writerows(rows)
         fObj.close()
 
-    def write_latency_csvs(self, data, binsize):
+    def write_latency_csvs(self, data, significant_digits, suffix=''):
         """
-        Write several csvs with the latency bin information
-        :param filename: the path to a directory where the csvs should be stored
+        Write several csvs with the latency histogram information
         :param data: the object stored at Logger.latency_bins
-        :param binsize: the size of a bin
+        :param significant_digits: the significant digits of the histograms
+        :param suffix: a string appended to the name of each file
         """
 
-        #used for sorting a list of tuples
-        def key(tup):
-            return tup[0]
-
         for event in data:
 
-            filename = self.datadir + '/csv/' + event.replace('/', '-') + '.csv'
+            filename = self.output_dir + '/csv/' + event.replace('/', '-') + suffix + '.csv'
 
-            # construct a list of tuples
+            # construct a list of tuples, one per non-empty bucket
+            histogram = histogram_from_bins(data[event], significant_digits)
             bins = []
-            for bin in data[event]:
-                bins.append((significant_figures(bin * binsize, 4), data[event][bin]))
-            bins = sorted(bins, key=key)
+            for index, count in histogram.items():
+                bins.append((significant_figures(histogram.lowest_equivalent_value(index), 4),
+                             significant_figures(histogram.highest_equivalent_value(index), 4),
+                             count))
 
-            bins = [('Latency', 'Number of events')] + bins
+            bins = [('Latency', 'Latency upper bound', 'Number of events')] + bins
 
             fObj = open(filename, 'w')
             csvw = csv.writer(fObj)
             csvw.writerows(bins)
             fObj.close()
 
+    def summarize_profile(self, top=10):
+        """
+        Log the functions in which the clients spent the most samples
+        :param top: the number of functions to log
+        """
+        total = sum(self.profile.itervalues())
+        leaves = {}
+        for stack, count in self.profile.iteritems():
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+
+        lines = ['Profile Summary (%d samples)' % total]
+        for leaf, count in sorted(leaves.iteritems(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append('\t%s%%\t%s' % (significant_figures(100.0 * count / total, 3), leaf))
+        self.logger.info('\n'.join(lines))
+
+    def write_profile(self):
+        """
+        Write the merged profile in the collapsed stack format, e.g. for flamegraph.pl
+        """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        fObj = open(self.output_dir + '/profile.folded', 'w')
+        for stack, count in sorted(self.profile.iteritems()):
+            fObj.write('%s %d\n' % (stack, count))
+        fObj.close()
+
+    def write_sweep_csv(self, sweep):
+        """
+        Write a csv with the throughput and latency of every step of a sweep
+        """
+        rows = [(sweep.parameter, 'Throughput', 'Latency', 'p99 latency', 'Fail percentage')]
+        for value, result in sweep.steps():
+            rows.append((value,
+                         significant_figures(result['throughput'], 4),
+                         significant_figures(result['latency'], 4),
+                         significant_figures(result['p99'], 4),
+                         significant_figures(result['fail_percentage'], 4)))
+
+        fObj = open(self.datadir + '/csv/sweep.csv', 'w')
+        csvw = csv.writer(fObj)
+        csvw.writerows(rows)
+        fObj.close()
+
+    def generate_sweep_graph(self, sweep):
+        """
+        Generate a graph of the throughput and the p99 latency of every step of a sweep, with the knee marked
+        """
+        steps = sweep.steps()
+        if len(steps) == 0:
+            return
+        xaxis = [value for value, result in steps]
+
+        fig = plt.figure()
+        fig.suptitle('Sweep of ' + sweep.parameter)
+        ax = fig.add_subplot(111)
+        plt.xlabel(sweep.parameter)
+        ax.set_ylabel('Throughput')
+        ax.plot(xaxis, [result['throughput'] for value, result in steps], 'b-o')
+        ax.set_ylim([0, max(result['throughput'] for value, result in steps) * 1.1 or 1])
+
+        latency_ax = ax.twinx()
+        latency_ax.set_ylabel('p99 latency (ms)')
+        latency_ax.plot(xaxis, [result['p99'] * 1000.0 for value, result in steps], 'r-o')
+        latency_ax.set_ylim([0, max(result['p99'] * 1000.0 for value, result in steps) * 1.1 or 1])
+        if sweep.p99_slo is not None:
+            latency_ax.axhline(sweep.p99_slo * 1000.0, color='r', linestyle=':')
+
+        knee = sweep.knee()
+        ax.axvline(knee[0], color='k', linestyle='--')
+        fig.savefig(self.datadir + '/graph/sweep.png')
+        plt.close('all')
+
     def generate_frame_graphs(self, data, framesize):
         """
         Generate a small set of graphs
@@ -397,7 +950,7 @@ class TBCMaster(object):
 
         for event in data:
             for stat in data[event]:
-                if stat == 'total':
+                if stat == 'total' or stat in self.frame_percentiles:
                     continue
 
                 graph_name = event + '_' + stat
@@ -423,76 +976,130 @@ class TBCMaster(object):
                     ymax = 1
                 ax.set_ylim([0, ymax])
                 ax.set_xlim([0, max(xaxis)])
-                fig.savefig(self.datadir + '/graph/' + graph_name + '.png')
+                fig.savefig(self.output_dir + '/graph/' + graph_name + '.png')
                 plt.close('all')
 
-    def generate_latency_graphs(self, data, binsize):
+    def generate_frame_percentile_graphs(self, data, framesize):
         """
-        Generate graphs for latency bins
-        :param data: the object stored at Logger.latency_bins
-        :param binsize: the size of a bin
+        Generate a graph of the latency percentiles of each frame for each event
+        :param data: a set of data in the same format as produced by extract_frame_event_info()
         """
 
-        def key(tup):
-            return tup[0]
-
         for event in data:
+            graph_name = (event + '_percentiles').replace('/', '-')
+            title = event + ': latency percentiles'
 
-            filename = self.datadir + '/graph/' + event.replace('/', '-') + '_histogram.png'
-            title = event + ' Latency Histogram'
+            fig = plt.figure()
+            fig.suptitle(title)
+            ax = fig.add_subplot(111)
+            plt.xlabel('Elapsed Time (seconds)')
+            plt.ylabel('Latency (ms)')
+            xaxis = []
+            for point in xrange(len(data[event]['latency'])):
+                xaxis.append(point * framesize)
+            ymax = 0
+            for stat in self.frame_percentiles:
+                # frames without the event are left out of the graph
+                points = [(x, y * 1000.0) for x, y in zip(xaxis, data[event][stat]) if y >= 0]
+                if len(points) == 0:
+                    continue
+                ax.plot([x for x, y in points], [y for x, y in points], label=stat)
+                ymax = max(ymax, max(y for x, y in points))
+            ax.set_ylim([0, ymax * 1.1 if ymax > 0 else 1])
+            ax.set_xlim([0, max(xaxis) if len(xaxis) > 0 else 1])
+            ax.legend(loc='upper left')
+            fig.savefig(self.output_dir + '/graph/' + graph_name + '.png')
+            plt.close('all')
+
+    def generate_latency_heatmaps(self, log_matrix, framesize):
+        """
+        Generate a heatmap of the latency distribution over time for each event.  Each column is a frame and each row
+        is a power of two latency bucket.
+        :param log_matrix: a clipped LogMatrix
+        """
 
-            # construct a list of tuples
-            bins = []
-            for bin in data[event]:
-                bins.append((significant_figures(bin * binsize, 4), data[event][bin]))
-            bins = sorted(bins, key=key)
+        for event in log_matrix.events:
+            heatmap = log_matrix.latency_heatmap(event)
+            if heatmap is None:
+                continue
+            coarse, first_row, matrix = heatmap
+            last_row = first_row + len(matrix) - 1
+            number_of_frames = log_matrix.number_of_frames()
+
+            graph_name = (event + '_heatmap').replace('/', '-')
+            title = event + ': latency heatmap'
+
+            fig = plt.figure()
+            fig.suptitle(title)
+            ax = fig.add_subplot(111)
+            # use a logarithmic color scale so that rare, slow events are still visible
+            image = ax.imshow(matrix, aspect='auto', origin='lower', interpolation='nearest', norm=LogNorm(),
+                              extent=[0, number_of_frames * framesize, first_row - 0.5, last_row + 0.5])
+            ticks = range(first_row, last_row + 1)
+            ax.set_yticks(ticks)
+            ax.set_yticklabels([significant_figures(coarse.lowest_equivalent_value(row) * 1000.0, 3)
+                                for row in ticks])
+            plt.xlabel('Elapsed Time (seconds)')
+            plt.ylabel('Latency (ms)')
+            fig.colorbar(image, label='Number of events')
+            fig.savefig(self.output_dir + '/graph/' + graph_name + '.png')
+            plt.close('all')
+
+    def generate_latency_graphs(self, data, significant_digits):
+        """
+        Generate graphs for latency histograms
+        :param data: the object stored at Logger.latency_bins
+        :param significant_digits: the significant digits of the histograms
+        """
 
+        def trim(histogram):
+            """
+            :return: a list of (index, count) tuples without the tails on the left and right side
+            """
+            bins = histogram.items()
             # chop off the tail (on the right side)
             keep = .995
-            total = 0
-            for bin in bins:
-                total += bin[1]
             included = 0
             for index, bin in enumerate(bins):
                 included += bin[1]
-                if float(included) / float(total) > keep:
-                    bins = bins[:index]
+                if float(included) / float(histogram.total) > keep:
+                    bins = bins[:index+1]
                     break
-
-            # reduce the number of bins to a reasonable number by merging bins
-            optimal_number = 32
-            merge_factor = int(len(bins) / optimal_number)
-            if merge_factor > 1:
-                new_binsize = binsize * merge_factor
-                # populate the new set of bins with empty bins
-                new_bins = []
-                largest_bin = bins[-1][0]
-                bin_number = 0
-                while (bin_number-1) * new_binsize < largest_bin:
-                    new_bins.append([bin_number * new_binsize, 0])
-                    bin_number += 1
-                # put the old bins into the new bins
-                new_bin_index = 0
-                for bin in bins:
-                    while bin[0] > new_bins[new_bin_index][0]:
-                        new_bin_index += 1
-                    new_bins[new_bin_index-1][1] += bin[1]
-                bins = new_bins
-
             # chop off the tail (on the left side)
             keep = 0.99
             included = 0
             for index, bin in enumerate(reversed(bins)):
                 included += bin[1]
-                if float(included) / float(total) > keep:
-                    bins = bins[len(bins)-index:]
+                if float(included) / float(histogram.total) > keep:
+                    bins = bins[len(bins)-index-1:]
+                    break
+            return bins
+
+        for event in data:
+
+            filename = self.output_dir + '/graph/' + event.replace('/', '-') + '_histogram.png'
+            title = event + ' Latency Histogram'
+
+            histogram = histogram_from_bins(data[event], significant_digits)
+            total = histogram.total
+
+            # reduce the number of bins to a reasonable number by regrouping them into coarser buckets.  The buckets
+            # of a histogram with fewer significant digits always contain whole buckets of the original histogram.
+            optimal_number = 32
+            for digits in xrange(significant_digits, -1, -1):
+                coarse = Histogram(digits)
+                for index, count in histogram.items():
+                    coarse.record(histogram.median_equivalent_value(index), count)
+                bins = trim(coarse)
+                if len(bins) <= optimal_number:
                     break
 
             xaxis_lables = []
-            for bin, num in bins:
-                xaxis_lables.append(bin)
+            for index, num in bins:
+                # convert lables from seconds to ms
+                xaxis_lables.append(significant_figures(coarse.lowest_equivalent_value(index) * 1000.0, 3))
             yaxis = []
-            for bin, num in bins:
+            for index, num in bins:
                 yaxis.append(num)
 
             # normalize y axis
@@ -504,10 +1111,6 @@ class TBCMaster(object):
             for index in xrange(len(yaxis)):
                 xaxis.append(index)
 
-            # convert lables from seconds to ms
-            for index, value in enumerate(xaxis_lables):
-                xaxis_lables[index] = value * 1000.0
-
             fig = plt.figure()
             fig.suptitle(title)
             ax = fig.add_subplot(111)
@@ -519,4 +1122,3 @@ class TBCMaster(object):
             plt.ylabel('Percentage of operations')
             plt.subplots_adjust(bottom=0.15)
             fig.savefig(filename)
-
@@ -2,10 +2,14 @@ import sys
 import os
 import Queue
 import logging
+import multiprocessing
 
 from TBC.benchmarks.benchmark_locator import *
 from TBC.core.BenchmarkManager import BenchmarkManager
 from TBC.core.LoadingManager import LoadingManager
+from TBC.core.WorkerPool import WorkerPool, BenchmarkReference
+from TBC.core.Phases import scale_rates
+from TBC.utility.Clock import unanchored_now
 from network_cjl.Network import *
 
 
@@ -19,11 +23,22 @@ class TBCSlave(object):
         self.nm.register_listener('stop', self.stop_callback)
         self.nm.register_listener('shutdown', self.shutdown_callback)
         self.nm.register_listener('load', self.load_callback)
+        self.nm.register_listener('ping', self.ping_callback)
 
         self.waiting_calls = Queue.Queue()
-        self.spin_limiter = 0.01
+        # released once for every waiting call.  Unlike the timed waits of the threading module in Python 2, a
+        # multiprocessing semaphore does not poll.
+        self.calls_available = multiprocessing.Semaphore(0)
+        # how often the main thread checks whether the network is still alive while no calls are waiting
+        self.alive_check_period = 1.0
         self.pm = None
         self.state = 'ready'
+
+        # the long lived worker processes, if the config asks for them (see WorkerPool)
+        self.pool = None
+
+        # the (host, port) of the master that started the current benchmark
+        self.master = None
         self.logger = logging.getLogger()
 
         self.debug = debug # fixme: currently ignored
@@ -33,27 +48,76 @@ class TBCSlave(object):
         Send a function here and it will be called on the main thread
         """
         self.waiting_calls.put((function, args, kwargs))
+        self.calls_available.release()
 
     def wait_until_finished(self):
         """
         This function will not return until the TBCSlave is ready to exit
         """
         while self.nm.alive:
-            try:
-                function, args, kwargs = self.waiting_calls.get(block=False)
-                function(*args, **kwargs)
-            except Queue.Empty:
-                time.sleep(self.spin_limiter)
+            if not self.calls_available.acquire(timeout=self.alive_check_period):
+                continue
+            function, args, kwargs = self.waiting_calls.get(block=False)
+            function(*args, **kwargs)
+
+    def ping_callback(self, message, (host, port)):
+        """
+        Expects message.payload to be the time at which the master sent the ping.  Replies with that time and the
+        time of this node so that the master can estimate the offset between the clocks.  The time of this node must
+        not include the offset of an earlier run, otherwise the next estimate would undo it.
+        """
+        response = Message('pong', (message.payload, unanchored_now()))
+        self.nm.send(response, (host, port), timeout=0.1, request_ack=True, max_sequential_failures=10)
 
     def start_callback(self, message, (host, port)):
+        """
+        Expects message.payload to have the form (config, start_time, clock_offset), see BenchmarkManager
+        """
         def start():
             if self.state != 'ready':
                 return
             self.state = 'run'
-            config = message.payload
+            self.master = (host, port)
+            config, start_time, clock_offset = message.payload
             self.logger.info('Executing %s benchmark', config['benchmark'])
-            benchmark = get_benchmark(config['benchmark'], config)
-            self.pm = BenchmarkManager(config['log_framerate'], config['log_latency_bin_size'])
+            pool = self.get_pool(config)
+            if pool is not None:
+                benchmark = BenchmarkReference(config['benchmark'], config)
+            else:
+                benchmark = get_benchmark(config['benchmark'], config)
+
+            # the target rate may be given for the entire cluster, split it between the nodes
+            target_rate = config.get('target_rate', None)
+            phases = config.get('phases', None)
+            if config.get('target_rate_scope', 'cluster') == 'cluster':
+                if target_rate is not None:
+                    target_rate = float(target_rate) / len(config['nodes'])
+                if phases is not None:
+                    phases = scale_rates(phases, 1.0 / len(config['nodes']))
+
+            profile_interval = None
+            if config.get('profile', False):
+                profile_interval = config.get('profile_interval', 0.01)
+
+            self.pm = BenchmarkManager(config['log_framerate'],
+                                       config.get('log_latency_significant_digits', 3),
+                                       config.get('log_report_rate', 4),
+                                       config.get('transport', 'queue'),
+                                       config.get('transport_buffer_size', 65536),
+                                       config.get('compile_tasks', True),
+                                       config.get('clients_per_process', 1),
+                                       config.get('client_mode', 'thread'),
+                                       target_rate,
+                                       config.get('arrival', 'constant'),
+                                       self.send_frames,
+                                       config.get('log_stream_period', 1.0),
+                                       start_time,
+                                       clock_offset,
+                                       phases,
+                                       pool,
+                                       profile_interval,
+                                       config.get('time_client_calls', True),
+                                       config.get('count_results', True))
             self.pm.prepare(benchmark, config['processes_per_node'])
             self.pm.start()
         self.call_on_main_thread(start)
@@ -61,16 +125,26 @@ class TBCSlave(object):
     def stop_callback(self, message, (host, port)):
         if self.state != 'run':
             return
-        self.state = 'ready'
+        self.state = 'stop'
         self.logger.info('Stopping benchmark')
 
         self.pm.close()
 
-        payload = deflate(self.pm.benchmark_log)
+        # everything that was not streamed yet
+        payload = deflate(self.pm.take_final_chunk())
+        self.pm = None
+
+        # the master may start the next run as soon as it has the results
+        self.state = 'ready'
         mess = Message('results', payload)
         self.nm.send(mess, (host, port), timeout=0.1, request_ack=True, max_sequential_failures=100)
 
-        self.pm = None
+    def send_frames(self, chunk):
+        """
+        Send a LogChunk to the master while the benchmark is running
+        """
+        mess = Message('frames', deflate(chunk))
+        self.nm.send(mess, self.master, timeout=0.1, request_ack=True, max_sequential_failures=100)
 
     def load_callback(self, message, (host, port)):
         """
@@ -86,14 +160,31 @@ class TBCSlave(object):
         processes = config['load_processes_per_node']
         load_nodes = config['load_nodes']
 
-        loader = get_benchmark_load(config['benchmark'], config)
-        LoadingManager(loader, processes, node_number, load_nodes).run()
+        pool = self.get_pool(config)
+        if pool is not None:
+            loader = BenchmarkReference(config['benchmark'], config)
+        else:
+            loader = get_benchmark_load(config['benchmark'], config)
+        LoadingManager(loader, processes, node_number, load_nodes, pool).run()
 
         response = Message('finished_loading', None)
         self.nm.send(response, (host, port), request_ack=True, timeout=0.1, max_sequential_failures=100)
         self.logger.info('Finished loading')
         self.state = 'ready'
 
+    def get_pool(self, config):
+        """
+        :return: the WorkerPool, created if the config enables it, or None if the config does not use a pool
+        """
+        if not config.get('worker_pool', False):
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+            return None
+        if self.pool is None:
+            self.pool = WorkerPool()
+        return self.pool
+
     def shutdown_callback(self, message, (host, port)):
         self.logger.info('Shutdown command received')
         self.close()
@@ -101,6 +192,8 @@ class TBCSlave(object):
     def close(self):
         if self.pm is not None:
             self.pm.close(soft=False)
+        if self.pool is not None:
+            self.pool.close()
         self.nm.close()
         os._exit(0) # running on a remote machine, don't take any chance of orphaned threads
 
@@ -1,3 +1,4 @@
+import bisect
 import random
 import inspect
 
@@ -13,9 +14,18 @@ class Task(Tasklet):
 
         self._tasklets = self._gather_tasklets()
         self._next_tasklet = None
+        self._build_weight_table()
+
+    def _build_weight_table(self):
+        """
+        Precompute the cumulative weights of the tasklets so that a weighted choice is a binary search.
+        This must be called again whenever the weight of a tasklet changes.
+        """
+        self._cumulative_weights = []
         self._total_weight = 0
         for tasklet in self._tasklets:
             self._total_weight += tasklet.weight
+            self._cumulative_weights.append(self._total_weight)
 
     def _gather_tasklets(self):
         """
@@ -49,13 +59,20 @@ class Task(Tasklet):
             op = self._next_tasklet
             self._next_tasklet = None
             return op
-        choice = random.uniform(0, self._total_weight)
-        upto = 0.0
-        for op in self._tasklets:
-            if upto + op.weight >= choice:
-                return op
-            else:
-                upto += op.weight
+        if self._total_weight == 0:
+            return self._tasklets[0]
+        # bisect_right never lands on a tasklet with a weight of 0
+        choice = random.random() * self._total_weight
+        return self._tasklets[bisect.bisect_right(self._cumulative_weights, choice)]
+
+    def set_weight(self, name, weight):
+        """
+        Change the weight of one of this Task's tasklets
+        :param name: the name of the tasklet
+        :param weight: the new weight
+        """
+        self._find_tasklet(name).weight = weight
+        self._build_weight_table()
 
     def _full_stop(self):
         """
@@ -1,35 +1,288 @@
+import collections
 import inspect
+import resource
 import sys
+import threading
+import time
 import traceback
 import Queue
 
 from Task import *
 from IProcMessage import IProcMessage
+from StatsAggregator import StatsAggregator
+from TBC.utility.Clock import now
+from Pacer import Pacer
+from Phases import PhaseSchedule
+from Profiler import SamplingProfiler
+from TBC.interfaces.interface_locator import set_call_timer, set_result_counter
 
 class TaskManager(object):
     """
     This class is responsible for running a task
     """
 
-    def __init__(self, in_queue, out_queue, task_class, *args, **kwargs):
+    def __init__(self, in_queue, out_queue, task_class, log_framerate=10, log_latency_significant_digits=3,
+                 report_rate=4, ring=None, compile_tasks=True, clients=1, client_mode='thread',
+                 target_rate=None, arrival='constant', start_time=None, phases=None, profile_interval=None,
+                 time_client_calls=True, count_results=True, *args, **kwargs):
         """
         Start a new task manager
         :param out_queue: a queue for sending statistics back to the ProcessManager
         :param in_queue: a queue for receiving information from the ProcessManager
         :param task_class: a class type that inherits from Task
+        :param log_framerate: the framerate of the BenchmarkManager's log
+        :param log_latency_significant_digits: the significant digits of the BenchmarkManager's latency histograms
+        :param report_rate: the maximum number of times per second that statistics are sent to the ProcessManager
+        :param ring: if not None, a RingBuffer that is used instead of out_queue for sending statistics and
+                        instead of in_queue for receiving the stop signal
+        :param compile_tasks: if True then replace the generic Tasklet._run call chain with specialized functions
+        :param clients: the number of clients (i.e. independent instances of task_class) to run in this process
+        :param client_mode: how multiple clients share the process.  'greenlet' runs each client as a gevent
+                                virtual user, 'thread' runs each client on its own thread (useful for drivers
+                                that release the GIL while waiting on the network).
+        :param target_rate: if not None, the number of operations per second that each client should start
+                                (open-loop load).  Latency is then also measured from each operation's scheduled
+                                start time in order to correct for coordinated omission.
+        :param arrival: the distribution of operation start times when target_rate is set ('constant' or 'poisson')
+        :param start_time: if not None, the time (as returned by Clock.now) at which the clients start running
+        :param phases: if not None, a list of phases (see Phases) with the target rates of this process.  The
+                        clients switch phases at fixed offsets from the start time.
+        :param profile_interval: if not None, the clients are profiled by sampling their stacks this often (in
+                                    seconds), and the samples are sent to the ProcessManager when the task stops
+        :param time_client_calls: if True then the time spent inside of the interfaces that the clients load is
+                                    measured.  It is sent with the statistics (as the 'client' counter) along with the
+                                    CPU time of the process (the 'cpu' counter), so that the overhead of the harness
+                                    can be told apart from the time spent waiting on the database.
+        :param count_results: if True then the rows and bytes of the results that the clients' interfaces read are
+                                sent with the statistics (as the 'rows' and 'bytes' counters)
         """
 
         self.in_queue = in_queue
+        self.start_time = start_time
         self.out_queue = out_queue
 
-        self.task = task_class(self, [])
-        self.task._set_root(self)
+        self.stats = StatsAggregator(log_framerate, log_latency_significant_digits, report_rate)
+
+        if client_mode not in ('greenlet', 'thread'):
+            raise Exception('Unknown client mode ' + str(client_mode))
+        self.client_mode = client_mode
+
+        # each client has its own task tree (and therefore its own connection and latency measurements)
+        self.tasks = []
+        for client in xrange(clients):
+            task = task_class(self, [])
+            task._set_root(self)
+            self.tasks.append(task)
+        self.task = self.tasks[0]
+
+        # events are identified by their position in this list when using the ring buffer
+        self.events = TaskManager.gather_events(self.task)
+        self.event_ids = dict((event, event_id) for event_id, event in enumerate(self.events))
+
+        self.ring = ring
+        if self.ring is not None:
+            self._report = self._report_to_ring
+            self._check_in_queue = self._check_stop_flag
+
+        self.time_client_calls = time_client_calls
+        self.count_results = count_results
+        # (rows, bytes) of every result that was read since the last statistics were sent.  Interfaces that run on
+        # a thread pool append to it from other threads, appending and popping are atomic so no lock is needed.
+        self.result_sizes = collections.deque()
+        # the CPU time of the process when the last statistics were sent
+        self.last_cpu_time = None
+
+        if client_mode == 'thread' and clients > 1:
+            # all threads share a single StatsAggregator (or RingBuffer)
+            lock = threading.Lock()
+            self._report = self._synchronized(self._report, lock)
+            self._add_client_time = self._synchronized(self._add_client_time, lock)
+
+        self.phases = None
+        if phases is not None:
+            if not compile_tasks:
+                raise Exception('phases require compile_tasks')
+            self.phases = PhaseSchedule(phases, clients, target_rate * clients if target_rate is not None else None)
+            if self.phases.is_rate_controlled():
+                # the phases set the rate of each client before its first operation
+                target_rate = self.phases.phases[0]['target_rate']
+
+        if target_rate is not None and (not compile_tasks or self.ring is not None):
+            raise Exception('target_rate requires compile_tasks and the queue transport')
+
+        if compile_tasks:
+            for number, task in enumerate(self.tasks):
+                pacer = None
+                if target_rate is not None:
+                    pacer = Pacer(target_rate, arrival)
+                phase_client = None
+                if self.phases is not None:
+                    phase_client = self.phases.client(number, task, pacer, self.is_alive)
+                self._compile(task, pacer, phase_client)
+
+        self.profiler = None
+        if profile_interval is not None:
+            self.profiler = SamplingProfiler(profile_interval)
 
         self.alive = True
 
+    def _synchronized(self, function, lock):
+        """
+        :param lock: the lock that is held while function is called
+        :return: a version of function that may be called from multiple threads
+        """
+        def synchronized(*args):
+            with lock:
+                return function(*args)
+        return synchronized
+
+    @staticmethod
+    def gather_events(tasklet, events=None):
+        """
+        Find the name of every event that can be reported by a tasklet and its children
+        :return: a list of event names, the ids of events are their positions in this list
+        """
+        if events is None:
+            events = []
+        events.append(tasklet._event)
+        if isinstance(tasklet, Task):
+            for child in tasklet._tasklets:
+                TaskManager.gather_events(child, events)
+        return events
+
+    def _compile(self, tasklet, pacer=None, phase_client=None):
+        """
+        Replace the _run method of a tasklet and all of its children with a function specialized for that tasklet.
+        The specialized function behaves exactly like Tasklet._run but skips on_start and on_end when they are
+        not overridden, and calls the report and queue checking functions of this TaskManager directly instead
+        of going through the tasklet.
+        :param pacer: if not None, a Pacer that schedules the start of each leaf operation
+        :param phase_client: if not None, a PhaseClient that is called before each leaf operation
+        """
+        if isinstance(tasklet, Task):
+            for child in tasklet._tasklets:
+                self._compile(child, pacer, phase_client)
+        elif not tasklet.report_stats:
+            # leaves that do not report stats are rare, leave them on the generic path
+            return
+        tasklet._run = self._build_runner(tasklet, pacer, phase_client)
+
+    def _get_hook(self, tasklet, name):
+        """
+        :return: the bound method called name, or None if it is the no-op inherited from Tasklet
+        """
+        if name not in tasklet.__dict__ and getattr(type(tasklet), name).__func__ is getattr(Tasklet, name).__func__:
+            return None
+        return getattr(tasklet, name)
+
+    def _build_runner(self, tasklet, pacer=None, phase_client=None):
+        """
+        Build the specialized replacement for tasklet._run
+        """
+        on_start = self._get_hook(tasklet, 'on_start')
+        on_end = self._get_hook(tasklet, 'on_end')
+        report = self._report if tasklet.report_stats else None
+        check_in_queue = self._check_in_queue
+        if isinstance(tasklet, Task):
+            # Task._check_in_queue is a no-op, only leaves check the queue
+            check_in_queue = None
+        event = tasklet._event
+        clock = now
+
+        if isinstance(tasklet, Task) and type(tasklet).operation.__func__ is Task.operation.__func__:
+            choose_tasklet = tasklet._choose_tasklet
+
+            def operation():
+                while tasklet._active:
+                    choose_tasklet()._run()
+        else:
+            operation = tasklet.operation
+
+        if pacer is not None and not isinstance(tasklet, Task):
+            # open-loop: wait for the scheduled start, and also measure latency from the scheduled start
+            wait = pacer.wait
+
+            def run():
+                tasklet._active = True
+                tasklet._failed = False
+                if phase_client is not None:
+                    phase_client()
+                intended_time = wait()
+                start_time = clock()
+                if on_start is not None:
+                    on_start()
+                if not tasklet._failed:
+                    operation()
+                if on_end is not None and not tasklet._failed:
+                    on_end()
+                end_time = clock()
+                report(end_time - start_time, tasklet._failed, event, end_time - intended_time, end_time)
+                check_in_queue()
+            return run
+
+        if (on_start is None and on_end is None and report is not None and check_in_queue is not None and
+                phase_client is None):
+            # the common case: a leaf that just performs an operation
+            def run():
+                tasklet._active = True
+                tasklet._failed = False
+                start_time = clock()
+                operation()
+                end_time = clock()
+                report(end_time - start_time, tasklet._failed, event, None, end_time)
+                check_in_queue()
+            return run
+
+        def run():
+            tasklet._active = True
+            tasklet._failed = False
+            if phase_client is not None and not isinstance(tasklet, Task):
+                phase_client()
+            start_time = clock()
+            if on_start is not None:
+                on_start()
+            if not tasklet._failed:
+                operation()
+            if on_end is not None and not tasklet._failed:
+                on_end()
+            if report is not None:
+                end_time = clock()
+                report(end_time - start_time, tasklet._failed, event, None, end_time)
+            if check_in_queue is not None:
+                check_in_queue()
+        return run
+
     def start(self):
         try:
-            self.task._run()
+            if self.start_time is not None and self.start_time > now():
+                time.sleep(self.start_time - now())
+            if self.phases is not None:
+                self.phases.start(self.start_time if self.start_time is not None else now())
+            if self.profiler is not None:
+                self.profiler.start()
+            self.last_cpu_time = self._cpu_time()
+            if self.time_client_calls:
+                set_call_timer(self._add_client_time)
+            if self.count_results:
+                set_result_counter(self.result_sizes.append)
+            try:
+                if len(self.tasks) == 1:
+                    self.task._run()
+                elif self.client_mode == 'thread':
+                    self._run_threads()
+                else:
+                    self._run_greenlets()
+            finally:
+                set_call_timer(None)
+                set_result_counter(None)
+                if self.profiler is not None:
+                    samples = self.profiler.stop()
+                    if self.out_queue is not None:
+                        self.out_queue.put(IProcMessage('profile', samples))
+            self._send_stats()
+            # acknowledge the stop, everything that was measured has been sent
+            if self.out_queue is not None:
+                self.out_queue.put(IProcMessage('stopped', None))
         except Exception as e:
             if self.out_queue is None:
                 raise e
@@ -37,12 +290,103 @@ class TaskManager(object):
                 m = IProcMessage('err', traceback.format_exc())
                 self.out_queue.put(m)
 
-    def _report(self, delta_t, failed, path):
+    def _run_threads(self):
+        """
+        Run each client on its own thread
+        """
+        errors = []
+
+        def run(task):
+            try:
+                task._run()
+            except Exception:
+                errors.append(traceback.format_exc())
+                self.close()
+
+        threads = []
+        for task in self.tasks:
+            thread = threading.Thread(target=run, args=(task,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise Exception('Client thread failed:\n' + errors[0])
+
+    def _run_greenlets(self):
+        """
+        Run each client as a greenlet (a virtual user).  Sockets are monkey patched so that cooperative drivers
+        yield while waiting on the network, calls to other drivers are moved to a thread pool.
+        """
+        import gevent
+        import gevent.monkey
+        import gevent.threadpool
+        from TBC.interfaces.interface_locator import set_offload_threadpool
+
+        # only patch what the drivers need, multiprocessing queues still rely on real threads
+        gevent.monkey.patch_socket()
+        gevent.monkey.patch_select()
+        gevent.monkey.patch_time()
+
+        set_offload_threadpool(gevent.threadpool.ThreadPool(len(self.tasks)))
+        try:
+            greenlets = [gevent.spawn(task._run) for task in self.tasks]
+            gevent.joinall(greenlets, raise_error=True)
+        finally:
+            set_offload_threadpool(None)
+
+    def _report(self, delta_t, failed, event, corrected_t=None, end_time=None):
+        if end_time is None:
+            end_time = now()
+        if end_time >= self.stats.deadline:
+            self._send_stats()
+        self.stats.record(event, delta_t, failed, end_time, corrected_t)
+
+    def _add_client_time(self, seconds):
+        self.stats.add_counter('client', seconds)
+
+    def _cpu_time(self):
+        """
+        :return: the CPU time (user and system) that this process has used, in seconds
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _report_to_ring(self, delta_t, failed, event, corrected_t=None, end_time=None):
+        if end_time is None:
+            end_time = now()
+        self.ring.put(self.event_ids[event], delta_t, end_time, failed)
+
+    def _send_stats(self):
+        """
+        Send the statistics that have been gathered since the last call to the ProcessManager
+        """
+        if self.stats.is_empty():
+            return
+        cpu_time = self._cpu_time()
+        if self.last_cpu_time is not None:
+            self.stats.add_counter('cpu', cpu_time - self.last_cpu_time)
+        self.last_cpu_time = cpu_time
+        if len(self.result_sizes) > 0:
+            rows = 0
+            size = 0
+            while True:
+                try:
+                    result_rows, result_size = self.result_sizes.popleft()
+                except IndexError:
+                    break
+                rows += result_rows
+                size += result_size
+            self.stats.add_counter('rows', rows)
+            self.stats.add_counter('bytes', size)
+        batch = self.stats.flush()
         if self.out_queue is not None:
-            m = IProcMessage('report', (path, delta_t, failed))
+            m = IProcMessage('stats', batch)
             self.out_queue.put(m)
         else:
-            print (path, delta_t, failed)
+            print batch
 
     def handle_message(self, message):
         if message.type == "stop":
@@ -51,10 +395,14 @@ class TaskManager(object):
             m = IProcMessage('err', "TaskManager recieved unknown message type " + message.type)
             self.out_queue.put(m)
 
+    def is_alive(self):
+        return self.alive
+
     def close(self):
         if self.alive:
             self.alive = False
-            self.task._full_stop()
+            for task in self.tasks:
+                task._full_stop()
 
     def _check_in_queue(self):
         if not self.alive:
@@ -65,6 +413,10 @@ class TaskManager(object):
         except Queue.Empty:
             pass
 
+    def _check_stop_flag(self):
+        if self.alive and self.ring.stop_requested():
+            self.close()
+
     def finish(self, depth):
         """
         Don't fail catastrophically, but warn the user that something strange happened.
@@ -1,4 +1,4 @@
-import time
+from TBC.utility.Clock import now
 
 class Tasklet(object):
     """
@@ -16,6 +16,7 @@ class Tasklet(object):
             self.name = self.__class__.__name__
         self._path = path
         self._path.append(self.name)
+        self._event = '/'.join(self._path)
 
         self.client = None
 
@@ -45,9 +46,9 @@ class Tasklet(object):
         """
         This funciton is used to pass statistics about an operation up to the manager
         :param time: the time that it took to perform this operation
-        :param path: the 'path' of the operation, uniquely identifies the operation
+        :param failed: True if the operation failed
         """
-        self._root._report(time, failed, self._path)
+        self._root._report(time, failed, self._event)
 
     def _check_in_queue(self):
         """
@@ -109,13 +110,13 @@ class Tasklet(object):
     def _run(self):
         self._active = True
         self._failed = False
-        start_time = time.time()
+        start_time = now()
         self.on_start()
         if not self._failed:
             self.operation()
         if not self._failed:
             self.on_end()
-        end_time = time.time()
+        end_time = now()
         delta_time = end_time - start_time
         if self.report_stats:
             self._report(delta_time, self._failed)
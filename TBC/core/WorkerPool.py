@@ -0,0 +1,187 @@
+import os
+import multiprocessing
+import traceback
+import Queue
+
+from TBC.core.TaskManager import TaskManager
+from TBC.core.IProcMessage import IProcMessage
+from TBC.core.RingBuffer import RingBuffer
+from TBC.benchmarks.benchmark_locator import get_benchmark, get_benchmark_load
+from TBC.interfaces.interface_locator import set_connection_reuse
+from TBC.utility import Clock
+
+
+class BenchmarkReference(object):
+    """
+    Names a benchmark and its config so that it can be sent to the worker processes of a WorkerPool.  The task
+    classes and load functions of benchmarks are closures that can not be pickled, so every worker builds its own.
+    """
+
+    def __init__(self, benchmark, config):
+        self.benchmark = benchmark
+        self.config = config
+
+    def get_task(self):
+        """
+        :return: the root Task class of the benchmark
+        """
+        return get_benchmark(self.benchmark, self.config)
+
+    def get_load(self):
+        """
+        :return: the load function of the benchmark
+        """
+        return get_benchmark_load(self.benchmark, self.config)
+
+
+class WorkerPool(object):
+    """
+    A set of long lived worker processes that run the TaskManagers and loaders of one node.  Reusing the workers
+    avoids forking new processes for every command, and because the workers reuse the connections of the
+    interfaces that benchmarks close, consecutive runs (e.g. the steps of a sweep) start on warm connections.
+
+    Workers share one out_queue and each has its own in_queue, so a BenchmarkManager can use them exactly like
+    the processes that it would otherwise create.  A worker that does not stop when asked to is terminated, which
+    may leave the shared queue in a broken state, so the entire pool is then replaced.
+    """
+
+    def __init__(self):
+        # (Process, in_queue, RingBuffer or None)
+        self.workers = []
+        self.out_queue = multiprocessing.Queue()
+
+        # the capacity of the RingBuffers of the workers, or None if they have none.  RingBuffers have to exist
+        # before a worker is forked, so changing the capacity replaces the workers.
+        self.ring_capacity = None
+
+        # how often an idle worker checks whether the process that created it still exists
+        self.idle_check_period = 1.0
+        # the longest time that close() waits for the workers to exit
+        self.shutdown_timeout = 2
+
+    def reserve(self, number, ring_capacity=None):
+        """
+        Make sure that the pool has at least number running workers
+        :param number: the number of workers that are needed
+        :param ring_capacity: if not None, the workers need RingBuffers with this capacity
+        :return: a list of (Process, in_queue, RingBuffer) tuples for the first number workers
+        """
+        if ring_capacity is not None and ring_capacity != self.ring_capacity:
+            self.terminate()
+            self.ring_capacity = ring_capacity
+        if any(not proc.is_alive() for proc, in_queue, ring in self.workers):
+            self.terminate()
+        while len(self.workers) < number:
+            self._spawn()
+        return self.workers[:number]
+
+    def _spawn(self):
+        in_queue = multiprocessing.Queue()
+        ring = None
+        if self.ring_capacity is not None:
+            ring = RingBuffer(self.ring_capacity)
+        proc = multiprocessing.Process(target=_work,
+                                       args=(in_queue, self.out_queue, ring, os.getpid(), self.idle_check_period))
+        proc.daemon = True
+        proc.start()
+        self.workers.append((proc, in_queue, ring))
+
+    def run(self, number, task, clock_offset, use_ring, task_manager_args):
+        """
+        Start a TaskManager on each of the first number workers.  The workers must have been reserved.
+        :param task: a BenchmarkReference
+        :param clock_offset: the difference between this node's clock and the master's clock, in seconds
+        :param use_ring: if True then the TaskManagers send their statistics over the workers' RingBuffers
+        :param task_manager_args: a dictionary of keyword arguments for the TaskManagers
+        """
+        message = IProcMessage('run', (task, clock_offset, use_ring, task_manager_args))
+        for proc, in_queue, ring in self.workers[:number]:
+            if ring is not None:
+                ring.clear_stop()
+            in_queue.put(message)
+
+    def load(self, task, number, first_loader_id, total_loaders):
+        """
+        Run the load function of a benchmark on number workers and wait for them to finish
+        :param task: a BenchmarkReference
+        :param first_loader_id: the loader id of the first worker, the other workers have the following ids
+        :param total_loaders: the number of loaders on all nodes
+        """
+        workers = self.reserve(number)
+        for offset, (proc, in_queue, ring) in enumerate(workers):
+            in_queue.put(IProcMessage('load', (task, first_loader_id + offset, total_loaders)))
+
+        finished = 0
+        while finished < number:
+            message = self.out_queue.get()
+            if message.type == 'loaded':
+                finished += 1
+            elif message.type == 'err':
+                self.terminate()
+                raise Exception('Loader failed:\n' + message.payload)
+            # anything else was left over from an earlier run
+
+    def terminate(self):
+        """
+        Kill every worker and start over with an empty pool
+        """
+        for proc, in_queue, ring in self.workers:
+            try:
+                proc.terminate()
+            except:
+                pass
+        self.workers = []
+        self.out_queue = multiprocessing.Queue()
+
+    def close(self):
+        """
+        Ask every worker to close its connections and exit, and kill the ones that do not
+        """
+        message = IProcMessage('shutdown', None)
+        for proc, in_queue, ring in self.workers:
+            in_queue.put(message)
+        for proc, in_queue, ring in self.workers:
+            proc.join(self.shutdown_timeout)
+        self.terminate()
+
+
+def _work(in_queue, out_queue, ring, parent_pid, idle_check_period):
+    """
+    The main loop of a worker process
+    :param parent_pid: the process id of the node, the worker exits if the node goes away
+    """
+    set_connection_reuse(True)
+    try:
+        while True:
+            try:
+                message = in_queue.get(timeout=idle_check_period)
+            except Queue.Empty:
+                if os.getppid() != parent_pid:
+                    break
+                continue
+
+            if message.type == 'run':
+                task, clock_offset, use_ring, task_manager_args = message.payload
+                # align this process with the master's clock, like BenchmarkManager does before forking
+                Clock.anchor(clock_offset)
+                try:
+                    tm = TaskManager(in_queue, out_queue, task.get_task(), ring=ring if use_ring else None,
+                                     **task_manager_args)
+                except Exception:
+                    out_queue.put(IProcMessage('err', traceback.format_exc()))
+                    continue
+                tm.start()
+
+            elif message.type == 'load':
+                task, loader_id, total_loaders = message.payload
+                try:
+                    task.get_load()(loader_id, total_loaders)
+                    out_queue.put(IProcMessage('loaded', None))
+                except Exception:
+                    out_queue.put(IProcMessage('err', traceback.format_exc()))
+
+            elif message.type == 'shutdown':
+                break
+            # a stop that arrives after the TaskManager already finished is ignored
+    finally:
+        set_connection_reuse(False)
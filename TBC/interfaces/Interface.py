@@ -5,6 +5,13 @@ class Interface(object):
     This is how a benchmark interacts with a database
     """
 
+    # True if the interface's driver only blocks inside of python's socket module.  Such drivers cooperate with
+    # greenlets once the socket module is monkey patched, other drivers have their calls moved to a thread pool.
+    cooperative = False
+
+    # if not None, a function that the interface calls with a tuple (rows, bytes) for every result that it reads
+    result_counter = None
+
     def __init__(self):
         pass
 
@@ -0,0 +1,28 @@
+class InterfaceWrapper(object):
+    """
+    Wraps an interface and forwards every attribute to it.  Subclasses change how the methods of the wrapped interface
+    are called by overriding _wrap_method, and attributes that the subclass defines itself are not forwarded.
+    """
+
+    def __init__(self, interface):
+        """
+        :param interface: the Interface to wrap
+        """
+        self.interface = interface
+
+    def __getattr__(self, name):
+        attribute = getattr(self.interface, name)
+        if not callable(attribute):
+            return attribute
+
+        wrapped = self._wrap_method(attribute)
+        # cache the wrapper so that it only needs to be built once
+        setattr(self, name, wrapped)
+        return wrapped
+
+    def _wrap_method(self, method):
+        """
+        :param method: a bound method of the wrapped interface
+        :return: the function that is called in place of method
+        """
+        return method
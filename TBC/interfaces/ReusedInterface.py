@@ -0,0 +1,23 @@
+from TBC.interfaces.InterfaceWrapper import InterfaceWrapper
+
+
+class ReusedInterface(InterfaceWrapper):
+    """
+    Wraps an interface whose connection outlives the benchmark that opened it.  Closing the wrapper does not close
+    the connection, it hands the interface back to a list of idle interfaces so that the next benchmark (or loader)
+    in the same process can use it without connecting again.
+    """
+
+    def __init__(self, interface, idle):
+        """
+        :param interface: the Interface to wrap
+        :param idle: the list that the interface is appended to when it is closed
+        """
+        super(ReusedInterface, self).__init__(interface)
+        self.idle = idle
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.idle.append(self.interface)
@@ -0,0 +1,24 @@
+from TBC.interfaces.InterfaceWrapper import InterfaceWrapper
+
+
+class ThreadOffloadInterface(InterfaceWrapper):
+    """
+    Wraps an interface whose driver blocks the entire process (e.g. a C extension) so that each call is executed
+    on a thread pool.  This allows the interface to be used by greenlet based virtual users without stalling
+    every other virtual user in the process.
+    """
+
+    def __init__(self, interface, threadpool):
+        """
+        :param interface: the Interface to wrap
+        :param threadpool: an object with an apply(function, args, kwargs) method, e.g. a gevent ThreadPool
+        """
+        super(ThreadOffloadInterface, self).__init__(interface)
+        self.threadpool = threadpool
+
+    def _wrap_method(self, method):
+        threadpool = self.threadpool
+
+        def offloaded(*args, **kwargs):
+            return threadpool.apply(method, args, kwargs)
+        return offloaded
@@ -0,0 +1,30 @@
+from TBC.interfaces.InterfaceWrapper import InterfaceWrapper
+from TBC.utility.Clock import now
+
+
+class TimedInterface(InterfaceWrapper):
+    """
+    Wraps an interface so that the time spent inside each of its methods is reported to a timer.  This tells how
+    much of the time of a client is spent waiting on the database and how much is spent in the benchmark and the
+    harness.
+    """
+
+    def __init__(self, interface, timer):
+        """
+        :param interface: the Interface to wrap
+        :param timer: a function that is called with the duration (in seconds) of every method call
+        """
+        super(TimedInterface, self).__init__(interface)
+        self.timer = timer
+
+    def _wrap_method(self, method):
+        timer = self.timer
+        clock = now
+
+        def timed(*args, **kwargs):
+            start_time = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timer(clock() - start_time)
+        return timed
@@ -1,12 +1,88 @@
 from TBC.interfaces.sql_interfaces.MySQLInterface import MySQLInterface
+from TBC.interfaces.sql_interfaces.SQLiteInterface import SQLiteInterface
 from TBC.interfaces.kvs_interfaces.RedisInterface import RedisInterface
+from TBC.interfaces.sql_interfaces.NullSQLInterface import NullSQLInterface
+from TBC.interfaces.kvs_interfaces.NullKVSInterface import NullKVSInterface
+from TBC.interfaces.ThreadOffloadInterface import ThreadOffloadInterface
+from TBC.interfaces.ReusedInterface import ReusedInterface
+from TBC.interfaces.TimedInterface import TimedInterface
 from TBC.utility.yaml_loader import *
 
 _interfaces = {
     'MySQL': MySQLInterface,
-    'redis': RedisInterface
+    'sqlite': SQLiteInterface,
+    'redis': RedisInterface,
+    'null_sql': NullSQLInterface,
+    'null_kvs': NullKVSInterface
 }
 
+# if not None, interfaces that are not cooperative are wrapped in a ThreadOffloadInterface that uses this pool
+_offload_threadpool = None
+
+# if not None, a function that is called with the duration of every call to an interface
+_call_timer = None
+
+# if not None, a function that is called with (rows, bytes) of every result that an interface reads
+_result_counter = None
+
+# if not None, closed interfaces are kept open for reuse.  (interface name, data) -> list of idle interfaces
+_idle_interfaces = None
+
+def set_offload_threadpool(threadpool):
+    """
+    Cause interfaces with blocking drivers to be executed on a thread pool.  Used by greenlet based virtual users.
+    :param threadpool: an object with an apply(function, args, kwargs) method, or None to disable offloading
+    """
+    global _offload_threadpool
+    _offload_threadpool = threadpool
+
+def set_call_timer(timer):
+    """
+    Measure the time that is spent inside of the interfaces that are loaded from now on
+    :param timer: a function that is called with the duration (in seconds) of every method call, or None to stop
+                    measuring
+    """
+    global _call_timer
+    _call_timer = timer
+
+def set_result_counter(counter):
+    """
+    Count the rows and bytes of the results that the interfaces loaded from now on read
+    :param counter: a function that is called with a tuple (rows, bytes) for every result, from whichever thread
+                        ran the query, or None to stop counting
+    """
+    global _result_counter
+    _result_counter = counter
+
+def set_connection_reuse(enabled):
+    """
+    Keep the connections of closed interfaces open and hand them out again when an interface with the same data is
+    loaded.  Used by long lived worker processes that run many benchmarks.
+    :param enabled: True to start reusing connections, False to close every idle connection and stop reusing them
+    """
+    global _idle_interfaces
+    if enabled:
+        if _idle_interfaces is None:
+            _idle_interfaces = {}
+        return
+    if _idle_interfaces is not None:
+        for idle in _idle_interfaces.itervalues():
+            for interface in idle:
+                try:
+                    interface.close()
+                except Exception:
+                    pass
+    _idle_interfaces = None
+
+def _connect(interface_class, data):
+    """
+    :return: a new instance of interface_class, connected on the offload thread pool if there is one so that
+                virtual users can connect in parallel
+    """
+    if _offload_threadpool is not None and not interface_class.cooperative:
+        return _offload_threadpool.apply(load_class_from_data, (interface_class, data))
+    return load_class_from_data(interface_class, data)
+
 def load_interface(interface_name, data):
     """
     Load an interface
@@ -17,4 +93,21 @@ def load_interface(interface_name, data):
     if interface_name not in _interfaces:
         raise Exception('Unknown interface')
 
-    return load_class_from_data(_interfaces[interface_name], data)
\ No newline at end of file
+    interface_class = _interfaces[interface_name]
+    if _idle_interfaces is None:
+        interface = _connect(interface_class, data)
+        interface.result_counter = _result_counter
+    else:
+        idle = _idle_interfaces.setdefault((interface_name, repr(sorted(data.items()))), [])
+        try:
+            interface = idle.pop()
+        except IndexError:
+            interface = _connect(interface_class, data)
+        interface.result_counter = _result_counter
+        interface = ReusedInterface(interface, idle)
+
+    if _offload_threadpool is not None and not interface_class.cooperative:
+        interface = ThreadOffloadInterface(interface, _offload_threadpool)
+    if _call_timer is not None:
+        interface = TimedInterface(interface, _call_timer)
+    return interface
\ No newline at end of file
@@ -0,0 +1,50 @@
+from TBC.interfaces.kvs_interfaces.KVSInterface import KVSInterface
+from TBC.utility.Latency import latency_sampler, inject_latency
+
+class NullKVSInterface(KVSInterface):
+    """
+    A key-value store that does no I/O and keeps nothing.  Every operation only waits for a latency drawn from a
+    configurable distribution, so that the throughput of the harness can be measured without a database and the
+    reported latencies can be compared with the injected ones.
+    """
+
+    cooperative = True
+
+    def __init__(self, latency_distribution='none', latency=0.0, tail_latency=0.0, tail_probability=0.0):
+        """
+        :param latency_distribution: 'none', 'fixed', 'exponential' or 'bimodal'
+        :param latency: the latency of 'fixed', the mean of 'exponential' and the common latency of 'bimodal',
+                            in seconds
+        :param tail_latency: the latency of the tail of 'bimodal', in seconds
+        :param tail_probability: the fraction of 'bimodal' operations that take tail_latency
+        """
+        super(NullKVSInterface, self).__init__()
+        self.latency = latency_sampler(latency_distribution, latency, tail_latency, tail_probability)
+
+    def exists(self, key):
+        inject_latency(self.latency)
+        return False
+
+    def set(self, key, value):
+        inject_latency(self.latency)
+
+    def get(self, key):
+        inject_latency(self.latency)
+        return None
+
+    def rename(self, src, dst):
+        inject_latency(self.latency)
+
+    def multi_get(self, keys):
+        inject_latency(self.latency)
+        return [None] * len(keys)
+
+    def multi_set(self, mapping):
+        inject_latency(self.latency)
+
+    def delete_all(self):
+        pass
+
+    def bulk_load(self, kv_generator):
+        for key, value in kv_generator():
+            pass
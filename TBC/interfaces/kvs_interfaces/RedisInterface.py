@@ -4,6 +4,8 @@ from TBC.interfaces.kvs_interfaces.KVSInterface import KVSInterface
 
 class RedisInterface(KVSInterface):
 
+    cooperative = True
+
     def __init__(self, url, port, database, password, client, debug=False):
         super(RedisInterface, self).__init__()
 
@@ -1,5 +1,6 @@
 #import pymysql
 import MySQLdb
+import MySQLdb.cursors
 
 import tempfile
 import os
@@ -12,30 +13,55 @@ from TBC.types.AST import *
 
 class MySQLInterface(SQLInterface):
 
-    def __init__(self, url, port, user, password, database, debug_queries=False, debug_responses=False):
+    def __init__(self, url, port, user, password, database, debug_queries=False, debug_responses=False,
+                 result_mode='fetch', fetch_size=1000):
+        """
+        :param result_mode: how the rows of selects are read.  'fetch' returns them as a list of tuples.  'stream'
+                            reads them with an unbuffered cursor in batches of fetch_size and drops them, so that
+                            wide scans never have to fit in the client's memory.  'discard' lets the driver read the
+                            entire result without converting any of it into Python values (only its rows are
+                            counted, not its bytes).  'stream' and 'discard' return no rows.
+        :param fetch_size: the number of rows that 'stream' reads at a time
+        """
         super(MySQLInterface, self).__init__()
 
+        if result_mode not in ('fetch', 'stream', 'discard'):
+            raise Exception('Unknown result mode ' + str(result_mode))
+        self.result_mode = result_mode
+        self.fetch_size = fetch_size
+
         # self.db = pymysql.connect(url, user, password, database, port=port, local_infile=True)
         self.db = MySQLdb.connect(url, user, password, database, port=port, local_infile=True)
         self.cursor = self.db.cursor()
+        # the unbuffered cursor of the 'stream' result mode
+        self.stream_cursor = None
 
         self.debug_queries = debug_queries
         self.debug_responses = debug_responses
         self.logger = logging.getLogger()
 
+        # True while a statement with bind placeholders is being built
+        self.parameterized = False
+
     def close(self):
         self.db.close()
 
-    def _execute(self, query):
+    def _execute(self, query, parameters=None, result_mode='fetch'):
         try:
             if self.debug_queries:
                 self.logger.debug(query)
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
-            if self.debug_responses:
-                for result in results:
-                    self.logger.debug(result)
-            return results
+            if result_mode == 'fetch':
+                self.cursor.execute(query, parameters)
+                results = self.cursor.fetchall()
+                if self.debug_responses:
+                    for result in results:
+                        self.logger.debug(result)
+                return results
+            elif result_mode == 'stream':
+                self._stream(query, parameters)
+            else:
+                self._discard(query, parameters)
+            return ()
         except Exception as e:
             error_string = 'Exception while executing query: ' + query + '\n' + str(e)
             if 'Deadlock' in error_string:
@@ -44,6 +70,44 @@ class MySQLInterface(SQLInterface):
                 self.logger.error(error_string)
             raise SQLException(str(e))
 
+    def _read(self, query, parameters=None):
+        """
+        Execute a query that returns rows, read the rows according to the result_mode and count them
+        """
+        results = self._execute(query, parameters, self.result_mode)
+        if self.result_mode == 'fetch':
+            self._count_result(results)
+        return results
+
+    def _stream(self, query, parameters):
+        if self.stream_cursor is None:
+            self.stream_cursor = self.db.cursor(MySQLdb.cursors.SSCursor)
+        self.stream_cursor.execute(query, parameters)
+        # the entire result has to be read before the connection can run another query
+        rows = 0
+        size = 0
+        while True:
+            batch = self.stream_cursor.fetchmany(self.fetch_size)
+            if len(batch) == 0:
+                break
+            rows += len(batch)
+            if self.result_counter is not None:
+                size += result_size(batch)
+        if self.result_counter is not None and rows > 0:
+            self.result_counter((rows, size))
+
+    def _discard(self, query, parameters):
+        if parameters is not None:
+            # bind the parameters the same way that cursors do
+            query = query % dict((key, self.db.literal(value)) for key, value in parameters.iteritems())
+        self.db.query(query)
+        # the rows are stored by the client library, but not converted
+        result = self.db.store_result()
+        if result is not None and self.result_counter is not None:
+            rows = result.num_rows()
+            if rows > 0:
+                self.result_counter((rows, 0))
+
     def stringify_ast(self, ast):
         """
         Recursively convert an abstract syntax tree into a valid MySQL statement
@@ -71,7 +135,13 @@ class MySQLInterface(SQLInterface):
         elif type(ast) is Column:
             return ast.get_table_name() + '.' + ast.name
 
+        elif type(ast) is Parameter:
+            return '%(' + ast.name + ')s'
+
         elif type(ast) is str:
+            if self.parameterized:
+                # the driver formats parameterized queries with the % operator
+                return '\'' + ast.replace('%', '%%') + '\''
             return '\'' + ast + '\''
 
         elif type(ast) is bool:
@@ -136,15 +206,21 @@ class MySQLInterface(SQLInterface):
         self._execute(' '.join(query))
 
     def insert(self, table, values):
+        self._execute(self._insert_query(table, values))
+
+    def _insert_query(self, table, values):
         query = ['INSERT INTO', table.name, 'VALUES (']
         for index, value in enumerate(values):
             query.append(self.stringify_ast(value))
             if index + 1 < len(values):
                 query.append(',')
         query.append(')')
-        self._execute(' '.join(query))
+        return ' '.join(query)
 
     def update(self, table, set_statements, where_statement=None):
+        self._execute(self._update_query(table, set_statements, where_statement))
+
+    def _update_query(self, table, set_statements, where_statement=None):
         query = ['UPDATE', table.name, 'SET']
         for index, set in enumerate(set_statements):
             left = self.stringify_ast(set.left_value)
@@ -154,9 +230,12 @@ class MySQLInterface(SQLInterface):
                 query.append(',')
         if where_statement is not None:
             query += ['WHERE', self.stringify_ast(where_statement)]
-        self._execute(' '.join(query))
+        return ' '.join(query)
 
     def select(self, tables, columns, where_statement=None, order_by=None, distinct=False):
+        return self._read(self._select_query(tables, columns, where_statement, order_by, distinct))
+
+    def _select_query(self, tables, columns, where_statement=None, order_by=None, distinct=False):
         query = ['SELECT']
         if distinct:
             query.append('DISTINCT')
@@ -177,13 +256,31 @@ class MySQLInterface(SQLInterface):
                 query.append(self.stringify_ast(col))
                 if index + 1 < len(order_by):
                     query.append(',')
-        return self._execute(' '.join(query))
+        return ' '.join(query)
 
     def delete_rows(self, table, where_statement=None):
+        self._execute(self._delete_rows_query(table, where_statement))
+
+    def _delete_rows_query(self, table, where_statement=None):
         query = ['DELETE FROM', table.name]
         if where_statement is not None:
             query += ['WHERE', self.stringify_ast(where_statement)]
-        self._execute(' '.join(query))
+        return ' '.join(query)
+
+    def build_statement(self, operation, args):
+        # MySQLdb binds parameters on the client, so a statement is a query string with %(name)s placeholders that
+        # is built once instead of on every execution
+        self.parameterized = True
+        try:
+            query = getattr(self, '_' + operation + '_query')(*args)
+        finally:
+            self.parameterized = False
+        return Statement(operation, query)
+
+    def execute(self, statement, parameters=None):
+        if statement.operation == 'select':
+            return self._read(statement.query, parameters or {})
+        return self._execute(statement.query, parameters or {})
 
     def start_transaction(self):
         self._execute('START TRANSACTION')
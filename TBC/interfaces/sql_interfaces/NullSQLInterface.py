@@ -0,0 +1,71 @@
+from TBC.interfaces.sql_interfaces.SQLInterface import SQLInterface
+from TBC.utility.Latency import latency_sampler, inject_latency
+
+class NullSQLInterface(SQLInterface):
+    """
+    A SQL database that does no I/O and keeps nothing, selects return no rows.  Every query only waits for a latency
+    drawn from a configurable distribution, so that the throughput of the harness can be measured without a database
+    and the reported latencies can be compared with the injected ones.
+    """
+
+    cooperative = True
+
+    def __init__(self, latency_distribution='none', latency=0.0, tail_latency=0.0, tail_probability=0.0):
+        """
+        :param latency_distribution: 'none', 'fixed', 'exponential' or 'bimodal'
+        :param latency: the latency of 'fixed', the mean of 'exponential' and the common latency of 'bimodal',
+                            in seconds
+        :param tail_latency: the latency of the tail of 'bimodal', in seconds
+        :param tail_probability: the fraction of 'bimodal' queries that take tail_latency
+        """
+        super(NullSQLInterface, self).__init__()
+        self.latency = latency_sampler(latency_distribution, latency, tail_latency, tail_probability)
+        self.last_auto_increment_value = 0
+
+    def create_table(self, table):
+        pass
+
+    def drop_table(self, table):
+        pass
+
+    def insert(self, table, values):
+        inject_latency(self.latency)
+        self.last_auto_increment_value += 1
+
+    def update(self, table, set_statements, where_statement=None):
+        inject_latency(self.latency)
+
+    def select(self, tables, columns, where_statement=None, order_by=None, distinct=False):
+        inject_latency(self.latency)
+        return []
+
+    def delete_rows(self, table, where_statement=None):
+        inject_latency(self.latency)
+
+    def start_transaction(self):
+        inject_latency(self.latency)
+
+    def commit_transaction(self):
+        inject_latency(self.latency)
+
+    def abort_transaction(self):
+        inject_latency(self.latency)
+
+    def create_index(self, index_name, table, columns):
+        pass
+
+    def execute(self, statement, parameters=None):
+        # skip binding the parameters, which would add the harness's own overhead
+        inject_latency(self.latency)
+        if statement.operation == 'insert':
+            self.last_auto_increment_value += 1
+        elif statement.operation == 'select':
+            return []
+
+    def get_last_auto_increment_value(self):
+        # like the other SQL interfaces, return the value as a result row
+        return [(self.last_auto_increment_value,)]
+
+    def bulk_load(self, table, row_generator):
+        for row in row_generator():
+            self.last_auto_increment_value += 1
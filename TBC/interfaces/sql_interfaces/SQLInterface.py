@@ -1,12 +1,42 @@
 from TBC.interfaces.Interface import Interface
+from TBC.types.AST import bind_parameters, ast_shape
 
 class SQLException(Exception):
     pass
 
+def result_size(rows):
+    """
+    :param rows: a list of tuples read from a database
+    :return: the approximate number of bytes of the values in rows, strings count their length and other values 8
+    """
+    size = 0
+    for row in rows:
+        for value in row:
+            if type(value) is str or type(value) is unicode:
+                size += len(value)
+            else:
+                size += 8
+    return size
+
+class Statement(object):
+    """
+    A statement that is built once and executed many times with different parameters
+    """
+
+    def __init__(self, operation, query):
+        """
+        :param operation: the name of the SQLInterface method that the statement performs, e.g. 'select'
+        :param query: the statement in whatever form the interface executes it, e.g. a SQL string with placeholders
+        """
+        self.operation = operation
+        self.query = query
+
 class SQLInterface(Interface):
 
     def __init__(self):
         super(SQLInterface, self).__init__()
+        # the shape of a statement's abstract syntax trees -> Statement
+        self.statements = {}
 
     def close(self):
         pass
@@ -97,10 +127,80 @@ class SQLInterface(Interface):
     def get_last_auto_increment_value(self):
         """
         Return the last value that was generatead using auto-increment
-        :return: int
+        :return: the rows of the result, a single row with the value, e.g. [(value,)]
         """
         raise Exception('get_last_auto_increment_value is not implemented')
 
+    def _count_result(self, rows):
+        """
+        Report the number of rows and bytes of a result to the result_counter, if there is one
+        :param rows: a list of tuples
+        """
+        if self.result_counter is not None and len(rows) > 0:
+            self.result_counter((len(rows), result_size(rows)))
+
+    def prepare_select(self, tables, columns, where_statement=None, order_by=None, distinct=False):
+        """
+        Prepare a select statement, see select().  Values that change between executions are given as Parameters.
+        :return: a Statement
+        """
+        return self._prepare('select', (tables, columns, where_statement, order_by, distinct))
+
+    def prepare_insert(self, table, values):
+        """
+        Prepare an insert statement, see insert()
+        :return: a Statement
+        """
+        return self._prepare('insert', (table, values))
+
+    def prepare_update(self, table, set_statements, where_statement=None):
+        """
+        Prepare an update statement, see update()
+        :return: a Statement
+        """
+        return self._prepare('update', (table, set_statements, where_statement))
+
+    def prepare_delete_rows(self, table, where_statement=None):
+        """
+        Prepare a delete statement, see delete_rows()
+        :return: a Statement
+        """
+        return self._prepare('delete_rows', (table, where_statement))
+
+    def _prepare(self, operation, args):
+        """
+        :return: the Statement for operation with args, statements with the same shape are only built once
+        """
+        key = (operation, ast_shape(args))
+        statement = self.statements.get(key)
+        if statement is None:
+            statement = self.build_statement(operation, args)
+            self.statements[key] = statement
+        return statement
+
+    def build_statement(self, operation, args):
+        """
+        Override this function to build statements that execute() can run without walking the abstract syntax
+        trees again, e.g. SQL strings with bind placeholders.  By default the trees are kept and their Parameters are
+        replaced on every execution.
+        :param operation: the name of the method that the statement performs
+        :param args: the arguments of that method, with Parameters
+        :return: a Statement
+        """
+        return Statement(operation, args)
+
+    def execute(self, statement, parameters=None):
+        """
+        Execute a prepared statement
+        :param statement: a Statement returned by one of the prepare functions of this interface
+        :param parameters: a dictionary of the form {parameter name: value}
+        :return: the result of the statement's operation, for selects a list of tuples
+        """
+        args = statement.query
+        if parameters is not None:
+            args = bind_parameters(args, parameters)
+        return getattr(self, statement.operation)(*args)
+
     def bulk_load(self, table, row_generator):
         """
         Implement this function to speed up the initial loading of the database.  If not implemented,
@@ -0,0 +1,313 @@
+import sqlite3
+import logging
+
+from TBC.interfaces.sql_interfaces.SQLInterface import *
+from TBC.types.Column import Column
+from TBC.types.AST import *
+
+
+class SQLiteInterface(SQLInterface):
+    """
+    An embedded SQL database stored in a local file.  It needs no server, so benchmarks (and the Historian) can be
+    loaded, run and analyzed on a single machine.  Every process that opens the same file shares the database, but
+    SQLite only allows one writer at a time: a writer that finds the database locked waits up to timeout seconds
+    before its query fails.
+    """
+
+    def __init__(self, database, timeout=30.0, journal_mode='WAL', transaction_mode='IMMEDIATE', debug_queries=False,
+                 debug_responses=False):
+        """
+        :param database: the path of the database file, it is created if it does not exist
+        :param timeout: how long a query waits for a lock held by another connection, in seconds
+        :param journal_mode: the SQLite journal mode, WAL lets readers run alongside a writer.  None keeps the
+                                journal mode of the file.
+        :param transaction_mode: DEFERRED, IMMEDIATE or EXCLUSIVE.  Deferred transactions only take the write lock
+                                    at their first write, and fail at once if another transaction holds it.
+                                    Immediate transactions wait for the write lock when they start.
+        """
+        super(SQLiteInterface, self).__init__()
+
+        # transactions are started and ended explicitly, so the sqlite3 module must not start its own.  A connection
+        # is only used by one client at a time but may be used from another thread (e.g. by a ThreadOffloadInterface).
+        self.db = sqlite3.connect(database, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.cursor = self.db.cursor()
+        self.in_transaction = False
+        self.transaction_mode = transaction_mode
+
+        self.debug_queries = debug_queries
+        self.debug_responses = debug_responses
+        self.logger = logging.getLogger()
+
+        if journal_mode is not None:
+            self._execute('PRAGMA journal_mode=' + journal_mode)
+
+    def close(self):
+        self.db.close()
+
+    def _execute(self, query, parameters=()):
+        try:
+            if self.debug_queries:
+                self.logger.debug(query)
+            self.cursor.execute(query, parameters)
+            results = self.cursor.fetchall()
+            if self.debug_responses:
+                for result in results:
+                    self.logger.debug(result)
+            return results
+        except Exception as e:
+            error_string = 'Exception while executing query: ' + query + '\n' + str(e)
+            if 'locked' in error_string:
+                self.logger.debug(error_string)
+            else:
+                self.logger.error(error_string)
+            raise SQLException(str(e))
+
+    def stringify_ast(self, ast):
+        """
+        Recursively convert an abstract syntax tree into a valid SQLite expression
+        """
+
+        if type(ast) is UnaryOperation:
+            if ast.operator in ('not'):
+                return ast.operator.upper() + ' (' + self.stringify_ast(ast.value) + ')'
+            elif ast.operator in ('sum', 'count'):
+                return ast.operator.upper() + '(' + self.stringify_ast(ast.value) + ')'
+            else:
+                raise Exception('Unimplemented unary operator ' + str(ast.operator))
+
+        elif type(ast) is BinaryOperation:
+            if ast.operator in ('+', '-', '*', '/', '=', '!=', '>', '<', '>=', '<=', 'and', 'or'):
+                result = ('(', self.stringify_ast(ast.left_value),
+                          ast.operator.upper(), self.stringify_ast(ast.right_value), ')')
+                return ' '.join(result)
+            elif ast.operator == '==':
+                result = ('(', self.stringify_ast(ast.left_value), '=', self.stringify_ast(ast.right_value), ')')
+                return ' '.join(result)
+            else:
+                raise Exception('Unimplemented binary operator ' + str(ast.operator))
+
+        elif type(ast) is Column:
+            return ast.get_table_name() + '.' + self.quote_identifier(ast.name)
+
+        elif type(ast) is Parameter:
+            return ':' + ast.name
+
+        elif type(ast) is str:
+            return '\'' + ast.replace('\'', '\'\'') + '\''
+
+        elif type(ast) is bool:
+            if ast:
+                return '1'
+            else:
+                return '0'
+
+        elif type(ast) in (int, long, float):
+            return str(ast)
+
+        elif ast is None:
+            return 'NULL'
+
+        else:
+            raise Exception('Unknown type ' + str(type(ast)))
+
+    def quote_identifier(self, name):
+        """
+        Quote the name of a column, unlike MySQL SQLite does not accept names such as 50_0th_percentile_latency as
+        they are
+        """
+        return '"' + name + '"'
+
+    def stringify_type(self, type):
+        """
+        Given a DataType object, return a string representation of the appropriate SQLite type
+        :param type: a DataType object
+        :return: a SQLite representation
+        """
+        if type == 'int':
+            return 'INTEGER'
+        elif type == 'float':
+            return 'REAL'
+        elif type == 'bool':
+            return 'BOOLEAN'
+        elif type == 'string':
+            if type.fixed_length:
+                return 'CHAR(' + str(type.length) + ')'
+            else:
+                return 'VARCHAR(' + str(type.length) + ')'
+        else:
+            raise Exception('Unknown type ' + str(type))
+
+    def _auto_increment_columns(self, table):
+        """
+        :return: the positions of the columns of table whose values are generated by the database
+        """
+        return [index for index, column in enumerate(table.columns)
+                if column.type == 'int' and column.type.auto_increment]
+
+    def _auto_increment_row(self, row, auto_increment_columns):
+        """
+        Like MySQL, a value of 0 (or None) for an auto-increment column asks the database to generate the value.
+        SQLite only generates values for NULL.
+        """
+        row = list(row)
+        for index in auto_increment_columns:
+            if row[index] in (0, None):
+                row[index] = None
+        return row
+
+    def create_table(self, table):
+        primary_keys = [column for column in table.columns if column.primary_key]
+        auto_increment = [table.columns[index] for index in self._auto_increment_columns(table)]
+        if len(auto_increment) > 0 and primary_keys != auto_increment:
+            raise Exception('SQLite can only auto-increment a table\'s single primary key column')
+
+        query = ['CREATE TABLE', table.name, '(']
+        for index, column in enumerate(table.columns):
+            query += [self.quote_identifier(column.name), self.stringify_type(column.type)]
+            if column in auto_increment:
+                # an INTEGER PRIMARY KEY column is an alias of the rowid, which SQLite generates
+                query.append('PRIMARY KEY AUTOINCREMENT')
+            if index + 1 < len(table.columns):
+                query.append(',')
+        if len(primary_keys) > 0 and len(auto_increment) == 0:
+            query.append(', PRIMARY KEY (')
+            query.append(' , '.join(self.quote_identifier(column.name) for column in primary_keys))
+            query.append(')')
+        query.append(')')
+
+        self._execute(' '.join(query))
+
+    def drop_table(self, table):
+        query = ['DROP TABLE IF EXISTS', table.name]
+        self._execute(' '.join(query))
+
+    def insert(self, table, values):
+        self._execute(self._insert_query(table, values))
+
+    def _insert_query(self, table, values):
+        auto_increment_columns = self._auto_increment_columns(table)
+        if len(auto_increment_columns) > 0:
+            values = self._auto_increment_row(values, auto_increment_columns)
+        query = ['INSERT INTO', table.name, 'VALUES (']
+        for index, value in enumerate(values):
+            query.append(self.stringify_ast(value))
+            if index + 1 < len(values):
+                query.append(',')
+        query.append(')')
+        return ' '.join(query)
+
+    def update(self, table, set_statements, where_statement=None):
+        self._execute(self._update_query(table, set_statements, where_statement))
+
+    def _update_query(self, table, set_statements, where_statement=None):
+        query = ['UPDATE', table.name, 'SET']
+        for index, set in enumerate(set_statements):
+            # SQLite does not allow the column that is set to be qualified with its table name
+            if type(set.left_value) is Column:
+                left = self.quote_identifier(set.left_value.name)
+            else:
+                left = self.stringify_ast(set.left_value)
+            right = self.stringify_ast(set.right_value)
+            query += [left, '=', right]
+            if index + 1 < len(set_statements):
+                query.append(',')
+        if where_statement is not None:
+            query += ['WHERE', self.stringify_ast(where_statement)]
+        return ' '.join(query)
+
+    def select(self, tables, columns, where_statement=None, order_by=None, distinct=False):
+        results = self._execute(self._select_query(tables, columns, where_statement, order_by, distinct))
+        self._count_result(results)
+        return results
+
+    def _select_query(self, tables, columns, where_statement=None, order_by=None, distinct=False):
+        query = ['SELECT']
+        if distinct:
+            query.append('DISTINCT')
+        for index, column in enumerate(columns):
+            query.append(self.stringify_ast(column))
+            if index + 1 < len(columns):
+                query.append(',')
+        query.append('FROM')
+        for index, table in enumerate(tables):
+            query.append(table.name)
+            if index + 1 < len(tables):
+                query.append(',')
+        if where_statement is not None:
+            query += ['WHERE', self.stringify_ast(where_statement)]
+        if order_by is not None:
+            query.append('ORDER BY')
+            for index, col in enumerate(order_by):
+                query.append(self.stringify_ast(col))
+                if index + 1 < len(order_by):
+                    query.append(',')
+        return ' '.join(query)
+
+    def delete_rows(self, table, where_statement=None):
+        self._execute(self._delete_rows_query(table, where_statement))
+
+    def _delete_rows_query(self, table, where_statement=None):
+        query = ['DELETE FROM', table.name]
+        if where_statement is not None:
+            query += ['WHERE', self.stringify_ast(where_statement)]
+        return ' '.join(query)
+
+    def build_statement(self, operation, args):
+        # a statement is a query string with :name placeholders, which also lets the sqlite3 module reuse the
+        # statements that it compiled before
+        return Statement(operation, getattr(self, '_' + operation + '_query')(*args))
+
+    def execute(self, statement, parameters=None):
+        results = self._execute(statement.query, parameters or {})
+        self._count_result(results)
+        return results
+
+    def start_transaction(self, transaction_mode=None):
+        """
+        :param transaction_mode: overrides the transaction_mode of the interface
+        """
+        # like START TRANSACTION in MySQL, starting a transaction commits the one that is open
+        if self.in_transaction:
+            self.commit_transaction()
+        self._execute('BEGIN ' + (transaction_mode or self.transaction_mode))
+        self.in_transaction = True
+
+    def commit_transaction(self):
+        self.in_transaction = False
+        self._execute('COMMIT')
+
+    def abort_transaction(self):
+        self.in_transaction = False
+        self._execute('ROLLBACK')
+
+    def bulk_load(self, table, row_generator):
+        query = 'INSERT INTO ' + table.name + ' VALUES (' + ', '.join('?' for _ in table.columns) + ')'
+        rows = row_generator()
+        auto_increment_columns = self._auto_increment_columns(table)
+        if len(auto_increment_columns) > 0:
+            rows = (self._auto_increment_row(row, auto_increment_columns) for row in rows)
+
+        # every loader writes to the same file, so wait for the write lock before starting
+        self.start_transaction('IMMEDIATE')
+        try:
+            if self.debug_queries:
+                self.logger.debug(query)
+            self.cursor.executemany(query, rows)
+        except Exception as e:
+            self.abort_transaction()
+            self.logger.error('Exception while executing query: ' + query + '\n' + str(e))
+            raise SQLException(str(e))
+        self.commit_transaction()
+
+    def create_index(self, index_name, table, columns):
+        # index names are per database in SQLite and per table in MySQL, qualify them with the table's name
+        query = ['CREATE INDEX', table.name + '_' + index_name, 'ON', table.name, '(']
+        for index, column in enumerate(columns):
+            query.append(self.quote_identifier(column.name))
+            if index + 1 < len(columns):
+                query.append(',')
+        query.append(')')
+        self._execute(' '.join(query))
+
+    def get_last_auto_increment_value(self):
+        return self._execute('SELECT last_insert_rowid()')
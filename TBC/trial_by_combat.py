@@ -68,6 +68,13 @@ def parse_args():
                              '  Ignored if the created node is a slave node.  Can be used in combination'
                              ' with the --load flag.')
 
+    parser.add_argument('--sweep',
+                        action='store_true',
+                        default=False,
+                        help='Include this flag when creating a master node in order to run a benchmark once for '
+                             'every value in the sweep section of the configuration and report the saturation knee.'
+                             '  Can be used in combination with the --load flag.')
+
     parser.add_argument('--shutdown',
                         action='store_true',
                         default=False,
@@ -221,8 +228,8 @@ def run_master(args):
         for endpoint in args.config['nodes']:
             master.add_endpoint((endpoint['host'], int(endpoint['port'])))
 
-        if not args.load and not args.run and not args.shutdown:
-            print('Don\'t forget to specify --load, --run, --shutdown, or some '
+        if not args.load and not args.run and not args.sweep and not args.shutdown:
+            print('Don\'t forget to specify --load, --run, --sweep, --shutdown, or some '
                   'combination of these commands (or else this command doesn\'t do anything)')
 
         if args.load:
@@ -236,6 +243,12 @@ def run_master(args):
             logger.info('Gathering data')
             master.wait_for_run()
             logger.info('Benchmark finished')
+        if args.sweep:
+            if 'sweep' not in args.config:
+                raise Exception('--sweep requires a sweep section in the configuration.')
+            logger.info('Sweeping %s of benchmark %s', args.config['sweep']['parameter'], args.config['benchmark'])
+            master.sweep()
+            logger.info('Sweep finished')
 
     except:
         tb = traceback.format_exc()
@@ -423,6 +436,7 @@ def run(master=False,
         daemonize=False,
         load=False,
         run=False,
+        sweep=False,
         shutdown=False,
         config=None,
         csv=False,
@@ -450,6 +464,7 @@ def run(master=False,
     args.daemonize = daemonize
     args.load = load
     args.run = run
+    args.sweep = sweep
     args.shutdown = shutdown
     args.config = config
     args.csv = csv
@@ -2,6 +2,9 @@
 Abstract Syntax Tree
 """
 
+from TBC.types.Column import Column
+from TBC.types.Table import Table
+
 class UnaryOperation(object):
     """
     Represents an operation such as (not A)
@@ -36,3 +39,58 @@ class BinaryOperation(object):
 
     def __str__(self):
         return '(' + str(self.left_value) + ' ' + str(self.operator) + ' ' + str(self.right_value) + ')'
+
+class Parameter(object):
+    """
+    A placeholder for a value that is bound each time a prepared statement is executed
+    """
+    def __init__(self, name):
+        """
+        :param name: the key of the value in the parameters that the statement is executed with
+        """
+        self.name = name
+
+    def __str__(self):
+        return ':' + self.name
+
+
+def bind_parameters(ast, parameters):
+    """
+    Replace the Parameters in an abstract syntax tree with their values
+    :param ast: an abstract syntax tree, or a list or tuple of them
+    :param parameters: a dictionary of the form {parameter name: value}
+    :return: a copy of ast without Parameters
+    """
+    if type(ast) is Parameter:
+        return parameters[ast.name]
+    elif type(ast) is UnaryOperation:
+        return UnaryOperation(bind_parameters(ast.value, parameters), ast.operator)
+    elif type(ast) is BinaryOperation:
+        return BinaryOperation(bind_parameters(ast.left_value, parameters),
+                               bind_parameters(ast.right_value, parameters),
+                               ast.operator)
+    elif type(ast) in (list, tuple):
+        return type(ast)(bind_parameters(value, parameters) for value in ast)
+    else:
+        return ast
+
+
+def ast_shape(ast):
+    """
+    :param ast: an abstract syntax tree, or a list or tuple of them
+    :return: a hashable description of ast.  Two trees with the same shape produce the same statement.
+    """
+    if type(ast) is Parameter:
+        return 'parameter', ast.name
+    elif type(ast) is UnaryOperation:
+        return 'unary', ast.operator, ast_shape(ast.value)
+    elif type(ast) is BinaryOperation:
+        return 'binary', ast.operator, ast_shape(ast.left_value), ast_shape(ast.right_value)
+    elif type(ast) in (list, tuple):
+        return tuple(ast_shape(value) for value in ast)
+    elif type(ast) is Table:
+        return 'table', ast.name
+    elif type(ast) is Column:
+        return 'column', ast.get_table_name(), ast.name
+    else:
+        return type(ast).__name__, ast
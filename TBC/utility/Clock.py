@@ -0,0 +1,97 @@
+"""
+A monotonic, high resolution clock.  Latencies are measured as differences of this clock so that they are not
+affected by jumps or slewing of the wall clock.  now() adds an offset to the monotonic clock so that it can also
+be used to place events into log frames that are anchored to the wall clock.
+"""
+
+import ctypes
+import ctypes.util
+import time
+
+
+def _find_monotonic():
+    """
+    :return: the best available monotonic clock function (in seconds) and its name
+    """
+    if hasattr(time, 'perf_counter'):
+        return time.perf_counter, 'perf_counter'
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1')
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time, 'time'
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    clock_monotonic = 1
+    byref = ctypes.byref
+
+    def monotonic():
+        # allocate a new timespec for every call, ctypes releases the GIL so a shared one is not thread safe
+        ts = timespec()
+        clock_gettime(clock_monotonic, byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic, 'clock_gettime'
+
+
+monotonic, clock_name = _find_monotonic()
+
+# the difference between the wall clock and the monotonic clock at the time of the last call to anchor()
+_offset = time.time() - monotonic()
+# the clock_offset of the last call to anchor()
+_clock_offset = 0.0
+
+
+def anchor(clock_offset=0.0):
+    """
+    Re-synchronize now() with the wall clock.  This should be called before starting a benchmark (and before
+    forking worker processes) so that now() agrees with the wall clocks of other nodes.
+    :param clock_offset: the amount by which the wall clock of this node is ahead of the reference clock (e.g. the
+                            clock of the master).  now() is shifted by this amount so that it follows the reference.
+    """
+    global _offset, _clock_offset
+    _offset = time.time() - monotonic() - clock_offset
+    _clock_offset = clock_offset
+
+
+def now():
+    """
+    :return: the monotonic clock, shifted so that it matches the (reference) wall clock as of the last call to
+                anchor()
+    """
+    return monotonic() + _offset
+
+
+def unanchored_now():
+    """
+    :return: the monotonic clock, shifted so that it matches the wall clock of this node.  Unlike now() this is not
+                affected by the clock_offset that was passed to anchor(), which makes it the clock to compare with
+                other nodes when estimating offsets.
+    """
+    return monotonic() + _offset + _clock_offset
+
+
+def calibrate(samples=10000):
+    """
+    Measure the cost and the resolution of now(), which is the clock that latencies are measured with.  The offset
+    makes its readings epoch sized floats, so its resolution is coarser than that of the monotonic clock.
+    :param samples: the number of times to read the clock
+    :return: a tuple (overhead, resolution) where overhead is the average time that it takes to read the clock and
+                resolution is the smallest observed non-zero difference between consecutive readings (both in seconds)
+    """
+    resolution = float('inf')
+    start = now()
+    previous = start
+    for sample in xrange(samples):
+        current = now()
+        if current != previous:
+            resolution = min(resolution, current - previous)
+        previous = current
+    overhead = (previous - start) / samples
+    if resolution == float('inf'):
+        resolution = 0.0
+    return overhead, resolution
@@ -0,0 +1,201 @@
+"""
+A log-linear (HDR style) latency histogram.  Values are recorded into buckets whose width grows with the magnitude of
+the value so that every value is stored with a fixed number of significant decimal digits.  With the default settings
+a histogram covers 1 microsecond to one hour in about 23000 counters, and two histograms with the same settings can be
+merged by adding their counters.
+
+A histogram is identified by the significant digits it was created with, so the index of a bucket can be computed by
+anyone who knows them.  This makes it possible to send and store a histogram as a sparse {index: count} dictionary.
+"""
+
+import math
+from array import array
+
+# the smallest value that can be distinguished, in seconds
+DEFAULT_UNIT = 0.000001
+
+# the largest value that can be recorded, in seconds.  Larger values are recorded in the last bucket.
+DEFAULT_HIGHEST_VALUE = 3600.0
+
+
+class Histogram(object):
+
+    def __init__(self, significant_digits=3, unit=DEFAULT_UNIT, highest_value=DEFAULT_HIGHEST_VALUE):
+        """
+        :param significant_digits: the number of significant decimal digits kept for each value (0 to 4)
+        :param unit: the smallest value that can be distinguished, in seconds
+        :param highest_value: the largest value that can be recorded, in seconds
+        """
+        if significant_digits < 0 or significant_digits > 4:
+            raise Exception('significant_digits must be between 0 and 4, got ' + str(significant_digits))
+        self.significant_digits = significant_digits
+        self.unit = unit
+        self.highest_value = highest_value
+
+        # each power of two is split into sub_bucket_half_count linear sub buckets
+        self.sub_bucket_bits = int(math.ceil(math.log(2 * 10 ** significant_digits, 2)))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half_count = self.sub_bucket_count >> 1
+
+        self.length = self._index_of_units(int(highest_value / unit)) + 1
+        self.counts = array('L', [0]) * self.length
+        self.total = 0
+
+    def _index_of_units(self, units):
+        if units < self.sub_bucket_count:
+            return max(0, units)
+        shift = units.bit_length() - self.sub_bucket_bits
+        return shift * self.sub_bucket_half_count + (units >> shift)
+
+    def index_of(self, value):
+        """
+        :param value: a value in seconds
+        :return: the index of the bucket that the value is recorded in
+        """
+        return min(self._index_of_units(int(value / self.unit)), self.length - 1)
+
+    def _bucket_bounds(self, index):
+        """
+        :return: a tuple (lowest, width) describing the bucket in units
+        """
+        shift = max(0, index // self.sub_bucket_half_count - 1)
+        sub_bucket = index - shift * self.sub_bucket_half_count
+        return sub_bucket << shift, 1 << shift
+
+    def lowest_equivalent_value(self, index):
+        """
+        :return: the smallest value (in seconds) that is recorded in the bucket
+        """
+        lowest, width = self._bucket_bounds(index)
+        return lowest * self.unit
+
+    def highest_equivalent_value(self, index):
+        """
+        :return: the largest value (in seconds) that is recorded in the bucket
+        """
+        lowest, width = self._bucket_bounds(index)
+        return (lowest + width) * self.unit
+
+    def median_equivalent_value(self, index):
+        """
+        :return: the value (in seconds) in the middle of the bucket
+        """
+        lowest, width = self._bucket_bounds(index)
+        return (lowest + width / 2.0) * self.unit
+
+    def record(self, value, count=1):
+        """
+        :param value: a value in seconds
+        :param count: the number of times the value was observed
+        """
+        self.counts[self.index_of(value)] += count
+        self.total += count
+
+    def add_bins(self, bins):
+        """
+        Add a sparse histogram that was created with the same settings
+        :param bins: a dictionary of the form {index: count}
+        """
+        counts = self.counts
+        for index in bins:
+            counts[min(index, self.length - 1)] += bins[index]
+            self.total += bins[index]
+
+    def add(self, other):
+        """
+        Add every value of another histogram that was created with the same settings
+        """
+        if other.length != self.length:
+            raise Exception('Can not add histograms with different settings')
+        counts = self.counts
+        for index, count in other.items():
+            counts[index] += count
+        self.total += other.total
+
+    def items(self):
+        """
+        :return: a list of (index, count) tuples for every non-empty bucket, ordered by index
+        """
+        return [(index, count) for index, count in enumerate(self.counts) if count != 0]
+
+    def to_bins(self):
+        """
+        :return: the histogram as a sparse dictionary of the form {index: count}
+        """
+        return dict(self.items())
+
+    def value_at_percentile(self, percentile):
+        """
+        :param percentile: a number between 0 and 1
+        :return: the largest value (in seconds) that is equivalent to the value at the percentile, or None if
+                    the histogram is empty
+        """
+        if self.total == 0:
+            return None
+        target = max(1, int(math.ceil(percentile * self.total)))
+        observed = 0
+        for index, count in self.items():
+            observed += count
+            if observed >= target:
+                return self.highest_equivalent_value(index)
+        return self.highest_equivalent_value(self.length - 1)
+
+    def percentiles_of_bins(self, bins, percentiles):
+        """
+        Compute percentiles of a sparse histogram that was created with the same settings without adding it
+        :param bins: a dictionary of the form {index: count}
+        :param percentiles: a list of numbers between 0 and 1, in ascending order
+        :return: a list with the largest value (in seconds) that is equivalent to each percentile, or a list of
+                    None if the histogram is empty
+        """
+        total = sum(bins.itervalues())
+        if total == 0:
+            return [None] * len(percentiles)
+        results = []
+        indexes = sorted(bins)
+        position = 0
+        observed = bins[indexes[0]]
+        for percentile in percentiles:
+            target = max(1, int(math.ceil(percentile * total)))
+            while observed < target and position < len(indexes) - 1:
+                position += 1
+                observed += bins[indexes[position]]
+            results.append(self.highest_equivalent_value(min(indexes[position], self.length - 1)))
+        return results
+
+    def mean(self):
+        """
+        :return: the mean of all recorded values (in seconds), or None if the histogram is empty
+        """
+        if self.total == 0:
+            return None
+        total_value = 0.0
+        for index, count in self.items():
+            total_value += self.median_equivalent_value(index) * count
+        return total_value / self.total
+
+
+# significant digits -> an empty Histogram
+_shared_histograms = {}
+
+
+def shared_histogram(significant_digits):
+    """
+    :param significant_digits: the significant digits of the histogram
+    :return: an empty Histogram that may only be used for converting between values and indexes, it must not be
+                modified.  The Histogram is shared to avoid allocating counters.
+    """
+    if significant_digits not in _shared_histograms:
+        _shared_histograms[significant_digits] = Histogram(significant_digits)
+    return _shared_histograms[significant_digits]
+
+
+def histogram_from_bins(bins, significant_digits):
+    """
+    :param bins: a dictionary of the form {index: count}
+    :param significant_digits: the significant digits of the histogram that the bins were taken from
+    :return: a Histogram
+    """
+    histogram = Histogram(significant_digits)
+    histogram.add_bins(bins)
+    return histogram
@@ -0,0 +1,40 @@
+import random
+import time
+
+
+def latency_sampler(distribution='none', latency=0.0, tail_latency=0.0, tail_probability=0.0):
+    """
+    Build a function that draws latencies from a distribution
+    :param distribution: 'none', 'fixed', 'exponential' or 'bimodal'
+    :param latency: the latency of 'fixed', the mean of 'exponential' and the common latency of 'bimodal', in seconds
+    :param tail_latency: the latency of the tail of 'bimodal', in seconds
+    :param tail_probability: the fraction of 'bimodal' latencies that are tail_latency
+    :return: a function that returns a latency in seconds, or None if the distribution is 'none'
+    """
+    if distribution == 'none':
+        return None
+    if latency < 0 or tail_latency < 0:
+        raise Exception('Latencies can not be negative')
+
+    if distribution == 'fixed':
+        return lambda: latency
+    elif distribution == 'exponential':
+        if latency == 0:
+            return lambda: 0.0
+        rate = 1.0 / latency
+        return lambda: random.expovariate(rate)
+    elif distribution == 'bimodal':
+        if not 0 <= tail_probability <= 1:
+            raise Exception('tail_probability must be between 0 and 1')
+        return lambda: tail_latency if random.random() < tail_probability else latency
+    raise Exception('Unknown latency distribution ' + str(distribution))
+
+
+def inject_latency(sampler):
+    """
+    Sleep for a latency that is drawn with sampler.  The sleep cooperates with greenlets once the time module is
+    monkey patched.
+    :param sampler: a function made by latency_sampler, or None to return immediately
+    """
+    if sampler is not None:
+        time.sleep(sampler())
@@ -0,0 +1,72 @@
+"""
+Statistics for finding the steady state of a benchmark in a series of per frame measurements (e.g. throughput or
+mean latency).  The end of the warm-up is found with MSER-5 (the marginal standard error rule applied to batches of
+5 frames), and the precision of the steady state is estimated with a batch means confidence interval.
+"""
+
+import math
+import numpy
+
+# the 97.5th percentile of Student's t distribution by degrees of freedom, used for 95% confidence intervals
+_T_975 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+          2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+          2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+_Z_975 = 1.960
+
+
+def mser_truncation(series, batch_size=5):
+    """
+    Find the end of the warm-up period of a series with the MSER rule.  The series is split into batches and the
+    number of leading batches d is chosen that minimizes the squared standard error of the mean of the remaining
+    batches, sum((Y_i - mean)^2) / (n - d)^2.  At most half of the series is truncated.
+    :param series: a sequence of numbers, e.g. the throughput of every frame
+    :param batch_size: the number of values averaged into every batch
+    :return: the number of values at the front of the series that belong to the warm-up
+    """
+    series = numpy.asarray(series, dtype=numpy.float64)
+    batches = len(series) // batch_size
+    if batches < 4:
+        return 0
+    means = series[:batches * batch_size].reshape(batches, batch_size).mean(axis=1)
+
+    # the sum and the sum of squares of the batch means that remain after truncating d batches, for every d
+    remaining = numpy.arange(batches, 0, -1, dtype=numpy.float64)
+    sums = numpy.cumsum(means[::-1])[::-1]
+    squares = numpy.cumsum((means ** 2)[::-1])[::-1]
+    errors = (squares - sums ** 2 / remaining) / remaining ** 2
+
+    truncated = int(numpy.argmin(errors[:batches // 2 + 1]))
+    return truncated * batch_size
+
+
+def batch_means_interval(series, batches=20):
+    """
+    Estimate a 95% confidence interval of the mean of a series whose values may be correlated (such as consecutive
+    frames) by splitting it into batches and treating the batch means as independent samples
+    :param series: a sequence of numbers
+    :param batches: the number of batches, fewer are used if the series is shorter than this
+    :return: a tuple (mean, half width of the confidence interval).  The half width is infinite if the series has
+                fewer than 2 values.
+    """
+    series = numpy.asarray(series, dtype=numpy.float64)
+    batches = min(batches, len(series))
+    if batches < 2:
+        return (float(series.mean()) if len(series) > 0 else float('nan')), float('inf')
+    size = len(series) // batches
+
+    # drop the oldest values that do not fill a batch
+    means = series[len(series) - batches * size:].reshape(batches, size).mean(axis=1)
+    degrees = batches - 1
+    t = _T_975[degrees] if degrees < len(_T_975) else _Z_975
+    return float(means.mean()), t * float(means.std(ddof=1)) / math.sqrt(batches)
+
+
+def relative_precision(series, batches=20):
+    """
+    :return: the half width of the 95% confidence interval of the mean of the series relative to the mean, or
+                infinity if the mean is 0
+    """
+    mean, half_width = batch_means_interval(series, batches)
+    if mean == 0 or math.isnan(mean):
+        return float('inf')
+    return half_width / abs(mean)
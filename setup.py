@@ -26,6 +26,7 @@ setup(
     description='A database benchmarking utility.',
     install_requires=[
         'matplotlib',
+        'numpy',
         'MYSQL-python',
         'PyYAML',
         'redis',